@@ -1,44 +1,889 @@
 #!/usr/bin/env python3
 """Clean up unused Python virtual environments in a directory.
 
-This script recursively deletes all virtualenv directories inside a target
-directory, except the one that is currently active (pointed to by a symlink).
+This script recursively deletes all virtualenv directories inside target
+directories, except the one that is currently active (pointed to by a symlink).
 """
 
 import argparse
+import concurrent.futures
+import dataclasses
+import errno
+import fcntl
+import glob
+import hashlib
+import io
+import json
+import os
 import pathlib
+import script_utils
 import shutil
+import stat
+import subprocess
 import sys
+import tempfile
+import time
+from collections import abc
+from typing import cast, TextIO, TypedDict
+
+# Default number of directories to delete at once.
+DEFAULT_JOBS = os.cpu_count() or 1
+# Flags for opening a directory to delete its contents, without following
+# symlinks so nothing outside the directory is deleted.
+DIRECTORY_FLAGS = os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW
+# The size of the blocks counted by st_blocks.
+BLOCK_SIZE = 512
+# The directory in the virtualenv directory that stale venvs are moved to, to be
+# deleted in the background.
+TRASH_DIR_NAME = ".trash"
+# The file in the virtualenv directory that caches the size of each venv.
+SIZE_CACHE_NAME = ".sizes.json"
+# The directory in the virtualenv directory that holds one hard link to each
+# distinct file shared between venvs by --dedupe.
+STORE_DIR_NAME = ".store"
+# The file in the virtualenv directory that caches the hash of each file.
+HASH_CACHE_NAME = ".hashes.json"
+# The permissions for cache files.
+CACHE_MODE = 0o644
+# The virtualenv directory cleaned up if none are given.
+DEFAULT_DIRECTORY = "~/tmp/bin/virtualenv/"
+# Multipliers for the suffixes of sizes, e.g. 2G.
+SIZE_SUFFIXES = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
 
 
 class Args(argparse.Namespace):
     """Namespace for command-line arguments."""
 
-    directory: str
+    directories: list[str]
     dry_run: bool
     verbose: bool
     symlink_name: str
+    jobs: int
+    background: bool
+    empty_trash: str | None
+    keep: int | None
+    quota: int | None
+    report: bool
+    dedupe: bool
 
     def __init__(
         self,
-        directory: str = "~/tmp/bin/virtualenv/",
+        directories: list[str] | None = None,
         dry_run: bool = False,
         verbose: bool = False,
         symlink_name: str = "Python",
+        jobs: int = DEFAULT_JOBS,
+        background: bool = False,
+        empty_trash: str | None = None,
+        keep: int | None = None,
+        quota: int | None = None,
+        report: bool = False,
+        dedupe: bool = False,
     ) -> None:
         """Initialize the command line arguments.
 
         Args:
-            directory: The virtualenv directory to clean up.
+            directories: The virtualenv directories to clean up, or globs
+                matching them.
             dry_run: If True, only log the directories that would be deleted.
             verbose: If True, print detailed log messages.
             symlink_name: The name of the symlink pointing to the active venv.
+            jobs: The number of directories to delete at once.
+            background: If True, move stale venvs to the trash directory and
+                delete them in a background process.
+            empty_trash: If set, delete everything in this trash directory
+                instead of cleaning up venvs.
+            keep: Keep up to this many of the most recent inactive venvs.
+            quota: Keep the most recent inactive venvs while all venvs use at
+                most this many bytes.
+            report: If True, print the space used by each venv.
+            dedupe: If True, hard link identical files in the venvs that are
+                kept.
         """
         super().__init__()
-        self.directory = directory
+        self.directories = (
+            list(directories) if directories is not None else [DEFAULT_DIRECTORY]
+        )
         self.dry_run = dry_run
         self.verbose = verbose
         self.symlink_name = symlink_name
+        self.jobs = jobs
+        self.background = background
+        self.empty_trash = empty_trash
+        self.keep = keep
+        self.quota = quota
+        self.report = report
+        self.dedupe = dedupe
+
+
+class SizeCacheEntry(TypedDict):
+    """The cached size of a venv.
+
+    Attributes:
+        key: The key from usage_key when the venv was measured.
+        size: The space used by the venv, in bytes.
+        inodes: The number of inodes used by the venv.
+    """
+
+    key: list[int]
+    size: int
+    inodes: int
+
+
+@dataclasses.dataclass
+class DiskUsage:
+    """Disk space used by files, or reclaimed by deleting them.
+
+    Attributes:
+        size: The space used or freed, in bytes.
+        inodes: The number of inodes used or freed.
+    """
+
+    size: int = 0
+    inodes: int = 0
+
+    def count(self, st: os.stat_result) -> None:
+        """Counts a file, if deleting it frees the file's inode.
+
+        Files with other hard links are not freed, so they are not counted.
+
+        Args:
+            st: The status of the file, from before it was deleted.
+        """
+        if stat.S_ISDIR(st.st_mode) or st.st_nlink <= 1:
+            self.size += st.st_blocks * BLOCK_SIZE
+            self.inodes += 1
+
+    def add(self, other: "DiskUsage") -> None:
+        """Adds the space reclaimed elsewhere.
+
+        Args:
+            other: The space to add.
+        """
+        self.size += other.size
+        self.inodes += other.inodes
+
+
+def format_size(size: float) -> str:
+    """Formats a number of bytes for people to read.
+
+    Args:
+        size: The number of bytes.
+
+    Returns:
+        The size with a binary unit, e.g. '1.5 MiB'.
+    """
+    for unit in ["B", "KiB", "MiB", "GiB"]:
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TiB"
+
+
+class PathResolver:
+    """Resolves symlinks in paths, caching every path resolved along the way.
+
+    Sweeping many virtualenv directories resolves many paths with the same
+    parent directories and symlinks, and each of those is only looked up once.
+    A resolver can be shared by threads; at worst, two threads both look up
+    the same path.
+
+    Attributes:
+        resolved: The resolved form of absolute paths.
+    """
+
+    def __init__(self) -> None:
+        """Initializes an empty cache."""
+        self.resolved: dict[pathlib.Path, pathlib.Path] = {}
+
+    def resolve(self, path: pathlib.Path) -> pathlib.Path:
+        """Resolves a path like pathlib.Path.resolve(strict=True).
+
+        Args:
+            path: The path to resolve.
+
+        Returns:
+            The absolute path without symlinks.
+
+        Raises:
+            FileNotFoundError: If the path or a symlink target doesn't exist.
+            OSError: If symlinks loop.
+        """
+        return self.resolve_absolute(path.absolute(), frozenset())
+
+    def resolve_absolute(
+        self, path: pathlib.Path, following: frozenset[pathlib.Path]
+    ) -> pathlib.Path:
+        """Resolves an absolute path, one component at a time.
+
+        Args:
+            path: The absolute path to resolve, which may contain '..'.
+            following: The symlinks being followed, to detect loops.
+
+        Returns:
+            The absolute path without symlinks.
+
+        Raises:
+            FileNotFoundError: If the path or a symlink target doesn't exist.
+            OSError: If symlinks loop.
+        """
+        if path in self.resolved:
+            return self.resolved[path]
+        if path == path.parent:
+            return path
+        parent = self.resolve_absolute(path.parent, following)
+        if path.name == "..":
+            result = parent.parent
+        else:
+            candidate = parent / path.name
+            if not stat.S_ISLNK(candidate.lstat().st_mode):
+                result = candidate
+            elif candidate in following:
+                raise OSError(errno.ELOOP, os.strerror(errno.ELOOP), str(candidate))
+            else:
+                target = parent / os.readlink(candidate)
+                result = self.resolve_absolute(target, following | {candidate})
+        self.resolved[path] = result
+        return result
+
+
+def parse_size(text: str) -> int:
+    """Parses a size, e.g. 500M or 2G.
+
+    Args:
+        text: The size, in bytes with an optional K, M, G, or T suffix.
+
+    Returns:
+        The size in bytes.
+
+    Raises:
+        ValueError: If text is not a valid size.
+    """
+    number = text.strip().upper().removesuffix("B").removesuffix("I")
+    suffix = number[-1:] if number[-1:] in SIZE_SUFFIXES else ""
+    return int(float(number.removesuffix(suffix)) * SIZE_SUFFIXES[suffix])
+
+
+def measure_contents(dir_fd: int, usage: DiskUsage) -> None:
+    """Measures the space used by everything in a directory.
+
+    Args:
+        dir_fd: A file descriptor for the directory.
+        usage: Updated with the space used.
+    """
+    with os.scandir(dir_fd) as it:
+        for entry in it:
+            usage.count(entry.stat(follow_symlinks=False))
+            if entry.is_dir(follow_symlinks=False):
+                child_fd = os.open(entry.name, DIRECTORY_FLAGS, dir_fd=dir_fd)
+                try:
+                    measure_contents(child_fd, usage)
+                finally:
+                    os.close(child_fd)
+
+
+def measure_tree(path: pathlib.Path) -> DiskUsage:
+    """Measures the space that deleting a directory would reclaim.
+
+    Args:
+        path: The directory to measure.
+
+    Returns:
+        The space used by the directory and everything in it.
+    """
+    usage = DiskUsage()
+    usage.count(path.lstat())
+    dir_fd = os.open(path, DIRECTORY_FLAGS)
+    try:
+        measure_contents(dir_fd, usage)
+    finally:
+        os.close(dir_fd)
+    return usage
+
+
+def usage_key(path: pathlib.Path) -> list[int]:
+    """Builds the key that a venv's cached size is valid for.
+
+    Installing or removing packages changes the modification time of
+    site-packages, and recreating the venv changes its inode.
+
+    Args:
+        path: The venv.
+
+    Returns:
+        The inode and modification time of the venv and its site-packages.
+    """
+    key: list[int] = []
+    for directory in [path, *sorted(path.glob("lib/*/site-packages"))]:
+        st = directory.stat()
+        key.extend([st.st_ino, st.st_mtime_ns])
+    return key
+
+
+def read_size_cache(cache_path: pathlib.Path) -> dict[str, SizeCacheEntry]:
+    """Reads the cached sizes of venvs.
+
+    Args:
+        cache_path: The cache file.
+
+    Returns:
+        The cached size of each venv, keyed by name; empty if the cache file
+        doesn't exist or is corrupt.
+    """
+    try:
+        cache = cast(object, json.loads(cache_path.read_text(encoding="utf-8")))
+    except (OSError, ValueError):
+        return {}
+    return cast(dict[str, SizeCacheEntry], cache) if isinstance(cache, dict) else {}
+
+
+def write_cache(cache_path: pathlib.Path, cache: abc.Mapping[str, object]) -> None:
+    """Atomically writes a cache file.
+
+    Failing to write the cache is not an error, because whatever is cached
+    will simply be calculated again next time.
+
+    Args:
+        cache_path: The cache file.
+        cache: The cached values.
+    """
+    try:
+        script_utils.write_atomically(
+            cache_path, json.dumps(cache, sort_keys=True), CACHE_MODE
+        )
+    except OSError:
+        pass
+
+
+def measure_venvs(
+    paths: list[pathlib.Path],
+    cache_path: pathlib.Path,
+    jobs: int,
+    dry_run: bool = False,
+) -> dict[pathlib.Path, DiskUsage]:
+    """Measures the space used by venvs in parallel, reusing cached sizes.
+
+    Args:
+        paths: The venvs, which must all be in the same directory.
+        cache_path: The file caching the sizes of venvs in that directory; it
+            is rewritten with the sizes of the venvs in paths.
+        jobs: The number of venvs to measure at once.
+        dry_run: If True, do not rewrite the cache.
+
+    Returns:
+        The space used by each venv.
+    """
+    cache = read_size_cache(cache_path)
+    keys = {path: usage_key(path) for path in paths}
+    usage: dict[pathlib.Path, DiskUsage] = {}
+    for path in paths:
+        try:
+            entry = cache[path.name]
+            if entry["key"] == keys[path]:
+                usage[path] = DiskUsage(size=entry["size"], inodes=entry["inodes"])
+        except (KeyError, TypeError):
+            pass
+    to_measure = [path for path in paths if path not in usage]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        usage.update(zip(to_measure, executor.map(measure_tree, to_measure)))
+    if dry_run:
+        return usage
+    write_cache(
+        cache_path,
+        {
+            path.name: {"key": keys[path], "size": u.size, "inodes": u.inodes}
+            for path, u in usage.items()
+        },
+    )
+    return usage
+
+
+def retained_venvs(
+    stale: list[pathlib.Path],
+    usage: dict[pathlib.Path, DiskUsage],
+    *,
+    keep: int | None,
+    quota: int | None,
+    used: int,
+) -> list[pathlib.Path]:
+    """Chooses the most recently modified stale venvs to keep for rollback.
+
+    Venvs are kept, most recent first, until keeping another would exceed
+    either limit.
+
+    Args:
+        stale: The venvs that are not active.
+        usage: The space used by each venv; only needed with a quota.
+        keep: The maximum number of stale venvs to keep, or None for no limit.
+        quota: The maximum space for all venvs in bytes, or None for no limit.
+        used: The space used by the active venv.
+
+    Returns:
+        The venvs to keep; none if there are no limits.
+    """
+    if keep is None and quota is None:
+        return []
+    kept: list[pathlib.Path] = []
+    mtimes = {path: path.lstat().st_mtime for path in stale}
+    for path in sorted(stale, key=lambda p: (mtimes[p], p.name), reverse=True):
+        if keep is not None and len(kept) >= keep:
+            break
+        if quota is not None:
+            used += usage[path].size
+            if used > quota:
+                break
+        kept.append(path)
+    return kept
+
+
+def print_usage_report(
+    usage: dict[pathlib.Path, DiskUsage],
+    statuses: dict[pathlib.Path, str],
+    file: TextIO | None = None,
+) -> None:
+    """Prints the space used by each venv, largest first.
+
+    Args:
+        usage: The space used by each venv.
+        statuses: What is happening to each venv, e.g. 'delete'.
+        file: Where to print the report; defaults to stdout.
+    """
+    total = DiskUsage()
+    for path, u in sorted(usage.items(), key=lambda item: (-item[1].size, item[0])):
+        print(
+            f"{format_size(u.size):>10} {u.inodes:>9} inodes  "
+            + f"{statuses[path]:<6}  {path}",
+            file=file,
+        )
+        total.add(u)
+    print(f"{format_size(total.size):>10} {total.inodes:>9} inodes  total", file=file)
+
+
+def remove_contents(dir_fd: int, reclaimed: DiskUsage) -> None:
+    """Deletes everything in a directory, relative to its file descriptor.
+
+    Working relative to file descriptors avoids resolving the full path of
+    every file, and means a directory replaced by a symlink while deleting
+    can't redirect the deletion elsewhere.
+
+    Args:
+        dir_fd: A file descriptor for the directory.
+        reclaimed: Updated with the space reclaimed.
+    """
+    with os.scandir(dir_fd) as it:
+        entries = list(it)
+    for entry in entries:
+        st = entry.stat(follow_symlinks=False)
+        if entry.is_dir(follow_symlinks=False):
+            child_fd = os.open(entry.name, DIRECTORY_FLAGS, dir_fd=dir_fd)
+            try:
+                remove_contents(child_fd, reclaimed)
+            finally:
+                os.close(child_fd)
+            os.rmdir(entry.name, dir_fd=dir_fd)
+        else:
+            os.unlink(entry.name, dir_fd=dir_fd)
+        reclaimed.count(st)
+
+
+def remove_tree(path: pathlib.Path) -> DiskUsage:
+    """Deletes a directory and everything in it.
+
+    Args:
+        path: The directory to delete.
+
+    Returns:
+        The space reclaimed.
+
+    Raises:
+        OSError: If deleting anything fails.
+    """
+    reclaimed = DiskUsage()
+    st = path.lstat()
+    dir_fd = os.open(path, DIRECTORY_FLAGS)
+    try:
+        remove_contents(dir_fd, reclaimed)
+    finally:
+        os.close(dir_fd)
+    path.rmdir()
+    reclaimed.count(st)
+    return reclaimed
+
+
+def remove_trees(
+    paths: list[pathlib.Path],
+    jobs: int,
+    verbose: bool,
+    file: TextIO | None = None,
+) -> DiskUsage:
+    """Deletes directories in parallel, and reports the space reclaimed.
+
+    Args:
+        paths: The directories to delete.
+        jobs: The number of directories to delete at once.
+        verbose: If True, print the space reclaimed from each directory.
+        file: Where to print progress; defaults to stdout.
+
+    Returns:
+        The total space reclaimed.
+
+    Raises:
+        OSError: If deleting anything fails.
+    """
+    total = DiskUsage()
+    start = time.monotonic()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(remove_tree, path): path for path in paths}
+        for future in concurrent.futures.as_completed(futures):
+            reclaimed = future.result()
+            if verbose:
+                print(
+                    f"Deleted directory: {futures[future]} "
+                    + f"({format_size(reclaimed.size)}, {reclaimed.inodes} inodes)",
+                    file=file,
+                )
+            total.add(reclaimed)
+    # Avoid dividing by zero if the clock didn't advance.
+    seconds = max(time.monotonic() - start, 1e-6)
+    print(
+        f"Reclaimed {format_size(total.size)} and {total.inodes} inodes from "
+        + f"{len(paths)} directories in {seconds:.2f}s "
+        + f"({format_size(total.size / seconds)}/s, "
+        + f"{total.inodes / seconds:.0f} inodes/s).",
+        file=file,
+    )
+    return total
+
+
+def move_to_trash(path: pathlib.Path, trash_dir: pathlib.Path) -> pathlib.Path:
+    """Atomically moves a directory into the trash directory.
+
+    Each directory is moved into a new, uniquely named directory, so
+    directories with the same name left by interrupted runs don't clash.
+
+    Args:
+        path: The directory to move.
+        trash_dir: The trash directory, on the same filesystem as path.
+
+    Returns:
+        The new path of the directory.
+    """
+    trash_dir.mkdir(exist_ok=True)
+    destination = pathlib.Path(tempfile.mkdtemp(prefix=f"{path.name}.", dir=trash_dir))
+    destination = destination / path.name
+    path.rename(destination)
+    return destination
+
+
+def background_command(trash_dir: pathlib.Path) -> list[str]:
+    """Builds the command that empties the trash directory at low priority.
+
+    Args:
+        trash_dir: The trash directory.
+
+    Returns:
+        The command, using ionice if it is available (it is Linux only).
+    """
+    command = [
+        sys.executable,
+        str(pathlib.Path(__file__).resolve()),
+        "--empty-trash",
+        str(trash_dir),
+    ]
+    ionice = shutil.which("ionice")
+    if ionice:
+        command = [ionice, "-c", "3", *command]
+    return ["nice", "-n", "19", *command]
+
+
+def start_background_deletion(trash_dir: pathlib.Path) -> int:
+    """Starts a detached, low priority process that empties the trash directory.
+
+    Args:
+        trash_dir: The trash directory.
+
+    Returns:
+        The process ID of the background process.
+    """
+    process = subprocess.Popen(
+        background_command(trash_dir),
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    return process.pid
+
+
+def empty_trash(trash_dir: pathlib.Path, jobs: int, verbose: bool) -> DiskUsage:
+    """Deletes everything in the trash directory, including leftovers.
+
+    Only one process empties a trash directory at a time; other processes
+    return immediately, because the process holding the lock keeps deleting
+    until the trash directory is empty.
+
+    Args:
+        trash_dir: The trash directory.
+        jobs: The number of directories to delete at once.
+        verbose: If True, print the space reclaimed from each directory.
+
+    Returns:
+        The space reclaimed, which is nothing if another process is emptying
+        the trash directory.
+
+    Raises:
+        OSError: If deleting anything fails.
+    """
+    total = DiskUsage()
+    dir_fd = os.open(trash_dir, DIRECTORY_FLAGS)
+    try:
+        try:
+            fcntl.flock(dir_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return total
+        while paths := sorted(trash_dir.iterdir()):
+            total.add(remove_trees(paths, jobs, verbose))
+    finally:
+        os.close(dir_fd)
+    return total
+
+
+def read_hash_cache(cache_path: pathlib.Path) -> dict[str, str]:
+    """Reads the cached hashes of files.
+
+    Args:
+        cache_path: The cache file.
+
+    Returns:
+        The cached hash of each file, keyed by hash_key; empty if the cache
+        file doesn't exist or is corrupt.
+    """
+    try:
+        cache = cast(object, json.loads(cache_path.read_text(encoding="utf-8")))
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(cache, dict):
+        return {}
+    return {
+        key: value
+        for key, value in cast(dict[str, object], cache).items()
+        if isinstance(value, str)
+    }
+
+
+def hash_key(st: os.stat_result) -> str:
+    """Identifies the contents of a file for the hash cache.
+
+    Replacing a file creates a new inode, and modifying it changes its mtime,
+    so either invalidates the cached hash.
+
+    Args:
+        st: The status of the file.
+
+    Returns:
+        The key for the file in the hash cache.
+    """
+    return f"{st.st_dev}:{st.st_ino}:{st.st_mtime_ns}"
+
+
+def hash_file(path: pathlib.Path) -> str | None:
+    """Hashes the contents of a file.
+
+    Args:
+        path: The file.
+
+    Returns:
+        The SHA-256 hash of the file, or None if it can't be read, e.g. because
+        it was deleted by pip.
+    """
+    try:
+        with path.open("rb") as f:
+            return hashlib.file_digest(f, "sha256").hexdigest()
+    except OSError:
+        return None
+
+
+def site_packages_files(
+    venv: pathlib.Path,
+) -> list[tuple[pathlib.Path, os.stat_result]]:
+    """Finds the files that --dedupe can share in a venv.
+
+    Args:
+        venv: The venv.
+
+    Returns:
+        The non-empty regular files in the venv's site-packages directories,
+        and their statuses.
+    """
+    files: list[tuple[pathlib.Path, os.stat_result]] = []
+    for site_packages in sorted(venv.glob("lib/python*/site-packages")):
+        for root, _, names in os.walk(site_packages):
+            for name in sorted(names):
+                path = pathlib.Path(root) / name
+                st = path.lstat()
+                if stat.S_ISREG(st.st_mode) and st.st_size > 0:
+                    files.append((path, st))
+    return files
+
+
+def store_path(
+    store_dir: pathlib.Path, digest: str, st: os.stat_result
+) -> pathlib.Path:
+    """Chooses where the store keeps a file.
+
+    Hard links share permissions and ownership as well as contents, so only
+    files that match in all three are shared.
+
+    Args:
+        store_dir: The store directory.
+        digest: The hash of the file.
+        st: The status of the file.
+
+    Returns:
+        The path of the file in the store.
+    """
+    return store_dir / digest[:2] / f"{digest}-{stat.S_IMODE(st.st_mode):o}-{st.st_uid}"
+
+
+def unchanged(path: pathlib.Path, st: os.stat_result) -> bool:
+    """Checks that a file hasn't been replaced or modified since it was hashed.
+
+    Args:
+        path: The file.
+        st: The status of the file when it was hashed.
+
+    Returns:
+        True if the file is unchanged.
+    """
+    try:
+        current = path.lstat()
+    except FileNotFoundError:
+        return False
+    return hash_key(current) == hash_key(st) and current.st_size == st.st_size
+
+
+def link_file(source: pathlib.Path, path: pathlib.Path, st: os.stat_result) -> bool:
+    """Atomically replaces a file with a hard link to an identical file.
+
+    The hard link is created beside the file and renamed over it, so processes
+    using the venv never see the file missing; processes that already opened
+    the file keep reading the original.
+
+    Args:
+        source: The identical file in the store.
+        path: The file to replace.
+        st: The status of the file when it was hashed.
+
+    Returns:
+        True if the file was replaced, False if it changed since it was hashed.
+    """
+    temp_path = path.with_name(f".{path.name}.dedupe")
+    temp_path.unlink(missing_ok=True)
+    os.link(source, temp_path)
+    if not unchanged(path, st):
+        temp_path.unlink()
+        return False
+    os.replace(temp_path, path)
+    return True
+
+
+def prune_store(store_dir: pathlib.Path) -> DiskUsage:
+    """Deletes files in the store that no venv uses any more.
+
+    Args:
+        store_dir: The store directory.
+
+    Returns:
+        The space reclaimed.
+    """
+    reclaimed = DiskUsage()
+    for path in sorted(store_dir.glob("*/*")):
+        st = path.lstat()
+        if st.st_nlink == 1:
+            path.unlink()
+            reclaimed.count(st)
+    return reclaimed
+
+
+def dedupe_venvs(
+    venvs: list[pathlib.Path],
+    virtualenv_dir: pathlib.Path,
+    jobs: int,
+    dry_run: bool,
+    verbose: bool,
+    file: TextIO | None = None,
+) -> DiskUsage:
+    """Replaces identical files in venvs with hard links to a shared store.
+
+    Files are hashed in parallel, reusing cached hashes for files whose inode
+    and mtime haven't changed. The first copy of each file is hard linked into
+    the store, and every other copy is replaced with a hard link to it. Files
+    that change while this runs, e.g. because pip is upgrading a package, are
+    left alone. Files that no venv uses are deleted from the store.
+
+    Files in site-packages must never be modified in place, because that would
+    modify every venv sharing the file; pip and Python replace files instead.
+
+    Args:
+        venvs: The venvs to deduplicate.
+        virtualenv_dir: The directory containing the venvs, on the same
+            filesystem as the store.
+        jobs: The number of files to hash at once.
+        dry_run: If True, only calculate the space that would be saved,
+            without changing the store or the hash cache.
+        verbose: If True, print each file that can't be deduplicated.
+        file: Where to print progress; defaults to stdout.
+
+    Returns:
+        The space saved, including files deleted from the store.
+    """
+    store_dir = virtualenv_dir / STORE_DIR_NAME
+    cache_path = virtualenv_dir / HASH_CACHE_NAME
+    saved = DiskUsage()
+    if not dry_run and store_dir.is_dir():
+        saved.add(prune_store(store_dir))
+
+    files = [file for venv in venvs for file in site_packages_files(venv)]
+    cache = read_hash_cache(cache_path)
+    to_hash = {hash_key(st): path for path, st in files if hash_key(st) not in cache}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        hashes = dict(zip(to_hash, executor.map(hash_file, to_hash.values())))
+    cache.update((key, digest) for key, digest in hashes.items() if digest)
+    if not dry_run:
+        write_cache(
+            cache_path,
+            {
+                hash_key(st): cache[hash_key(st)]
+                for _, st in files
+                if hash_key(st) in cache
+            },
+        )
+
+    # The inode that is, or in a dry run would be, in the store for each path.
+    stored: dict[pathlib.Path, int] = {}
+    for path, st in files:
+        if hash_key(st) not in cache:
+            continue
+        source = store_path(store_dir, cache[hash_key(st)], st)
+        try:
+            try:
+                inode = source.lstat().st_ino
+            except FileNotFoundError:
+                inode = stored.setdefault(source, st.st_ino)
+                if inode == st.st_ino and not dry_run:
+                    source.parent.mkdir(parents=True, exist_ok=True)
+                    os.link(path, source)
+                    if not unchanged(source, st):
+                        source.unlink()
+                        stored.pop(source)
+            if inode == st.st_ino:
+                continue
+            if dry_run or link_file(source, path, st):
+                saved.count(st)
+        except OSError as e:
+            if verbose:
+                print(f"Not deduplicating {path}: {e}", file=file)
+    return saved
 
 
 def clean_virtualenvs(
@@ -46,20 +891,45 @@ def clean_virtualenvs(
     symlink_name: str,
     dry_run: bool,
     verbose: bool,
-) -> None:
+    jobs: int = 1,
+    background: bool = False,
+    keep: int | None = None,
+    quota: int | None = None,
+    report: bool = False,
+    dedupe: bool = False,
+    resolver: PathResolver | None = None,
+    file: TextIO | None = None,
+) -> DiskUsage:
     """Clean up unused virtual environments in the specified directory.
 
     Deletes all directories in `virtualenv_dir` except for the one pointed to
-    by the active symlink (and its parent directories relative to the root).
+    by the active symlink (and its parent directories relative to the root),
+    and the most recent directories allowed by the retention limits.
 
     Args:
         virtualenv_dir: The directory containing virtual environments.
         symlink_name: The name of the symlink pointing to the active venv.
         dry_run: If True, do not perform deletion.
         verbose: If True, print verbose progress.
+        jobs: The number of directories to delete at once.
+        background: If True, atomically move stale directories to the trash
+            directory, and delete everything in it in a background process.
+        keep: Keep up to this many of the most recent stale directories.
+        quota: Keep the most recent stale directories while all directories
+            use at most this many bytes.
+        report: If True, print the space used by each directory.
+        dedupe: If True, hard link identical files in the site-packages of the
+            active and kept directories to a shared store.
+        resolver: Resolves symlinks, possibly shared with other sweeps.
+        file: Where to print progress and the report; defaults to stdout.
+
+    Returns:
+        The space reclaimed by deleting directories and deduplicating files;
+        deleting directories reclaims nothing in background mode.
 
     Raises:
         FileNotFoundError: If the target directory or symlink does not exist.
+        OSError: If deleting a directory fails.
     """
     if not virtualenv_dir.is_dir():
         raise FileNotFoundError(f"Directory not found: {virtualenv_dir}")
@@ -79,17 +949,21 @@ def clean_virtualenvs(
             + f"(tried '{symlink_name}' and '{alt_symlink_name}')"
         )
 
+    if resolver is None:
+        resolver = PathResolver()
     try:
-        active_venv = symlink_path.resolve(strict=True)
+        active_venv = resolver.resolve(symlink_path)
     except FileNotFoundError as e:
         raise FileNotFoundError(
             f"Symlink at {symlink_path} points to a non-existent path: {e}"
         ) from e
 
     if verbose:
-        print(f"Active venv resolved to: {active_venv}")
+        print(f"Active venv resolved to: {active_venv}", file=file)
 
     prefix = symlink_path.name.lower()
+    active: list[pathlib.Path] = []
+    stale: list[pathlib.Path] = []
 
     for child in virtualenv_dir.iterdir():
         # Ignore anything that does not start with the symlink name (case-insensitive)
@@ -104,7 +978,8 @@ def clean_virtualenvs(
             if verbose or dry_run:
                 print(
                     f"{'[DRY RUN] Would delete' if dry_run else 'Deleting'}"
-                    + f" symlink: {child}"
+                    + f" symlink: {child}",
+                    file=file,
                 )
             if not dry_run:
                 child.unlink()
@@ -112,7 +987,7 @@ def clean_virtualenvs(
 
         if child.is_dir():
             try:
-                resolved_child = child.resolve(strict=True)
+                resolved_child = resolver.resolve(child)
             except FileNotFoundError:
                 # If resolving fails, it might be a broken symlink or directory
                 # that was removed/inaccessible. We safely skip it.
@@ -125,17 +1000,179 @@ def clean_virtualenvs(
 
             if is_active:
                 if verbose:
-                    print(f"Keeping active venv directory: {child}")
+                    print(f"Keeping active venv directory: {child}", file=file)
+                active.append(child)
                 continue
 
-            if verbose or dry_run:
-                print(
-                    f"{'[DRY RUN] Would delete' if dry_run else 'Deleting'}"
-                    + f" directory: {child}"
-                )
+            stale.append(child)
 
-            if not dry_run:
-                shutil.rmtree(child)
+    usage: dict[pathlib.Path, DiskUsage] = {}
+    if quota is not None or report:
+        usage = measure_venvs(
+            active + stale, virtualenv_dir / SIZE_CACHE_NAME, jobs, dry_run
+        )
+    kept = retained_venvs(
+        stale,
+        usage,
+        keep=keep,
+        quota=quota,
+        used=sum(u.size for path, u in usage.items() if path in active),
+    )
+    stale = [path for path in stale if path not in kept]
+    if report:
+        statuses = {path: "active" for path in active}
+        statuses.update({path: "keep" for path in kept})
+        statuses.update({path: "delete" for path in stale})
+        print_usage_report(usage, statuses, file)
+
+    for child in sorted(kept):
+        if verbose:
+            print(f"Keeping recent venv directory: {child}", file=file)
+    for child in sorted(stale):
+        if verbose or dry_run:
+            print(
+                f"{'[DRY RUN] Would delete' if dry_run else 'Deleting'}"
+                + f" directory: {child}",
+                file=file,
+            )
+
+    reclaimed = DiskUsage()
+    if dry_run:
+        pass
+    elif background:
+        trash_dir = virtualenv_dir / TRASH_DIR_NAME
+        for path in stale:
+            destination = move_to_trash(path, trash_dir)
+            if verbose:
+                print(f"Moved directory: {path} to {destination}", file=file)
+        if trash_dir.is_dir() and any(trash_dir.iterdir()):
+            pid = start_background_deletion(trash_dir)
+            print(
+                f"Moved {len(stale)} directories to {trash_dir}; deleting its "
+                + f"contents in the background (pid {pid}).",
+                file=file,
+            )
+    elif stale:
+        reclaimed = remove_trees(stale, jobs, verbose, file)
+
+    if dedupe:
+        # The active venv may be a descendant of the directory that is kept.
+        venvs = sorted(kept) + ([active_venv] if active else [])
+        saved = dedupe_venvs(venvs, virtualenv_dir, jobs, dry_run, verbose, file)
+        print(
+            f"{'[DRY RUN] Would save' if dry_run else 'Saved'} "
+            + f"{format_size(saved.size)} and {saved.inodes} inodes by "
+            + f"deduplicating {len(venvs)} venvs in {virtualenv_dir}.",
+            file=file,
+        )
+        if not dry_run:
+            reclaimed.add(saved)
+    return reclaimed
+
+
+def expand_directories(patterns: list[str]) -> list[pathlib.Path]:
+    """Expands ~ and globs in virtualenv directories.
+
+    Args:
+        patterns: Directories, or globs matching them.
+
+    Returns:
+        The directories, without duplicates; patterns without matches are
+        kept so that the missing directories are reported.
+    """
+    directories: list[pathlib.Path] = []
+    for pattern in patterns:
+        expanded = os.path.expanduser(pattern)
+        matches = sorted(glob.glob(expanded)) or [expanded]
+        directories.extend(pathlib.Path(match) for match in matches)
+    return list(dict.fromkeys(directories))
+
+
+def sweep(
+    directories: list[pathlib.Path],
+    *,
+    symlink_name: str,
+    dry_run: bool,
+    verbose: bool,
+    jobs: int,
+    background: bool = False,
+    keep: int | None = None,
+    quota: int | None = None,
+    report: bool = False,
+    dedupe: bool = False,
+) -> int:
+    """Cleans up many virtualenv directories concurrently.
+
+    All the directories share one PathResolver. The output for each directory
+    is printed in the order of directories once every directory is done, so
+    they don't interleave. With more than one directory, the space reclaimed
+    from each directory and in total is printed.
+
+    The jobs are divided between the directories and the venvs in each
+    directory, rather than each directory deleting jobs venvs at once.
+
+    Args:
+        directories: The virtualenv directories.
+        symlink_name: The name of the symlink pointing to the active venv.
+        dry_run: If True, do not perform deletion.
+        verbose: If True, print verbose progress.
+        jobs: The number of venvs to delete at once, across all directories.
+        background: If True, delete stale venvs in background processes.
+        keep: Keep up to this many of the most recent inactive venvs.
+        quota: Keep the most recent inactive venvs while all venvs in a
+            directory use at most this many bytes.
+        report: If True, print the space used by each venv.
+        dedupe: If True, hard link identical files in the venvs that are kept.
+
+    Returns:
+        Exit code (0 for success, 1 if any directory failed).
+    """
+    resolver = PathResolver()
+    outputs = {directory: io.StringIO() for directory in directories}
+    workers = max(1, min(jobs, len(directories)))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            directory: executor.submit(
+                clean_virtualenvs,
+                virtualenv_dir=directory,
+                symlink_name=symlink_name,
+                dry_run=dry_run,
+                verbose=verbose,
+                jobs=max(1, jobs // workers),
+                background=background,
+                keep=keep,
+                quota=quota,
+                report=report,
+                dedupe=dedupe,
+                resolver=resolver,
+                file=outputs[directory],
+            )
+            for directory in directories
+        }
+    total = DiskUsage()
+    failed = 0
+    lines: list[str] = []
+    for directory, future in futures.items():
+        sys.stdout.write(outputs[directory].getvalue())
+        try:
+            reclaimed = future.result()
+        except OSError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            failed += 1
+            lines.append(f"{directory}: failed")
+            continue
+        total.add(reclaimed)
+        lines.append(
+            f"{directory}: reclaimed {format_size(reclaimed.size)} and "
+            + f"{reclaimed.inodes} inodes"
+        )
+    if len(directories) > 1:
+        print("\n".join(lines))
+        print(
+            f"{len(directories)} directories: reclaimed {format_size(total.size)} "
+            + f"and {total.inodes} inodes, {failed} failed."
+        )
+    return 1 if failed else 0
 
 
 def main(argv: list[str]) -> int:
@@ -151,10 +1188,12 @@ def main(argv: list[str]) -> int:
         description="Clean up unused virtual environments in a directory.",
     )
     parser.add_argument(
-        "directory",
-        nargs="?",
-        default="~/tmp/bin/virtualenv/",
-        help="Directory to clean up (default: ~/tmp/bin/virtualenv/)",
+        "directories",
+        nargs="*",
+        default=[DEFAULT_DIRECTORY],
+        metavar="DIRECTORY",
+        help="Directories to clean up, or globs matching them, e.g. "
+        + f"'/home/*/venvs' (default: {DEFAULT_DIRECTORY})",
     )
     parser.add_argument(
         "-n",
@@ -173,24 +1212,73 @@ def main(argv: list[str]) -> int:
         default="Python",
         help="Name of the active venv symlink (default: Python)",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=script_utils.positive_int,
+        default=DEFAULT_JOBS,
+        help="Number of directories to delete at once (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--background",
+        action="store_true",
+        help=f"Move stale venvs to {TRASH_DIR_NAME} in the directory and delete "
+        + "them in a low priority background process.",
+    )
+    parser.add_argument(
+        "--empty-trash",
+        metavar="TRASH_DIR",
+        help="Delete everything in TRASH_DIR instead of cleaning up venvs; "
+        + "used by --background.",
+    )
+    parser.add_argument(
+        "--keep",
+        type=script_utils.non_negative_int,
+        metavar="N",
+        help="Keep the N most recently modified inactive venvs for rollback.",
+    )
+    parser.add_argument(
+        "--quota",
+        type=parse_size,
+        metavar="SIZE",
+        help="Keep the most recently modified inactive venvs while all venvs "
+        + "use at most SIZE, e.g. 2G.",
+    )
+    parser.add_argument(
+        "--report",
+        action="store_true",
+        help="Print the disk space used by each venv, largest first.",
+    )
+    parser.add_argument(
+        "--dedupe",
+        action="store_true",
+        help="Hard link identical files in the site-packages of the active and "
+        + f"kept venvs to {STORE_DIR_NAME} in the directory, and report the "
+        + "space saved.",
+    )
 
     args = parser.parse_args(argv[1:], namespace=Args())
 
-    # Expand the user home directory if needed
-    target_path = pathlib.Path(args.directory).expanduser()
+    if args.empty_trash is not None:
+        try:
+            empty_trash(pathlib.Path(args.empty_trash), args.jobs, args.verbose)
+        except FileNotFoundError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        return 0
 
-    try:
-        clean_virtualenvs(
-            virtualenv_dir=target_path,
-            symlink_name=args.symlink_name,
-            dry_run=args.dry_run,
-            verbose=args.verbose,
-        )
-    except FileNotFoundError as e:
-        print(f"Error: {e}", file=sys.stderr)
-        return 1
-
-    return 0
+    return sweep(
+        expand_directories(args.directories),
+        jobs=args.jobs,
+        symlink_name=args.symlink_name,
+        dry_run=args.dry_run,
+        verbose=args.verbose,
+        background=args.background,
+        keep=args.keep,
+        quota=args.quota,
+        report=args.report,
+        dedupe=args.dedupe,
+    )
 
 
 if __name__ == "__main__":
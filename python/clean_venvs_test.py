@@ -1,9 +1,14 @@
 """Tests for clean_venvs.py."""
 
+import fcntl
 import io
 import os
 import pathlib
+import shutil
+import subprocess
 import sys
+import tempfile
+import threading
 import unittest
 from unittest import mock
 import typing
@@ -19,23 +24,44 @@ class TestArgs(unittest.TestCase):
     def test_init_defaults(self) -> None:
         """Tests that Args initializes with correct defaults."""
         args = clean_venvs.Args()
-        self.assertEqual(args.directory, "~/tmp/bin/virtualenv/")
+        self.assertEqual(args.directories, ["~/tmp/bin/virtualenv/"])
         self.assertFalse(args.dry_run)
         self.assertFalse(args.verbose)
         self.assertEqual(args.symlink_name, "Python")
+        self.assertEqual(args.jobs, clean_venvs.DEFAULT_JOBS)
+        self.assertFalse(args.background)
+        self.assertIsNone(args.empty_trash)
+        self.assertIsNone(args.keep)
+        self.assertIsNone(args.quota)
+        self.assertFalse(args.report)
+        self.assertFalse(args.dedupe)
 
     def test_init_custom(self) -> None:
         """Tests that Args initializes with provided values."""
         args = clean_venvs.Args(
-            directory="/custom/path",
+            directories=["/custom/path", "/other/*"],
             dry_run=True,
             verbose=True,
             symlink_name="python",
+            jobs=4,
+            background=True,
+            empty_trash="/trash",
+            keep=3,
+            quota=1024,
+            report=True,
+            dedupe=True,
         )
-        self.assertEqual(args.directory, "/custom/path")
+        self.assertEqual(args.directories, ["/custom/path", "/other/*"])
         self.assertTrue(args.dry_run)
         self.assertTrue(args.verbose)
         self.assertEqual(args.symlink_name, "python")
+        self.assertEqual(args.jobs, 4)
+        self.assertTrue(args.background)
+        self.assertEqual(args.empty_trash, "/trash")
+        self.assertEqual(args.keep, 3)
+        self.assertEqual(args.quota, 1024)
+        self.assertTrue(args.report)
+        self.assertTrue(args.dedupe)
 
 
 class TestCleanVirtualenvs(fake_filesystem_unittest.TestCase):
@@ -243,6 +269,8 @@ class TestCleanVirtualenvs(fake_filesystem_unittest.TestCase):
         self.assertIn("Keeping active venv directory:", output)
         self.assertIn("Deleting directory:", output)
         self.assertIn("Deleting symlink:", output)
+        self.assertIn(f"Deleted directory: {inactive_venv} (", output)
+        self.assertIn("inodes from 1 directories in", output)
 
     @mock.patch.object(sys, "stdout", new_callable=io.StringIO)
     def test_clean_virtualenvs_dry_run_symlink(self, mock_stdout: io.StringIO) -> None:
@@ -274,17 +302,20 @@ class TestCleanVirtualenvs(fake_filesystem_unittest.TestCase):
         os.makedirs(inactive_venv)
         os.symlink("Python-2026-06-26", virtualenv_dir / "Python")
 
-        original_resolve = pathlib.Path.resolve
+        original_resolve = clean_venvs.PathResolver.resolve
 
         def resolve_side_effect(
-            self_obj: pathlib.Path, strict: bool = False
+            self_obj: clean_venvs.PathResolver, path: pathlib.Path
         ) -> pathlib.Path:
-            if self_obj.name == "Python-2026-06-25":
+            if path.name == "Python-2026-06-25":
                 raise FileNotFoundError("mock error")
-            return original_resolve(self_obj, strict=strict)
+            return original_resolve(self_obj, path)
 
         with mock.patch.object(
-            pathlib.Path, "resolve", autospec=True, side_effect=resolve_side_effect
+            clean_venvs.PathResolver,
+            "resolve",
+            autospec=True,
+            side_effect=resolve_side_effect,
         ):
             clean_venvs.clean_virtualenvs(
                 virtualenv_dir=virtualenv_dir,
@@ -297,10 +328,976 @@ class TestCleanVirtualenvs(fake_filesystem_unittest.TestCase):
         self.assertTrue(inactive_venv.is_dir())
 
 
+class TestRemoveTree(fake_filesystem_unittest.TestCase):
+    """Tests for deleting directories and counting the space reclaimed."""
+
+    @typing.override
+    def setUp(self) -> None:
+        """Set up fake filesystem."""
+        self.setUpPyfakefs()
+
+    def test_format_size(self) -> None:
+        """Tests formatting sizes with binary units."""
+        self.assertEqual(clean_venvs.format_size(0), "0.0 B")
+        self.assertEqual(clean_venvs.format_size(1536), "1.5 KiB")
+        self.assertEqual(clean_venvs.format_size(3 * 1024**3), "3.0 GiB")
+        self.assertEqual(clean_venvs.format_size(2 * 1024**4), "2.0 TiB")
+
+    def test_reclaimed_count(self) -> None:
+        """Tests that files with other hard links are not counted."""
+        reclaimed = clean_venvs.DiskUsage()
+        file_stat = os.stat_result(
+            (0o100644, 0, 0, 1, 0, 0, 4096, 0, 0, 0), {"st_blocks": 8}
+        )
+        linked_stat = os.stat_result(
+            (0o100644, 0, 0, 2, 0, 0, 4096, 0, 0, 0), {"st_blocks": 8}
+        )
+        dir_stat = os.stat_result(
+            (0o40755, 0, 0, 2, 0, 0, 4096, 0, 0, 0), {"st_blocks": 16}
+        )
+        for st in [file_stat, linked_stat, dir_stat]:
+            reclaimed.count(st)
+        self.assertEqual(reclaimed, clean_venvs.DiskUsage(size=24 * 512, inodes=2))
+
+    def test_remove_tree(self) -> None:
+        """Tests deleting a tree without following symlinks out of it."""
+        venv = pathlib.Path("/venvs/Python-old")
+        outside = pathlib.Path("/outside")
+        os.makedirs(venv / "lib/site-packages/pkg")
+        os.makedirs(outside)
+        (venv / "lib/site-packages/pkg/__init__.py").write_text("x" * 5000)
+        (outside / "keep.txt").write_text("keep")
+        os.symlink(outside, venv / "lib/outside")
+        os.link(outside / "keep.txt", venv / "keep-link.txt")
+
+        reclaimed = clean_venvs.remove_tree(venv)
+
+        self.assertFalse(venv.exists())
+        self.assertTrue((outside / "keep.txt").is_file())
+        # 4 directories, 1 file, and 1 symlink; the hard link frees nothing.
+        self.assertEqual(reclaimed.inodes, 6)
+
+    def test_remove_tree_closes_fd_on_failure(self) -> None:
+        """Tests that directory file descriptors are closed if deleting fails."""
+        venv = pathlib.Path("/venvs/Python-old")
+        os.makedirs(venv / "lib")
+        with (
+            mock.patch.object(os, "rmdir", side_effect=PermissionError("denied")),
+            mock.patch.object(os, "close", wraps=os.close) as mock_close,
+        ):
+            with self.assertRaises(PermissionError):
+                clean_venvs.remove_tree(venv)
+        self.assertEqual(mock_close.call_count, 2)
+
+
+class TestBackgroundDeletion(fake_filesystem_unittest.TestCase):
+    """Tests for moving venvs to the trash and deleting them in the background."""
+
+    virtualenv_dir: pathlib.Path = pathlib.Path("/fake/virtualenv")
+    trash_dir: pathlib.Path = virtualenv_dir / clean_venvs.TRASH_DIR_NAME
+
+    @typing.override
+    def setUp(self) -> None:
+        """Set up fake filesystem."""
+        self.setUpPyfakefs()
+        os.makedirs(self.virtualenv_dir / "Python-2026-06-26")
+        os.symlink("Python-2026-06-26", self.virtualenv_dir / "Python")
+
+    def test_move_to_trash(self) -> None:
+        """Tests that venvs with the same name don't clash in the trash."""
+        venv = self.virtualenv_dir / "Python-2026-06-25"
+        destinations: list[pathlib.Path] = []
+        for _ in range(2):
+            os.makedirs(venv / "lib")
+            destinations.append(clean_venvs.move_to_trash(venv, self.trash_dir))
+        self.assertFalse(venv.exists())
+        self.assertNotEqual(destinations[0], destinations[1])
+        for destination in destinations:
+            self.assertEqual(destination.name, "Python-2026-06-25")
+            # trash_dir is created before pyfakefs patches pathlib, and paths
+            # of different classes never compare equal.
+            self.assertEqual(str(destination.parent.parent), str(self.trash_dir))
+            self.assertTrue((destination / "lib").is_dir())
+
+    def test_background_command(self) -> None:
+        """Tests the command uses nice everywhere, and ionice where available."""
+        for ionice, expected_prefix in [
+            (None, ["nice", "-n", "19"]),
+            ("/usr/bin/ionice", ["nice", "-n", "19", "/usr/bin/ionice", "-c", "3"]),
+        ]:
+            with (
+                self.subTest(ionice=ionice),
+                mock.patch.object(shutil, "which", return_value=ionice),
+            ):
+                command = clean_venvs.background_command(self.trash_dir)
+                self.assertEqual(command[: len(expected_prefix)], expected_prefix)
+                self.assertEqual(
+                    command[len(expected_prefix) :],
+                    [
+                        sys.executable,
+                        str(pathlib.Path(clean_venvs.__file__).resolve()),
+                        "--empty-trash",
+                        str(self.trash_dir),
+                    ],
+                )
+
+    @mock.patch.object(sys, "stdout", new_callable=io.StringIO)
+    def test_clean_virtualenvs_background(self, mock_stdout: io.StringIO) -> None:
+        """Tests stale venvs are moved to the trash and deleted in the background."""
+        inactive_venv = self.virtualenv_dir / "Python-2026-06-25"
+        os.makedirs(inactive_venv)
+        mock_process = typing.cast(
+            mock.MagicMock, mock.create_autospec(subprocess.Popen, instance=True)
+        )
+        mock_process.pid = 1234
+        with mock.patch.object(
+            subprocess, "Popen", return_value=mock_process
+        ) as mock_popen:
+            reclaimed = clean_venvs.clean_virtualenvs(
+                virtualenv_dir=self.virtualenv_dir,
+                symlink_name="Python",
+                dry_run=False,
+                verbose=True,
+                background=True,
+            )
+        self.assertEqual(reclaimed, clean_venvs.DiskUsage())
+        self.assertFalse(inactive_venv.exists())
+        self.assertTrue((self.virtualenv_dir / "Python-2026-06-26").is_dir())
+        self.assertEqual(len(list(self.trash_dir.glob("*/Python-2026-06-25"))), 1)
+        mock_popen.assert_called_once_with(
+            clean_venvs.background_command(self.trash_dir),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        output = mock_stdout.getvalue()
+        self.assertIn(f"Moved directory: {inactive_venv} to {self.trash_dir}/", output)
+        self.assertIn("in the background (pid 1234).", output)
+
+    def test_clean_virtualenvs_background_leftovers(self) -> None:
+        """Tests leftovers from interrupted runs are deleted in the background."""
+        os.makedirs(self.trash_dir / "Python-2026-06-24.abc/Python-2026-06-24")
+        os.makedirs(self.virtualenv_dir / "Python-2026-06-25")
+        with (
+            mock.patch.object(subprocess, "Popen") as mock_popen,
+            mock.patch.object(sys, "stdout", new_callable=io.StringIO),
+        ):
+            clean_venvs.clean_virtualenvs(
+                virtualenv_dir=self.virtualenv_dir,
+                symlink_name="Python",
+                dry_run=False,
+                verbose=False,
+                background=True,
+            )
+        mock_popen.assert_called_once()
+        self.assertEqual(len(list(self.trash_dir.iterdir())), 2)
+
+    def test_clean_virtualenvs_background_nothing_to_delete(self) -> None:
+        """Tests no background process is started if there is nothing to delete."""
+        for make_trash_dir in [False, True]:
+            if make_trash_dir:
+                os.makedirs(self.trash_dir)
+            with (
+                self.subTest(make_trash_dir=make_trash_dir),
+                mock.patch.object(subprocess, "Popen") as mock_popen,
+            ):
+                clean_venvs.clean_virtualenvs(
+                    virtualenv_dir=self.virtualenv_dir,
+                    symlink_name="Python",
+                    dry_run=False,
+                    verbose=False,
+                    background=True,
+                )
+                mock_popen.assert_not_called()
+
+    @mock.patch.object(sys, "stdout", new_callable=io.StringIO)
+    def test_empty_trash(self, _mock_stdout: io.StringIO) -> None:
+        """Tests everything in the trash is deleted."""
+        os.makedirs(self.trash_dir / "a/Python-1/lib")
+        os.makedirs(self.trash_dir / "b/Python-2")
+        reclaimed = clean_venvs.empty_trash(self.trash_dir, jobs=1, verbose=False)
+        self.assertEqual(list(self.trash_dir.iterdir()), [])
+        self.assertEqual(reclaimed.inodes, 5)
+
+    def test_empty_trash_locked(self) -> None:
+        """Tests nothing is deleted while another process empties the trash."""
+        os.makedirs(self.trash_dir / "a/Python-1")
+        with mock.patch.object(fcntl, "flock", side_effect=BlockingIOError()):
+            reclaimed = clean_venvs.empty_trash(self.trash_dir, jobs=1, verbose=False)
+        self.assertEqual(reclaimed, clean_venvs.DiskUsage())
+        self.assertTrue((self.trash_dir / "a/Python-1").is_dir())
+
+
+class TestRetention(fake_filesystem_unittest.TestCase):
+    """Tests for measuring venvs and keeping recent ones."""
+
+    virtualenv_dir: pathlib.Path = pathlib.Path("/fake/virtualenv")
+    cache_path: pathlib.Path = virtualenv_dir / clean_venvs.SIZE_CACHE_NAME
+
+    @typing.override
+    def setUp(self) -> None:
+        """Set up fake filesystem."""
+        self.setUpPyfakefs()
+        for day in range(23, 27):
+            site_packages = (
+                self.virtualenv_dir
+                / f"Python-2026-06-{day}/lib/python3.13/site-packages"
+            )
+            os.makedirs(site_packages)
+            (site_packages / "module.py").write_text("x")
+            # Make the venvs' ages match their names.
+            os.utime(site_packages.parents[2], (day * 86400, day * 86400))
+        os.symlink("Python-2026-06-26", self.virtualenv_dir / "Python")
+
+    def venv(self, day: int) -> pathlib.Path:
+        """Returns the path of a venv created in setUp."""
+        return self.virtualenv_dir / f"Python-2026-06-{day}"
+
+    def test_parse_size(self) -> None:
+        """Tests parsing sizes with optional suffixes."""
+        for text, expected in [
+            ("100", 100),
+            ("2K", 2048),
+            ("1.5m", 3 * 512 * 1024),
+            ("2G", 2 * 1024**3),
+            ("2GiB", 2 * 1024**3),
+            ("1TB", 1024**4),
+        ]:
+            with self.subTest(text=text):
+                self.assertEqual(clean_venvs.parse_size(text), expected)
+        with self.assertRaises(ValueError):
+            clean_venvs.parse_size("lots")
+
+    def test_measure_tree(self) -> None:
+        """Tests that hard links to files elsewhere are not counted."""
+        venv = self.venv(23)
+        os.link(venv / "lib/python3.13/site-packages/module.py", "/fake/elsewhere")
+        # 4 directories; the file has another hard link.
+        self.assertEqual(clean_venvs.measure_tree(venv).inodes, 4)
+
+    def test_measure_venvs_cached(self) -> None:
+        """Tests sizes are cached until site-packages changes."""
+        venvs = [self.venv(23), self.venv(24)]
+        usage = clean_venvs.measure_venvs(venvs, self.cache_path, jobs=1)
+        self.assertEqual({u.inodes for u in usage.values()}, {5})
+        self.assertEqual(
+            set(clean_venvs.read_size_cache(self.cache_path)),
+            {
+                "Python-2026-06-23",
+                "Python-2026-06-24",
+            },
+        )
+        with mock.patch.object(clean_venvs, "measure_tree") as mock_measure:
+            self.assertEqual(
+                clean_venvs.measure_venvs(venvs, self.cache_path, jobs=1), usage
+            )
+        mock_measure.assert_not_called()
+
+        site_packages = venvs[0] / "lib/python3.13/site-packages"
+        (site_packages / "new.py").write_text("x")
+        # Installing a package changes the modification time of site-packages.
+        os.utime(site_packages, ns=(1, 1))
+        usage = clean_venvs.measure_venvs(venvs, self.cache_path, jobs=1)
+        self.assertEqual(usage[venvs[0]].inodes, 6)
+        self.assertEqual(usage[venvs[1]].inodes, 5)
+
+    def test_measure_venvs_bad_cache(self) -> None:
+        """Tests corrupt caches are ignored."""
+        venv = self.venv(23)
+        for contents in ["not json", "[]", '{"Python-2026-06-23": []}', "{}"]:
+            with self.subTest(contents=contents):
+                self.cache_path.write_text(contents)
+                usage = clean_venvs.measure_venvs([venv], self.cache_path, jobs=1)
+                self.assertEqual(usage[venv].inodes, 5)
+
+    def test_measure_venvs_dry_run(self) -> None:
+        """Tests dry runs don't write the cache."""
+        venv = self.venv(23)
+        usage = clean_venvs.measure_venvs([venv], self.cache_path, jobs=1, dry_run=True)
+        self.assertEqual(usage[venv].inodes, 5)
+        self.assertFalse(self.cache_path.exists())
+
+    def test_write_cache_failure(self) -> None:
+        """Tests failing to write the cache is ignored."""
+        clean_venvs.write_cache(pathlib.Path("/missing/cache.json"), {})
+        self.assertFalse(pathlib.Path("/missing").exists())
+
+    def test_retained_venvs(self) -> None:
+        """Tests keeping the most recent venvs within the limits."""
+        stale = [self.venv(day) for day in [24, 23, 25]]
+        usage = {path: clean_venvs.DiskUsage(size=100) for path in stale}
+        for keep, quota, expected in [
+            (None, None, []),
+            (0, None, []),
+            (2, None, [25, 24]),
+            (5, None, [25, 24, 23]),
+            (None, 250, [25]),
+            (None, 300, [25, 24]),
+            (1, 1000, [25]),
+        ]:
+            with self.subTest(keep=keep, quota=quota):
+                self.assertEqual(
+                    clean_venvs.retained_venvs(
+                        stale, usage, keep=keep, quota=quota, used=100
+                    ),
+                    [self.venv(day) for day in expected],
+                )
+
+    @mock.patch.object(sys, "stdout", new_callable=io.StringIO)
+    def test_clean_virtualenvs_keep_and_report(self, mock_stdout: io.StringIO) -> None:
+        """Tests recent venvs are kept, and the report shows what happened."""
+        clean_venvs.clean_virtualenvs(
+            virtualenv_dir=self.virtualenv_dir,
+            symlink_name="Python",
+            dry_run=False,
+            verbose=True,
+            keep=1,
+            report=True,
+        )
+        self.assertEqual(
+            sorted(p.name for p in self.virtualenv_dir.glob("Python-*")),
+            ["Python-2026-06-25", "Python-2026-06-26"],
+        )
+        output = mock_stdout.getvalue()
+        self.assertIn(f"Keeping recent venv directory: {self.venv(25)}", output)
+        self.assertIn(f"Deleting directory: {self.venv(23)}", output)
+        report = [
+            [line.split()[-2], pathlib.Path(line.split()[-1]).name]
+            for line in output.splitlines()
+            if line.endswith(("total",)) or " inodes  " in line
+        ]
+        self.assertEqual(
+            report,
+            # Everything has the same size in pyfakefs, so the order is by name.
+            [
+                ["delete", "Python-2026-06-23"],
+                ["delete", "Python-2026-06-24"],
+                ["keep", "Python-2026-06-25"],
+                ["active", "Python-2026-06-26"],
+                ["inodes", "total"],
+            ],
+        )
+
+    @mock.patch.object(sys, "stdout", new_callable=io.StringIO)
+    def test_clean_virtualenvs_dry_run_keep(self, mock_stdout: io.StringIO) -> None:
+        """Tests dry runs show which venvs would be kept."""
+        clean_venvs.clean_virtualenvs(
+            virtualenv_dir=self.virtualenv_dir,
+            symlink_name="Python",
+            dry_run=True,
+            verbose=False,
+            keep=2,
+        )
+        self.assertEqual(len(list(self.virtualenv_dir.glob("Python-*"))), 4)
+        self.assertEqual(
+            mock_stdout.getvalue(),
+            f"[DRY RUN] Would delete directory: {self.venv(23)}\n",
+        )
+
+    @mock.patch.object(sys, "stdout", new_callable=io.StringIO)
+    def test_clean_virtualenvs_dry_run_report(self, mock_stdout: io.StringIO) -> None:
+        """Tests dry runs report sizes without writing the size cache."""
+        clean_venvs.clean_virtualenvs(
+            virtualenv_dir=self.virtualenv_dir,
+            symlink_name="Python",
+            dry_run=True,
+            verbose=False,
+            report=True,
+        )
+        self.assertIn("inodes  total", mock_stdout.getvalue())
+        self.assertFalse(self.cache_path.exists())
+
+
+class TestSweep(fake_filesystem_unittest.TestCase):
+    """Tests for cleaning up many virtualenv directories."""
+
+    @typing.override
+    def setUp(self) -> None:
+        """Set up fake filesystem."""
+        self.setUpPyfakefs()
+
+    def make_virtualenv_dir(self, virtualenv_dir: pathlib.Path) -> None:
+        """Creates a virtualenv directory with an active and a stale venv."""
+        os.makedirs(virtualenv_dir / "Python-2026-06-26")
+        os.makedirs(virtualenv_dir / "Python-2026-06-25")
+        os.symlink("Python-2026-06-26", virtualenv_dir / "Python")
+
+    def test_path_resolver(self) -> None:
+        """Tests resolving relative and absolute symlinks, and '..'."""
+        os.makedirs("/real/a/b")
+        os.symlink("/real/a", "/abs")
+        os.symlink("a/b", "/real/rel")
+        os.symlink("../real/a/../a", "/up")
+        os.makedirs("/cwd")
+        os.chdir("/cwd")
+        resolver = clean_venvs.PathResolver()
+        for path, expected in [
+            ("/real/a/b", "/real/a/b"),
+            ("/abs/b", "/real/a/b"),
+            ("/real/rel", "/real/a/b"),
+            ("/real/rel/..", "/real/a"),
+            ("/up/b", "/real/a/b"),
+            ("/", "/"),
+            ("../abs", "/real/a"),
+        ]:
+            with self.subTest(path=path):
+                self.assertEqual(
+                    resolver.resolve(pathlib.Path(path)), pathlib.Path(expected)
+                )
+
+    def test_path_resolver_cached(self) -> None:
+        """Tests each path is only looked up once."""
+        os.makedirs("/real/a/b")
+        os.symlink("/real/a", "/abs")
+        resolver = clean_venvs.PathResolver()
+        resolver.resolve(pathlib.Path("/abs/b"))
+        with mock.patch.object(os, "readlink") as mock_readlink:
+            self.assertEqual(
+                resolver.resolve(pathlib.Path("/abs")), pathlib.Path("/real/a")
+            )
+        mock_readlink.assert_not_called()
+
+    def test_path_resolver_errors(self) -> None:
+        """Tests missing paths and symlink loops raise errors."""
+        os.symlink("/missing", "/broken")
+        os.symlink("/loop2", "/loop1")
+        os.symlink("/loop1", "/loop2")
+        resolver = clean_venvs.PathResolver()
+        with self.assertRaises(FileNotFoundError):
+            resolver.resolve(pathlib.Path("/broken"))
+        with self.assertRaises(FileNotFoundError):
+            resolver.resolve(pathlib.Path("/missing"))
+        with self.assertRaisesRegex(OSError, "/loop1"):
+            resolver.resolve(pathlib.Path("/loop1"))
+
+    def test_expand_directories(self) -> None:
+        """Tests expanding home directories and globs."""
+        for directory in ["/home/a/venvs", "/home/b/venvs", "/root/venvs"]:
+            os.makedirs(directory)
+        with mock.patch.dict(os.environ, {"HOME": "/root"}):
+            self.assertEqual(
+                clean_venvs.expand_directories(
+                    ["/home/*/venvs", "~/venvs", "/home/a/venvs", "/missing/*"]
+                ),
+                [
+                    pathlib.Path("/home/a/venvs"),
+                    pathlib.Path("/home/b/venvs"),
+                    pathlib.Path("/root/venvs"),
+                    pathlib.Path("/missing/*"),
+                ],
+            )
+
+    @mock.patch.object(sys, "stderr", new_callable=io.StringIO)
+    @mock.patch.object(sys, "stdout", new_callable=io.StringIO)
+    def test_sweep(self, mock_stdout: io.StringIO, mock_stderr: io.StringIO) -> None:
+        """Tests every directory is cleaned up, and failures are reported."""
+        directories = [pathlib.Path(f"/home/{user}/venvs") for user in "ab"]
+        for directory in directories:
+            self.make_virtualenv_dir(directory)
+        status = clean_venvs.sweep(
+            [*directories, pathlib.Path("/missing")],
+            symlink_name="Python",
+            dry_run=False,
+            verbose=False,
+            jobs=1,
+        )
+        self.assertEqual(status, 1)
+        for directory in directories:
+            self.assertEqual(
+                sorted(p.name for p in directory.iterdir()),
+                ["Python", "Python-2026-06-26"],
+            )
+        output = mock_stdout.getvalue()
+        self.assertIn("/home/a/venvs: reclaimed 0.0 B and 1 inodes\n", output)
+        self.assertIn("/home/b/venvs: reclaimed 0.0 B and 1 inodes\n", output)
+        self.assertIn("/missing: failed\n", output)
+        self.assertIn("3 directories: reclaimed 0.0 B and 2 inodes, 1 failed.", output)
+        self.assertIn("Error: Directory not found: /missing", mock_stderr.getvalue())
+
+    @mock.patch.object(sys, "stderr", new_callable=io.StringIO)
+    @mock.patch.object(sys, "stdout", new_callable=io.StringIO)
+    def test_sweep_reports_in_order(
+        self, mock_stdout: io.StringIO, mock_stderr: io.StringIO
+    ) -> None:
+        """Tests reports are printed in order, and any OSError is a failure."""
+        directories = [pathlib.Path(f"/venvs/{name}") for name in "abc"]
+        second_done = threading.Event()
+
+        def fake_clean(
+            virtualenv_dir: pathlib.Path, file: io.StringIO, **_: object
+        ) -> clean_venvs.DiskUsage:
+            if virtualenv_dir == directories[0]:
+                # Finish after the second directory.
+                second_done.wait(timeout=10)
+            print(f"report for {virtualenv_dir}", file=file)
+            if virtualenv_dir == directories[1]:
+                second_done.set()
+            if virtualenv_dir == directories[2]:
+                raise PermissionError(f"Permission denied: {virtualenv_dir}")
+            return clean_venvs.DiskUsage(inodes=1)
+
+        with mock.patch.object(clean_venvs, "clean_virtualenvs", new=fake_clean):
+            status = clean_venvs.sweep(
+                directories,
+                symlink_name="Python",
+                dry_run=False,
+                verbose=False,
+                jobs=3,
+                report=True,
+            )
+        self.assertEqual(status, 1)
+        self.assertEqual(
+            mock_stdout.getvalue().splitlines()[:3],
+            [f"report for {directory}" for directory in directories],
+        )
+        self.assertIn("/venvs/c: failed\n", mock_stdout.getvalue())
+        self.assertIn("Error: Permission denied: /venvs/c", mock_stderr.getvalue())
+
+    @mock.patch.object(sys, "stdout", new_callable=io.StringIO)
+    def test_sweep_one_directory(self, mock_stdout: io.StringIO) -> None:
+        """Tests the summary is only printed for more than one directory."""
+        directory = pathlib.Path("/venvs")
+        self.make_virtualenv_dir(directory)
+        status = clean_venvs.sweep(
+            [directory],
+            symlink_name="Python",
+            dry_run=True,
+            verbose=False,
+            jobs=1,
+        )
+        self.assertEqual(status, 0)
+        self.assertEqual(
+            mock_stdout.getvalue(),
+            "[DRY RUN] Would delete directory: /venvs/Python-2026-06-25\n",
+        )
+
+    @mock.patch.object(sys, "stdout", new_callable=io.StringIO)
+    def test_sweep_output_in_order(self, mock_stdout: io.StringIO) -> None:
+        """Tests progress from concurrent directories doesn't interleave."""
+        directories = [pathlib.Path(f"/home/{user}/venvs") for user in "ab"]
+        for directory in directories:
+            self.make_virtualenv_dir(directory)
+        second_done = threading.Event()
+        remove_tree = clean_venvs.remove_tree
+
+        def slow_remove_tree(path: pathlib.Path) -> clean_venvs.DiskUsage:
+            if path.parent == directories[0]:
+                # Finish after the second directory.
+                second_done.wait(timeout=10)
+            reclaimed = remove_tree(path)
+            if path.parent == directories[1]:
+                second_done.set()
+            return reclaimed
+
+        with mock.patch.object(clean_venvs, "remove_tree", new=slow_remove_tree):
+            status = clean_venvs.sweep(
+                directories,
+                symlink_name="Python",
+                dry_run=False,
+                verbose=True,
+                jobs=2,
+            )
+        self.assertEqual(status, 0)
+        expected: list[str] = []
+        for directory in directories:
+            expected += [
+                f"Active venv resolved to: {directory}/Python-2026-06-26",
+                f"Keeping active venv directory: {directory}/Python-2026-06-26",
+                f"Deleting directory: {directory}/Python-2026-06-25",
+                f"Deleted directory: {directory}/Python-2026-06-25 "
+                + "(0.0 B, 1 inodes)",
+                "Reclaimed 0.0 B and 1 inodes from 1 directories",
+            ]
+        self.assertEqual(
+            [line.partition(" in ")[0] for line in mock_stdout.getvalue().splitlines()],
+            [
+                *expected,
+                "/home/a/venvs: reclaimed 0.0 B and 1 inodes",
+                "/home/b/venvs: reclaimed 0.0 B and 1 inodes",
+                "2 directories: reclaimed 0.0 B and 2 inodes, 0 failed.",
+            ],
+        )
+
+    def test_sweep_divides_jobs(self) -> None:
+        """Tests the jobs are shared between the directories."""
+        directories = [pathlib.Path(f"/venvs/{name}") for name in "abc"]
+        for jobs, expected in [(8, 2), (2, 1), (1, 1)]:
+            with self.subTest(jobs=jobs):
+                with mock.patch.object(
+                    clean_venvs,
+                    "clean_virtualenvs",
+                    return_value=clean_venvs.DiskUsage(),
+                ) as mock_clean:
+                    _ = clean_venvs.sweep(
+                        directories,
+                        symlink_name="Python",
+                        dry_run=False,
+                        verbose=False,
+                        jobs=jobs,
+                    )
+                self.assertEqual(
+                    [call.kwargs["jobs"] for call in mock_clean.call_args_list],
+                    [expected] * len(directories),
+                )
+
+
+class TestDedupe(fake_filesystem_unittest.TestCase):
+    """Tests for hard linking identical files in venvs."""
+
+    virtualenv_dir: pathlib.Path = pathlib.Path("/fake/virtualenv")
+    store_dir: pathlib.Path = virtualenv_dir / clean_venvs.STORE_DIR_NAME
+
+    @typing.override
+    def setUp(self) -> None:
+        """Set up fake filesystem."""
+        self.setUpPyfakefs()
+        for day in range(24, 27):
+            package = self.site_packages(day) / "package"
+            os.makedirs(package)
+            (package / "__init__.py").write_text("")
+            (package / "same.py").write_text("same")
+            (package / "unique.py").write_text(f"day {day}")
+            (self.venv(day) / "pyvenv.cfg").write_text("same")
+            os.utime(self.venv(day), (day * 86400, day * 86400))
+        os.symlink("Python-2026-06-26", self.virtualenv_dir / "Python")
+
+    def venv(self, day: int) -> pathlib.Path:
+        """Returns the path of a venv created in setUp."""
+        return self.virtualenv_dir / f"Python-2026-06-{day}"
+
+    def site_packages(self, day: int) -> pathlib.Path:
+        """Returns the site-packages directory of a venv created in setUp."""
+        return self.venv(day) / "lib/python3.13/site-packages"
+
+    def inode(self, day: int, name: str) -> int:
+        """Returns the inode of a file in a venv created in setUp."""
+        return (self.site_packages(day) / "package" / name).lstat().st_ino
+
+    def store_files(self) -> list[str]:
+        """Returns the names of the files in the store."""
+        return sorted(path.name for path in self.store_dir.glob("*/*"))
+
+    def test_dedupe_venvs(self) -> None:
+        """Tests identical files are hard linked to the store."""
+        saved = clean_venvs.dedupe_venvs(
+            [self.venv(25), self.venv(26)],
+            self.virtualenv_dir,
+            jobs=1,
+            dry_run=False,
+            verbose=False,
+        )
+        self.assertEqual(saved.inodes, 1)
+        self.assertEqual(self.inode(25, "same.py"), self.inode(26, "same.py"))
+        self.assertNotEqual(self.inode(25, "unique.py"), self.inode(26, "unique.py"))
+        self.assertNotEqual(self.inode(24, "same.py"), self.inode(26, "same.py"))
+        # Empty files and files outside site-packages are left alone.
+        self.assertNotEqual(
+            self.inode(25, "__init__.py"), self.inode(26, "__init__.py")
+        )
+        self.assertEqual((self.venv(26) / "pyvenv.cfg").lstat().st_nlink, 1)
+        self.assertEqual(
+            (self.site_packages(26) / "package/same.py").read_text(), "same"
+        )
+        self.assertEqual(len(self.store_files()), 3)
+        self.assertEqual(
+            len(
+                clean_venvs.read_hash_cache(
+                    self.virtualenv_dir / clean_venvs.HASH_CACHE_NAME
+                )
+            ),
+            4,
+        )
+
+        # Everything is already deduplicated, and the hashes are cached.
+        with mock.patch.object(clean_venvs, "hash_file") as mock_hash_file:
+            saved = clean_venvs.dedupe_venvs(
+                [self.venv(25), self.venv(26)],
+                self.virtualenv_dir,
+                jobs=1,
+                dry_run=False,
+                verbose=False,
+            )
+        mock_hash_file.assert_not_called()
+        self.assertEqual(saved, clean_venvs.DiskUsage())
+
+    def test_dedupe_venvs_dry_run(self) -> None:
+        """Tests a dry run only counts the files that would be linked."""
+        saved = clean_venvs.dedupe_venvs(
+            [self.venv(24), self.venv(25), self.venv(26)],
+            self.virtualenv_dir,
+            jobs=1,
+            dry_run=True,
+            verbose=False,
+        )
+        self.assertEqual(saved.inodes, 2)
+        self.assertFalse(self.store_dir.exists())
+        self.assertFalse((self.virtualenv_dir / clean_venvs.HASH_CACHE_NAME).exists())
+        self.assertNotEqual(self.inode(25, "same.py"), self.inode(26, "same.py"))
+
+    def test_dedupe_venvs_prunes_store(self) -> None:
+        """Tests files that no venv uses are deleted from the store."""
+        clean_venvs.dedupe_venvs(
+            [self.venv(25), self.venv(26)],
+            self.virtualenv_dir,
+            jobs=1,
+            dry_run=False,
+            verbose=False,
+        )
+        shutil.rmtree(self.venv(25))
+        saved = clean_venvs.dedupe_venvs(
+            [self.venv(26)],
+            self.virtualenv_dir,
+            jobs=1,
+            dry_run=False,
+            verbose=False,
+        )
+        # Only the store's copy of unique.py from the deleted venv is freed.
+        self.assertEqual(saved.inodes, 1)
+        self.assertEqual(len(self.store_files()), 2)
+
+    def test_dedupe_venvs_different_modes(self) -> None:
+        """Tests files with different permissions are not shared."""
+        (self.site_packages(25) / "package/same.py").chmod(0o600)
+        (self.site_packages(26) / "package/same.py").chmod(0o644)
+        saved = clean_venvs.dedupe_venvs(
+            [self.venv(25), self.venv(26)],
+            self.virtualenv_dir,
+            jobs=1,
+            dry_run=False,
+            verbose=False,
+        )
+        self.assertEqual(saved, clean_venvs.DiskUsage())
+        self.assertNotEqual(self.inode(25, "same.py"), self.inode(26, "same.py"))
+
+    def test_dedupe_venvs_changed_files(self) -> None:
+        """Tests files that change while deduplicating are left alone."""
+        with mock.patch.object(clean_venvs, "unchanged", return_value=False):
+            saved = clean_venvs.dedupe_venvs(
+                [self.venv(25), self.venv(26)],
+                self.virtualenv_dir,
+                jobs=1,
+                dry_run=False,
+                verbose=False,
+            )
+        self.assertEqual(saved, clean_venvs.DiskUsage())
+        self.assertEqual(self.store_files(), [])
+
+        # same.py is linked into the store, then changes before it is shared.
+        with mock.patch.object(
+            clean_venvs, "unchanged", side_effect=[True, True, False, True]
+        ):
+            saved = clean_venvs.dedupe_venvs(
+                [self.venv(25), self.venv(26)],
+                self.virtualenv_dir,
+                jobs=1,
+                dry_run=False,
+                verbose=False,
+            )
+        self.assertEqual(saved, clean_venvs.DiskUsage())
+        self.assertEqual(len(self.store_files()), 3)
+        self.assertNotEqual(self.inode(25, "same.py"), self.inode(26, "same.py"))
+
+    @mock.patch.object(sys, "stdout", new_callable=io.StringIO)
+    def test_dedupe_venvs_errors(self, mock_stdout: io.StringIO) -> None:
+        """Tests files that can't be linked or read are skipped."""
+        for verbose in (True, False):
+            with (
+                mock.patch.object(os, "link", side_effect=PermissionError("denied")),
+                mock.patch.object(clean_venvs, "hash_file", side_effect=["a", None]),
+            ):
+                saved = clean_venvs.dedupe_venvs(
+                    [self.venv(26)],
+                    self.virtualenv_dir,
+                    jobs=1,
+                    dry_run=False,
+                    verbose=verbose,
+                )
+            self.assertEqual(saved, clean_venvs.DiskUsage())
+        # Only same.py is printed, because unique.py couldn't be hashed.
+        self.assertEqual(
+            mock_stdout.getvalue(),
+            f"Not deduplicating {self.site_packages(26)}/package/same.py: denied\n",
+        )
+
+    def test_link_file(self) -> None:
+        """Tests replacing a file with a hard link, unless it changed."""
+        source = self.site_packages(26) / "package/same.py"
+        path = self.site_packages(25) / "package/same.py"
+        st = path.lstat()
+        self.assertTrue(clean_venvs.link_file(source, path, st))
+        self.assertTrue(path.samefile(source))
+        self.assertEqual(
+            sorted(p.name for p in path.parent.iterdir()),
+            ["__init__.py", "same.py", "unique.py"],
+        )
+
+        path = self.site_packages(24) / "package/same.py"
+        st = path.lstat()
+        os.utime(path, ns=(1, 1))
+        self.assertFalse(clean_venvs.link_file(source, path, st))
+        self.assertFalse(path.samefile(source))
+        path.unlink()
+        self.assertFalse(clean_venvs.link_file(source, path, st))
+        self.assertEqual(
+            sorted(p.name for p in path.parent.iterdir()),
+            ["__init__.py", "unique.py"],
+        )
+
+    def test_hash_caches(self) -> None:
+        """Tests reading and hashing files that are missing or corrupt."""
+        cache_path = self.virtualenv_dir / clean_venvs.HASH_CACHE_NAME
+        self.assertIsNone(clean_venvs.hash_file(cache_path))
+        self.assertEqual(clean_venvs.read_hash_cache(cache_path), {})
+        cache_path.write_text("[]")
+        self.assertEqual(clean_venvs.read_hash_cache(cache_path), {})
+        cache_path.write_text('{"1:2:3": "abc", "4:5:6": 7}')
+        self.assertEqual(clean_venvs.read_hash_cache(cache_path), {"1:2:3": "abc"})
+
+    @mock.patch.object(sys, "stdout", new_callable=io.StringIO)
+    def test_clean_virtualenvs_dedupe(self, mock_stdout: io.StringIO) -> None:
+        """Tests the active and kept venvs are deduplicated after deleting."""
+        reclaimed = clean_venvs.clean_virtualenvs(
+            virtualenv_dir=self.virtualenv_dir,
+            symlink_name="Python",
+            dry_run=True,
+            verbose=False,
+            keep=1,
+            dedupe=True,
+        )
+        self.assertEqual(reclaimed, clean_venvs.DiskUsage())
+        self.assertEqual(
+            mock_stdout.getvalue(),
+            "[DRY RUN] Would delete directory: /fake/virtualenv/Python-2026-06-24\n"
+            + "[DRY RUN] Would save 4.0 KiB and 1 inodes by deduplicating 2 venvs in "
+            + "/fake/virtualenv.\n",
+        )
+        self.assertFalse(self.store_dir.exists())
+
+        mock_stdout.truncate(0)
+        mock_stdout.seek(0)
+        reclaimed = clean_venvs.clean_virtualenvs(
+            virtualenv_dir=self.virtualenv_dir,
+            symlink_name="Python",
+            dry_run=False,
+            verbose=False,
+            keep=1,
+            dedupe=True,
+        )
+        self.assertFalse(self.venv(24).exists())
+        self.assertEqual(self.inode(25, "same.py"), self.inode(26, "same.py"))
+        self.assertEqual(reclaimed.inodes, 9 + 1)
+        self.assertIn(
+            "Saved 4.0 KiB and 1 inodes by deduplicating 2 venvs in /fake/virtualenv.\n",
+            mock_stdout.getvalue(),
+        )
+
+
+class TestRemoveTreesRealFilesystem(unittest.TestCase):
+    """Tests deleting directories in parallel, which pyfakefs can't fake."""
+
+    @mock.patch.object(sys, "stdout", new_callable=io.StringIO)
+    def test_parallel(self, mock_stdout: io.StringIO) -> None:
+        """Tests deleting many venvs at once."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            virtualenv_dir = pathlib.Path(tmpdir)
+            for day in range(20, 26):
+                site_packages = virtualenv_dir / f"Python-2026-06-{day}/lib"
+                os.makedirs(site_packages)
+                for i in range(10):
+                    (site_packages / f"{i}.py").write_text("x" * 4096)
+            os.symlink("Python-2026-06-25", virtualenv_dir / "Python")
+
+            reclaimed = clean_venvs.clean_virtualenvs(
+                virtualenv_dir=virtualenv_dir,
+                symlink_name="Python",
+                dry_run=False,
+                verbose=False,
+                jobs=4,
+            )
+
+            self.assertEqual(
+                sorted(p.name for p in virtualenv_dir.iterdir()),
+                ["Python", "Python-2026-06-25"],
+            )
+        # Each venv has 2 directories and 10 files.
+        self.assertEqual(reclaimed.inodes, 5 * 12)
+        self.assertGreaterEqual(reclaimed.size, 5 * 10 * 4096)
+        self.assertIn("inodes from 5 directories in", mock_stdout.getvalue())
+
+    @mock.patch.object(sys, "stdout", new_callable=io.StringIO)
+    def test_quota(self, _mock_stdout: io.StringIO) -> None:
+        """Tests recent venvs are kept while they fit in the quota."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            virtualenv_dir = pathlib.Path(tmpdir)
+            for day in range(23, 27):
+                venv = virtualenv_dir / f"Python-2026-06-{day}"
+                os.makedirs(venv)
+                (venv / "data").write_bytes(b"x" * 1024 * 1024)
+                os.utime(venv, (day * 86400, day * 86400))
+            os.symlink("Python-2026-06-26", virtualenv_dir / "Python")
+
+            clean_venvs.clean_virtualenvs(
+                virtualenv_dir=virtualenv_dir,
+                symlink_name="Python",
+                dry_run=False,
+                verbose=False,
+                jobs=2,
+                quota=clean_venvs.parse_size("2.5M"),
+            )
+
+            self.assertEqual(
+                sorted(p.name for p in virtualenv_dir.glob("Python-*")),
+                ["Python-2026-06-25", "Python-2026-06-26"],
+            )
+
+    @mock.patch.object(sys, "stdout", new_callable=io.StringIO)
+    def test_background_command_empties_trash(self, _mock_stdout: io.StringIO) -> None:
+        """Tests the background command deletes everything in the trash."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            virtualenv_dir = pathlib.Path(tmpdir)
+            trash_dir = virtualenv_dir / clean_venvs.TRASH_DIR_NAME
+            for day in range(20, 23):
+                venv = virtualenv_dir / f"Python-2026-06-{day}"
+                os.makedirs(venv / "lib")
+                clean_venvs.move_to_trash(venv, trash_dir)
+            subprocess.run(
+                clean_venvs.background_command(trash_dir),
+                check=True,
+                capture_output=True,
+            )
+            self.assertEqual(list(trash_dir.iterdir()), [])
+
+    @mock.patch.object(sys, "stdout", new_callable=io.StringIO)
+    def test_dedupe(self, _mock_stdout: io.StringIO) -> None:
+        """Tests deduplicating reports the space saved."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            virtualenv_dir = pathlib.Path(tmpdir)
+            venvs: list[pathlib.Path] = []
+            for day in range(24, 27):
+                venv = virtualenv_dir / f"Python-2026-06-{day}"
+                site_packages = venv / "lib/python3.13/site-packages"
+                os.makedirs(site_packages)
+                (site_packages / "data").write_bytes(b"x" * 1024 * 1024)
+                venvs.append(venv)
+
+            saved = clean_venvs.dedupe_venvs(
+                venvs, virtualenv_dir, jobs=2, dry_run=False, verbose=False
+            )
+
+            self.assertEqual(saved.inodes, 2)
+            self.assertGreaterEqual(saved.size, 2 * 1024 * 1024)
+            data = [venv / "lib/python3.13/site-packages/data" for venv in venvs]
+            self.assertEqual(data[0].lstat().st_nlink, 4)
+            self.assertTrue(data[0].samefile(data[2]))
+
+
 class TestMain(unittest.TestCase):
     """Tests for the main function."""
 
-    @mock.patch.object(clean_venvs, "clean_virtualenvs")
+    @mock.patch.object(
+        clean_venvs, "clean_virtualenvs", return_value=clean_venvs.DiskUsage()
+    )
     def test_main_success(self, mock_clean: mock.Mock) -> None:
         """Tests main with default arguments (successful path)."""
         ret_val = clean_venvs.main(["clean_venvs.py"])
@@ -310,9 +1307,30 @@ class TestMain(unittest.TestCase):
             symlink_name="Python",
             dry_run=False,
             verbose=False,
+            jobs=clean_venvs.DEFAULT_JOBS,
+            background=False,
+            keep=None,
+            quota=None,
+            report=False,
+            dedupe=False,
+            resolver=mock.ANY,
+            file=mock.ANY,
         )
 
-    @mock.patch.object(clean_venvs, "clean_virtualenvs")
+    @mock.patch.object(clean_venvs, "empty_trash")
+    def test_main_empty_trash(self, mock_empty_trash: mock.Mock) -> None:
+        """Tests main only empties the trash with --empty-trash."""
+        with mock.patch.object(clean_venvs, "clean_virtualenvs") as mock_clean:
+            ret_val = clean_venvs.main(
+                ["clean_venvs.py", "--empty-trash", "/trash", "--jobs", "2"]
+            )
+        self.assertEqual(ret_val, 0)
+        mock_empty_trash.assert_called_once_with(pathlib.Path("/trash"), 2, False)
+        mock_clean.assert_not_called()
+
+    @mock.patch.object(
+        clean_venvs, "clean_virtualenvs", return_value=clean_venvs.DiskUsage()
+    )
     def test_main_custom_args(self, mock_clean: mock.Mock) -> None:
         """Tests main with custom arguments."""
         ret_val = clean_venvs.main(
@@ -323,6 +1341,15 @@ class TestMain(unittest.TestCase):
                 "-v",
                 "--symlink-name",
                 "python",
+                "--jobs",
+                "3",
+                "--background",
+                "--keep",
+                "2",
+                "--quota",
+                "1.5G",
+                "--report",
+                "--dedupe",
             ]
         )
         self.assertEqual(ret_val, 0)
@@ -331,6 +1358,14 @@ class TestMain(unittest.TestCase):
             symlink_name="python",
             dry_run=True,
             verbose=True,
+            jobs=3,
+            background=True,
+            keep=2,
+            quota=3 * 512 * 1024**2,
+            report=True,
+            dedupe=True,
+            resolver=mock.ANY,
+            file=mock.ANY,
         )
 
     @mock.patch.object(
@@ -346,3 +1381,30 @@ class TestMain(unittest.TestCase):
         ret_val = clean_venvs.main(["clean_venvs.py"])
         self.assertEqual(ret_val, 1)
         self.assertIn("Error: Mock error message", mock_stderr.getvalue())
+
+    @mock.patch.object(
+        clean_venvs, "empty_trash", side_effect=FileNotFoundError("No trash")
+    )
+    @mock.patch.object(sys, "stderr", new_callable=io.StringIO)
+    def test_main_empty_trash_failure(
+        self, mock_stderr: io.StringIO, _mock_empty_trash: mock.Mock
+    ) -> None:
+        """Tests main handling of a missing trash directory."""
+        ret_val = clean_venvs.main(["clean_venvs.py", "--empty-trash", "/trash"])
+        self.assertEqual(ret_val, 1)
+        self.assertIn("Error: No trash", mock_stderr.getvalue())
+
+    @mock.patch.object(sys, "stderr", new_callable=io.StringIO)
+    def test_main_invalid_jobs(self, mock_stderr: io.StringIO) -> None:
+        """Tests that --jobs must be positive."""
+        for jobs in ["0", "-1"]:
+            with self.subTest(jobs=jobs), self.assertRaises(SystemExit):
+                clean_venvs.main(["clean_venvs.py", "--jobs", jobs])
+        self.assertIn("invalid positive_int value: '0'", mock_stderr.getvalue())
+
+    @mock.patch.object(sys, "stderr", new_callable=io.StringIO)
+    def test_main_invalid_keep(self, mock_stderr: io.StringIO) -> None:
+        """Tests that --keep must not be negative."""
+        with self.assertRaises(SystemExit):
+            clean_venvs.main(["clean_venvs.py", "--keep", "-1"])
+        self.assertIn("invalid non_negative_int value: '-1'", mock_stderr.getvalue())
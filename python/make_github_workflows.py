@@ -2,64 +2,128 @@
 """Tool for generating GitHub Actions workflows."""
 
 import argparse as argparse
+import collections
+import concurrent.futures
+import copy
 import dataclasses
+import enum
+import functools
 import get_git_root
-import os
+import os as os
 import pathlib as pathlib
 import re
+import script_utils
 import subprocess as subprocess
+import sys as sys
+import time as time
 import yaml as yaml
 from typing import cast, override, TypeAlias
 
 UpdateStanza: TypeAlias = dict[str, str | dict[str, str] | dict[str, int]]
 
+# Permissions for generated workflows, which are executable so they can update
+# themselves.
+WORKFLOW_MODE = 0o755
+# Permissions for copied configs.
+CONFIG_MODE = 0o644
+# Default number of repositories to generate workflows for at once with --repos.
+DEFAULT_JOBS = os.cpu_count() or 1
+# The contents of templates read by read_template, keyed by path.
+TEMPLATE_CACHE: dict[pathlib.Path, str] = {}
+
+
+class WriteStatus(enum.Enum):
+    """What happened when writing a file."""
+
+    CREATED = "created"
+    UPDATED = "updated"
+    UNCHANGED = "unchanged"
+
 
 @dataclasses.dataclass(frozen=True)
 class Workflow:
-    """A GitHub Actions workflow."""
+    """A GitHub Actions workflow.
+
+    Attributes:
+        template: The filename of the template in the workflows directory.
+        output: The path of the generated workflow, relative to the repository.
+        per_package: Whether the workflow's jobs run once for each directory
+            containing the ecosystem's trigger files, and only when the
+            ecosystem's source files change.
+        caches: The kinds of CACHE_STEPS to add after the checkout step.
+    """
 
     template: str
     output: str
+    per_package: bool = False
+    caches: tuple[str, ...] = ()
 
 
 @dataclasses.dataclass(frozen=True)
 class LanguageConfig:
-    """Configuration for a specific language ecosystem."""
+    """Configuration for a specific language ecosystem.
+
+    Attributes:
+        ecosystem: The dependabot package ecosystem.
+        trigger_files: Files or directories at the root of a repository that
+            show the ecosystem is used.
+        manifest_files: Files that mark the root of a package, anywhere in a
+            repository.
+        workflows: The workflows to generate for the ecosystem.
+        source_patterns: Path filters, relative to a package, for the files
+            that per-package workflows check.
+        root_source_patterns: Path filters, relative to the repository root,
+            for files that per-package workflows check, e.g. configuration
+            that is shared by every package.
+    """
 
     ecosystem: str
     trigger_files: list[str]
+    manifest_files: list[str]
     workflows: list[Workflow]
+    source_patterns: list[str] = dataclasses.field(default_factory=list)
+    root_source_patterns: list[str] = dataclasses.field(default_factory=list)
 
 
 LANGUAGE_CONFIGS = [
     LanguageConfig(
         ecosystem="gomod",
         trigger_files=["go.mod"],
+        manifest_files=["go.mod"],
         workflows=[
             Workflow(
                 "dependabot_validation.yml",
                 ".github/workflows/dependabot_validation.yml",
             ),
             Workflow(
-                "golang_pre-commit.yml", ".github/workflows/golang_pre-commit.yml"
+                "golang_pre-commit.yml",
+                ".github/workflows/golang_pre-commit.yml",
+                per_package=True,
+                caches=("go",),
             ),
         ],
+        source_patterns=["**.go", "go.mod", "go.sum"],
     ),
     LanguageConfig(
         ecosystem="cargo",
         trigger_files=["Cargo.toml"],
+        manifest_files=["Cargo.toml"],
         workflows=[
             Workflow(
                 "dependabot_validation.yml",
                 ".github/workflows/dependabot_validation.yml",
             ),
             Workflow(
-                "rust_pull_request.yml", ".github/workflows/rust_pull_request.yml"
+                "rust_pull_request.yml",
+                ".github/workflows/rust_pull_request.yml",
+                per_package=True,
+                caches=("cargo",),
             ),
             Workflow(
                 "rust_security_audit.yml", ".github/workflows/rust_security_audit.yml"
             ),
         ],
+        source_patterns=["**.rs", "Cargo.toml", "Cargo.lock"],
     ),
     LanguageConfig(
         ecosystem="pip",
@@ -74,6 +138,14 @@ LANGUAGE_CONFIGS = [
             "setup.py",
             # keep-sorted end
         ],
+        manifest_files=[
+            # keep-sorted start
+            "Pipfile",
+            "pyproject.toml",
+            "requirements.txt",
+            "setup.py",
+            # keep-sorted end
+        ],
         workflows=[
             Workflow(
                 "dependabot_validation.yml",
@@ -82,12 +154,26 @@ LANGUAGE_CONFIGS = [
             Workflow(
                 "python_pre-commit.yml",
                 ".github/workflows/python_pre-commit.yml",
+                per_package=True,
+                caches=("pip", "pre-commit"),
             ),
         ],
+        source_patterns=[
+            # keep-sorted start
+            "**.py",
+            "Pipfile",
+            "Pipfile.lock",
+            "pyproject.toml",
+            "requirements.txt",
+            "setup.py",
+            # keep-sorted end
+        ],
+        root_source_patterns=[".pre-commit-config.yaml"],
     ),
     LanguageConfig(
         ecosystem="composer",
         trigger_files=["composer.json"],
+        manifest_files=["composer.json"],
         workflows=[
             Workflow(
                 "dependabot_validation.yml",
@@ -98,6 +184,7 @@ LANGUAGE_CONFIGS = [
     LanguageConfig(
         ecosystem="npm",
         trigger_files=["package.json"],
+        manifest_files=["package.json"],
         workflows=[
             Workflow(
                 "dependabot_validation.yml",
@@ -107,6 +194,80 @@ LANGUAGE_CONFIGS = [
     ),
 ]
 
+# The ecosystems that each trigger file belongs to.
+TRIGGER_ECOSYSTEMS = {
+    trigger: [c.ecosystem for c in LANGUAGE_CONFIGS if trigger in c.trigger_files]
+    for trigger in sorted({f for c in LANGUAGE_CONFIGS for f in c.trigger_files})
+}
+# The ecosystems that each manifest file belongs to.
+MANIFEST_ECOSYSTEMS = {
+    manifest: [c.ecosystem for c in LANGUAGE_CONFIGS if manifest in c.manifest_files]
+    for manifest in sorted({f for c in LANGUAGE_CONFIGS for f in c.manifest_files})
+}
+# The C YAML loader is much faster, but PyYAML may be built without libyaml.
+YAML_LOADER = yaml.CSafeLoader if yaml.__with_libyaml__ else yaml.SafeLoader
+# The root directory in package paths.
+ROOT_PACKAGE = "."
+# Matches the runs-on line of a job, capturing its indentation.
+RUNS_ON_PATTERN = re.compile(r"^( *)runs-on:.*$", re.MULTILINE)
+# Matches a block style paths: filter, capturing its indentation.
+PATHS_PATTERN = re.compile(r"^( *)paths:\n(?:\1  - .*\n)+", re.MULTILINE)
+# Matches a list item and the lines indented under it, e.g. a step, capturing
+# its indentation.
+STEP_PATTERN = re.compile(r"^( *)- .*\n(?:\1  .*\n)*", re.MULTILINE)
+# actions/cache steps for each kind of cache, formatted with the directory the
+# job runs in and a key prefix that separates the caches of each package.
+CACHE_STEPS = {
+    "cargo": """\
+- name: Cache cargo registry and build output
+  uses: actions/cache@v4
+  with:
+    path: |
+      ~/.cargo/registry
+      ~/.cargo/git
+      {directory}/target
+    key: ${{{{ runner.os }}}}-cargo-{key_prefix}${{{{ hashFiles('**/Cargo.lock') }}}}
+    restore-keys: |
+      ${{{{ runner.os }}}}-cargo-{key_prefix}
+""",
+    "go": """\
+- name: Cache Go modules and build cache
+  uses: actions/cache@v4
+  with:
+    path: |
+      ~/go/pkg/mod
+      ~/.cache/go-build
+    key: ${{{{ runner.os }}}}-go-{key_prefix}${{{{ hashFiles('**/go.sum') }}}}
+    restore-keys: |
+      ${{{{ runner.os }}}}-go-{key_prefix}
+""",
+    "pip": """\
+- name: Cache pip downloads
+  uses: actions/cache@v4
+  with:
+    path: ~/.cache/pip
+    key: ${{{{ runner.os }}}}-pip-{key_prefix}${{{{ hashFiles('**/requirements*.txt', '**/pyproject.toml', '**/Pipfile.lock', '**/setup.py') }}}}
+    restore-keys: |
+      ${{{{ runner.os }}}}-pip-{key_prefix}
+""",
+    "pre-commit": """\
+- name: Cache pre-commit environments
+  uses: actions/cache@v4
+  with:
+    path: ~/.cache/pre-commit
+    key: ${{{{ runner.os }}}}-pre-commit-${{{{ hashFiles('.pre-commit-config.yaml') }}}}
+    restore-keys: |
+      ${{{{ runner.os }}}}-pre-commit-
+""",
+}
+# The input that sets the directory each action works in, for the actions in
+# per-package workflows; `defaults: run:` only applies to `run:` steps.
+ACTION_DIRECTORY_INPUTS = {
+    "golang/govulncheck-action": "work-dir",
+    "golangci/golangci-lint-action": "working-directory",
+    "stefanzweifel/git-auto-commit-action": "repository",
+}
+
 
 class IndentDumper(yaml.SafeDumper):
     @override
@@ -120,77 +281,494 @@ class Args(argparse.Namespace):
 
     ignored_filename: str | None
     extra_args: list[str] | None
+    repos: list[str]
+    jobs: int
 
     def __init__(
         self,
         ignored_filename: str | None = None,
         extra_args: list[str] | None = None,
+        repos: list[str] | None = None,
+        jobs: int = DEFAULT_JOBS,
     ) -> None:
         """Initializes the arguments.
 
         Args:
             ignored_filename: An optional filename that is ignored.
             extra_args: Extra arguments for a command, in the format 'command=args'.
+            repos: Roots of repositories to generate workflows for instead of
+                the current one.
+            jobs: The number of repositories to generate workflows for at once.
         """
         super().__init__()
         self.ignored_filename = ignored_filename
         self.extra_args = list(extra_args) if extra_args is not None else []
+        self.repos = list(repos) if repos is not None else []
+        self.jobs = jobs
+
+
+@dataclasses.dataclass(frozen=True)
+class RepoResult:
+    """The result of generating the workflows for a single repository.
+
+    Attributes:
+        root: The root of the repository.
+        statuses: The status of each file written, relative to root.
+        seconds: How long generating the workflows took.
+    """
+
+    root: pathlib.Path
+    statuses: dict[str, WriteStatus]
+    seconds: float
+
+
+def list_repo_files(root: pathlib.Path) -> list[str]:
+    """Lists the files in a repository that git does not ignore, in one walk.
+
+    Falls back to walking the directory with script_utils.walk_non_ignored_files
+    if root is not a git repository or git is not installed.
+
+    Args:
+        root: The root of the repository.
+
+    Returns:
+        Paths of the files, relative to root.
+    """
+    try:
+        return script_utils.get_git_files(root)
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return script_utils.walk_non_ignored_files(root)
+
+
+def find_packages(root: pathlib.Path) -> dict[str, frozenset[str]]:
+    """Finds every package directory, for each ecosystem.
+
+    Manifest files are found anywhere in the repository, so nested packages in
+    a monorepo are found. The root of the repository is a package if it has a
+    trigger file (e.g. a manifest file, pyrefly.toml or python/), even if there
+    are also nested packages. Manifest files in a trigger directory at the root
+    (e.g. python/pyproject.toml) belong to the root package.
+
+    Args:
+        root: The root of the repository.
+
+    Returns:
+        For each ecosystem in use, its package directories relative to root;
+        the root is ROOT_PACKAGE.
+    """
+    packages: dict[str, set[str]] = {}
+    for f in list_repo_files(root):
+        directory, _, name = f.rpartition("/")
+        triggered = TRIGGER_ECOSYSTEMS.get(f.partition("/")[0], [])
+        for ecosystem in triggered:
+            packages.setdefault(ecosystem, set()).add(ROOT_PACKAGE)
+        for ecosystem in MANIFEST_ECOSYSTEMS.get(name, []):
+            if ecosystem not in triggered:
+                packages.setdefault(ecosystem, set()).add(directory or ROOT_PACKAGE)
+    return {ecosystem: frozenset(dirs) for ecosystem, dirs in packages.items()}
+
+
+def quote_yaml(text: str) -> str:
+    """Quotes text as a single-quoted YAML scalar.
+
+    Args:
+        text: The text to quote.
+
+    Returns:
+        The quoted text.
+    """
+    return "'{}'".format(text.replace("'", "''"))
+
+
+def package_paths(
+    patterns: list[str], packages: frozenset[str], root_paths: list[str]
+) -> list[str]:
+    """Builds the paths: filter for a per-package workflow.
+
+    Args:
+        patterns: Path filters relative to a package, e.g. '**.go'.
+        packages: The package directories, relative to the repository root.
+        root_paths: Path filters relative to the repository root, which are
+            included once, e.g. .pre-commit-config.yaml and the path of the
+            workflow so changes to the workflow run it.
+
+    Returns:
+        The path filters relative to the repository root.
+    """
+    paths: list[str] = []
+    for package in sorted(packages):
+        prefix = "" if package == ROOT_PACKAGE else f"{package}/"
+        paths.extend(prefix + pattern for pattern in patterns)
+    paths.extend(root_paths)
+    return list(dict.fromkeys(paths))
+
+
+def set_path_filters(template: str, paths: list[str]) -> str:
+    """Replaces every paths: filter in a workflow.
+
+    Args:
+        template: The workflow template.
+        paths: The path filters.
+
+    Returns:
+        The workflow with the new path filters.
+    """
+
+    def replace_paths(match: re.Match[str]) -> str:
+        """Replaces one paths: filter.
+
+        Args:
+            match: The match of PATHS_PATTERN.
+
+        Returns:
+            The paths: filter with the new path filters, at the same indentation.
+        """
+        indent = match.group(1)
+        items = "".join(f"{indent}  - {quote_yaml(path)}\n" for path in paths)
+        return f"{indent}paths:\n{items}"
+
+    return PATHS_PATTERN.sub(replace_paths, template)
+
+
+def add_cache_steps(template: str, caches: tuple[str, ...], matrix: bool) -> str:
+    """Adds actions/cache steps after the checkout step of every job.
+
+    The caches are keyed on hashes of lockfiles, so they must be restored after
+    the repository is checked out; jobs without a checkout step are unchanged.
+
+    Args:
+        template: The workflow template.
+        caches: The kinds of CACHE_STEPS to add.
+        matrix: Whether the jobs run in a matrix over packages, so each package
+            needs separate build output caches.
+
+    Returns:
+        The workflow with the cache steps.
+    """
+    if not caches:
+        return template
+    directory, key_prefix = (
+        ("${{ matrix.package }}", "${{ matrix.package }}-") if matrix else (".", "")
+    )
+    steps = [
+        CACHE_STEPS[cache].format(directory=directory, key_prefix=key_prefix)
+        for cache in caches
+    ]
+
+    def add_steps(match: re.Match[str]) -> str:
+        """Adds the cache steps after a step if it is the checkout step.
+
+        Args:
+            match: The match of STEP_PATTERN.
+
+        Returns:
+            The step, followed by the cache steps if it checks out the
+            repository.
+        """
+        step = match.group(0)
+        if "uses: actions/checkout@" not in step:
+            return step
+        indent = match.group(1)
+        added = [
+            "".join(f"{indent}{line}\n" for line in text.splitlines()) for text in steps
+        ]
+        return "\n".join([step, *added])
+
+    return STEP_PATTERN.sub(add_steps, template)
+
+
+def add_package_matrix(template: str, packages: frozenset[str]) -> str:
+    """Runs every job in a workflow once for each package.
+
+    Each job gets a matrix over the package directories, runs its `run:` steps
+    and the actions in ACTION_DIRECTORY_INPUTS in the package directory, and
+    has a separate concurrency group for each package so the jobs don't cancel
+    each other.
+
+    Args:
+        template: The workflow template.
+        packages: The package directories, relative to the repository root.
+
+    Returns:
+        The workflow with a package matrix.
+    """
+    matrix = ", ".join(quote_yaml(package) for package in sorted(packages))
+
+    def add_matrix(match: re.Match[str]) -> str:
+        """Adds the package matrix and working directory after runs-on.
+
+        Args:
+            match: The match of RUNS_ON_PATTERN.
+
+        Returns:
+            The runs-on line followed by the strategy and defaults of the job.
+        """
+        indent = match.group(1)
+        return "\n".join(
+            [
+                match.group(0),
+                f"{indent}strategy:",
+                f"{indent}  fail-fast: false",
+                f"{indent}  matrix:",
+                f"{indent}    package: [{matrix}]",
+                f"{indent}defaults:",
+                f"{indent}  run:",
+                f"{indent}    working-directory: ${{{{ matrix.package }}}}",
+            ]
+        )
+
+    def add_directory_input(match: re.Match[str]) -> str:
+        """Passes the package directory to a step using a known action.
+
+        Args:
+            match: The match of STEP_PATTERN.
+
+        Returns:
+            The step, with the input from ACTION_DIRECTORY_INPUTS added if it
+            uses one of those actions.
+        """
+        step = match.group(0)
+        indent = match.group(1)
+        for action, name in ACTION_DIRECTORY_INPUTS.items():
+            if f"uses: {action}@" not in step:
+                continue
+            with_line = f"{indent}  with:\n"
+            input_line = f"{indent}    {name}: ${{{{ matrix.package }}}}\n"
+            if with_line in step:
+                return step.replace(with_line, with_line + input_line, 1)
+            return step + with_line + input_line
+        return step
+
+    template = STEP_PATTERN.sub(add_directory_input, template)
+    return RUNS_ON_PATTERN.sub(add_matrix, template).replace(
+        "group: ${{ github.workflow }}-",
+        "group: ${{ github.workflow }}-${{ matrix.package }}-",
+    )
+
+
+def read_template(path: pathlib.Path) -> str:
+    """Reads a template, once per process.
+
+    Args:
+        path: The path to the template.
+
+    Returns:
+        The contents of the template.
+    """
+    if path not in TEMPLATE_CACHE:
+        TEMPLATE_CACHE[path] = path.read_text(encoding="utf-8")
+    return TEMPLATE_CACHE[path]
+
+
+def read_all_templates(script_file: str) -> dict[pathlib.Path, str]:
+    """Reads every template, so they can be shared with worker processes.
+
+    Args:
+        script_file: The path to the script calling this function.
+
+    Returns:
+        The contents of every template, keyed by path.
+    """
+    script_dir = pathlib.Path(script_file).resolve().parent
+    paths = [script_dir / "zizmor.yaml", *(script_dir / "workflows").iterdir()]
+    return {path: read_template(path) for path in paths if path.is_file()}
 
 
-def escape_for_env_s(text: str) -> str:
-    r"""Escapes a string for use within an env -S shebang.
+def prime_template_cache(templates: dict[pathlib.Path, str]) -> None:
+    """Fills TEMPLATE_CACHE in a worker process with templates read by the parent.
 
-    Replace spaces with \_ for env -S compatibility in shebangs.
-    env -S will treat \_ as a space when inside quotes.
-    We also need to escape double quotes and backslashes.
+    Args:
+        templates: The contents of templates, keyed by path.
+    """
+    TEMPLATE_CACHE.update(templates)
+
+
+def mapping_value(node: yaml.Node | None, key: str) -> yaml.Node | None:
+    """Finds the value of a key in a composed YAML mapping.
 
     Args:
-        text: The string to escape.
+        node: The node, which may not be a mapping.
+        key: The key to look for.
 
     Returns:
-        The escaped string.
+        The value node, or None if node is not a mapping or doesn't have key.
     """
-    return text.replace("\\", "\\\\").replace(" ", r"\_").replace('"', r"\"")
+    if isinstance(node, yaml.MappingNode):
+        for key_node, value_node in cast(list[tuple[yaml.Node, yaml.Node]], node.value):
+            if (
+                isinstance(key_node, yaml.ScalarNode)
+                and cast(str, key_node.value) == key
+            ):
+                return value_node
+    return None
 
 
-def build_shebang_args(extra_args: dict[str, str] | None) -> str:
-    """Builds the argument string for the shebang.
+def run_commands(text: str, run: yaml.ScalarNode) -> list[tuple[str, int]]:
+    """Finds the commands in a 'run:' value and the offsets of their ends.
+
+    Quoted and folded values are skipped because extra arguments can't be
+    appended to them without escaping or changing their meaning.
 
     Args:
-        extra_args: The dictionary of extra arguments.
+        text: The template containing the value.
+        run: The composed 'run:' value.
 
     Returns:
-        The string of extra arguments formatted for the shebang.
+        Each command, a plain value or a line of a literal block, and the offset
+        in text just after it.
+    """
+    # Plain values have no style, which the C loader gives as ''.
+    if not run.style:
+        return [(cast(str, run.value), run.end_mark.index)]
+    if run.style != "|":
+        return []
+    commands: list[tuple[str, int]] = []
+    # The block's lines start after its '|' header.
+    offset = text.index("\n", run.start_mark.index) + 1
+    for line in text[offset : run.end_mark.index].splitlines(keepends=True):
+        if line.strip():
+            commands.append((line.strip(), offset + len(line.rstrip())))
+        offset += len(line)
+    return commands
+
+
+@dataclasses.dataclass(frozen=True)
+class TemplateModel:
+    """A workflow template, with the commands its steps run indexed.
+
+    Attributes:
+        text: The template.
+        command_ends: For each command run by a step, the offsets in text just
+            after the command, where extra arguments are inserted. A command is
+            a plain 'run:' value or a line of a literal 'run: |' block.
     """
-    if not extra_args:
-        return ""
 
-    args_str = ""
-    for cmd, args in sorted(extra_args.items()):
-        escaped_cmd = escape_for_env_s(cmd)
-        escaped_args = escape_for_env_s(args)
-        args_str += f'\\_--extra-arg\\_"{escaped_cmd}={escaped_args}"'
-    return args_str
+    text: str
+    command_ends: dict[str, tuple[int, ...]]
+
+    @classmethod
+    def parse(cls, text: str) -> "TemplateModel":
+        """Parses a template, finding the commands run by the steps of every job.
+
+        Args:
+            text: The template.
+
+        Returns:
+            The model of the template.
+
+        Raises:
+            yaml.YAMLError: If the template isn't valid YAML.
+        """
+        command_ends: dict[str, list[int]] = {}
+        loader = YAML_LOADER(text)
+        try:
+            document = loader.get_single_node()
+        finally:
+            loader.dispose()
+        jobs = mapping_value(document, "jobs")
+        job_nodes = cast(
+            list[tuple[yaml.Node, yaml.Node]],
+            jobs.value if isinstance(jobs, yaml.MappingNode) else [],
+        )
+        for _, job in job_nodes:
+            steps = mapping_value(job, "steps")
+            if not isinstance(steps, yaml.SequenceNode):
+                continue
+            for step in cast(list[yaml.Node], steps.value):
+                run = mapping_value(step, "run")
+                if not isinstance(run, yaml.ScalarNode):
+                    continue
+                for command, end in run_commands(text, run):
+                    command_ends.setdefault(command, []).append(end)
+        return cls(
+            text=text,
+            command_ends={
+                command: tuple(ends) for command, ends in command_ends.items()
+            },
+        )
+
+    def with_extra_args(self, extra_args: dict[str, str]) -> str:
+        """Appends extra arguments to the commands run by steps.
+
+        Everything else in the template is unchanged, byte for byte.
+
+        Args:
+            extra_args: A dictionary mapping commands to extra arguments.
+
+        Returns:
+            The template with the extra arguments.
+        """
+        insertions = sorted(
+            (end, extra)
+            for command, extra in extra_args.items()
+            for end in self.command_ends.get(command, ())
+        )
+        pieces: list[str] = []
+        previous = 0
+        for end, extra in insertions:
+            pieces.extend([self.text[previous:end], f" {extra}"])
+            previous = end
+        pieces.append(self.text[previous:])
+        return "".join(pieces)
+
+
+@functools.cache
+def template_model(template: str) -> TemplateModel:
+    """Parses a template once per process.
+
+    Args:
+        template: The template.
+
+    Returns:
+        The model of the template.
+    """
+    return TemplateModel.parse(template)
+
+
+@functools.cache
+def apply_extra_args(template: str, extra_args: tuple[tuple[str, str], ...]) -> str:
+    """Appends extra arguments to the commands run by a template's steps, once.
+
+    Args:
+        template: The template.
+        extra_args: Pairs of commands and extra arguments, hashable so the
+            result can be cached.
+
+    Returns:
+        The template with the extra arguments.
+    """
+    return template_model(template).with_extra_args(dict(extra_args))
 
 
 def generate_dependabot_config(
     script_file: str,
     extra_args: dict[str, str] | None = None,
+    packages: dict[str, frozenset[str]] | None = None,
 ) -> str:
     """Generates the dependabot.yml content based on the project files.
 
+    Each ecosystem gets an update for every directory containing its trigger
+    files.
+
     Args:
         script_file: The path to the script calling this function.
         extra_args: An optional dictionary mapping commands to extra arguments.
+        packages: The package directories of each ecosystem, from
+            find_packages; they are found in the current directory if not
+            provided.
 
     Returns:
         The generated YAML content as a string.
     """
+    if packages is None:
+        packages = find_packages(pathlib.Path("."))
     script_dir = pathlib.Path(script_file).resolve().parent
     template_path = script_dir / "workflows" / "dependabot.yml"
 
-    with template_path.open("r", encoding="utf-8") as f:
-        template = cast(dict[str, int | list[UpdateStanza]], yaml.safe_load(f))
+    template = cast(
+        dict[str, int | list[UpdateStanza]],
+        yaml.safe_load(read_template(template_path)),
+    )
 
     filtered_updates: list[UpdateStanza] = []
     # cast to object first to appease basedpyright.
@@ -201,9 +779,10 @@ def generate_dependabot_config(
             filtered_updates.append(update)
             continue
 
-        config = next((c for c in LANGUAGE_CONFIGS if c.ecosystem == ecosystem), None)
-        if config and any(pathlib.Path(f).exists() for f in config.trigger_files):
-            filtered_updates.append(update)
+        for package in sorted(packages.get(ecosystem, [])):
+            directory = "/" if package == ROOT_PACKAGE else f"/{package}"
+            # Copy the update so the YAML doesn't use anchors for shared parts.
+            filtered_updates.append({**copy.deepcopy(update), "directory": directory})
 
     template["updates"] = filtered_updates
     yaml_content = yaml.dump(
@@ -212,8 +791,8 @@ def generate_dependabot_config(
     # Ensure there is a newline between list items for better readability
     yaml_content = yaml_content.replace("\n  - ", "\n\n  - ")
 
-    shebang_args = build_shebang_args(extra_args)
-    script_name = escape_for_env_s(pathlib.Path(script_file).name)
+    shebang_args = script_utils.build_shebang_args(extra_args)
+    script_name = script_utils.escape_for_env_s(pathlib.Path(script_file).name)
     shebang = f'#!/usr/bin/env -S "{script_name}"{shebang_args}'
     return shebang + "\n" + yaml_content.rstrip()
 
@@ -222,6 +801,9 @@ def generate_workflow(
     template_name: str,
     script_file: str,
     extra_args: dict[str, str] | None = None,
+    packages: frozenset[str] | None = None,
+    paths: list[str] | None = None,
+    caches: tuple[str, ...] = (),
 ) -> str:
     """Generates a GitHub Actions workflow from a template.
 
@@ -229,41 +811,81 @@ def generate_workflow(
         template_name: The filename of the template to use.
         script_file: The path to the script calling this function (used for shebang and template location).
         extra_args: An optional dictionary mapping commands to extra arguments to append.
+        packages: The package directories to run the workflow's jobs in; a
+            matrix is only added if there is a package outside the root.
+        paths: The path filters replacing the template's paths: filters.
+        caches: The kinds of CACHE_STEPS to add after the checkout step.
 
     Returns:
         The generated YAML content as a string.
     """
     script_dir = pathlib.Path(script_file).resolve().parent
     template_path = script_dir / "workflows" / template_name
-    template = template_path.read_text(encoding="utf-8")
+    template = read_template(template_path)
 
     if extra_args:
-        for command, extra in extra_args.items():
-            # Match 'run: <command>' (possibly with spaces) and append extra args.
-            # We use regex to ensure we only replace in 'run:' lines.
-            pattern = re.compile(
-                rf"^(\s*run:\s*{re.escape(command)})(\s*)$", re.MULTILINE
-            )
-            template = pattern.sub(rf"\1 {extra}\2", template)
+        template = apply_extra_args(template, tuple(sorted(extra_args.items())))
 
-    shebang_args = build_shebang_args(extra_args)
-    script_name = escape_for_env_s(pathlib.Path(script_file).name)
+    if paths:
+        template = set_path_filters(template, paths)
+    matrix_packages = (
+        packages if packages and packages != frozenset({ROOT_PACKAGE}) else None
+    )
+    template = add_cache_steps(template, caches, matrix_packages is not None)
+    if matrix_packages is not None:
+        template = add_package_matrix(template, matrix_packages)
+
+    shebang_args = script_utils.build_shebang_args(extra_args)
+    script_name = script_utils.escape_for_env_s(pathlib.Path(script_file).name)
     shebang = f'#!/usr/bin/env -S "{script_name}"{shebang_args}'
 
     return shebang + "\n" + template.rstrip()
 
 
-def write_workflow(output_file: str, content: str) -> None:
+def write_if_changed(path: pathlib.Path, content: str, mode: int) -> WriteStatus:
+    """Writes a file atomically, unless it already has the same contents.
+
+    Unchanged files are not touched, so their modification times are kept; only
+    their permissions are fixed if necessary. Changed files are written to a
+    temporary file in the same directory, which then replaces the original; see
+    script_utils.write_atomically.
+
+    Args:
+        path: The file to write.
+        content: The new contents of the file.
+        mode: The permissions for the file.
+
+    Returns:
+        Whether the file was created, updated, or unchanged.
+    """
+    data = content.encode("utf-8")
+    target = path.resolve()
+    try:
+        existing = target.read_bytes()
+    except FileNotFoundError:
+        existing = None
+    if existing == data:
+        if target.stat().st_mode & 0o777 == mode:
+            return WriteStatus.UNCHANGED
+        target.chmod(mode)
+        return WriteStatus.UPDATED
+
+    target.parent.mkdir(parents=True, exist_ok=True)
+    script_utils.write_atomically(target, content, mode)
+    return WriteStatus.CREATED if existing is None else WriteStatus.UPDATED
+
+
+def write_workflow(output_file: str, content: str) -> WriteStatus:
     """Writes the workflow content to a file and makes it executable.
 
     Args:
         output_file: The path to the file to write.
         content: The content to write.
+
+    Returns:
+        Whether the file was created, updated, or unchanged.
     """
-    path = pathlib.Path(output_file)
-    path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_text(content + "\n", encoding="utf-8")
-    path.chmod(0o755)
+    return write_if_changed(pathlib.Path(output_file), content + "\n", WORKFLOW_MODE)
 
 
 def get_parser(description: str) -> argparse.ArgumentParser:
@@ -287,17 +909,38 @@ def get_parser(description: str) -> argparse.ArgumentParser:
         action="append",
         help="Extra arguments for a command, in the format 'command=args' (e.g. --extra-arg 'cargo test=-- --nocapture').",
     )
+    parser.add_argument(
+        "--repos",
+        nargs="+",
+        metavar="DIR",
+        help="Generate workflows for the repositories rooted at these directories "
+        + "rather than the current repository; extra arguments are read from each "
+        + "repository's .github/dependabot.yml.",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=script_utils.positive_int,
+        default=DEFAULT_JOBS,
+        help="The number of repositories to generate workflows for at once with "
+        + "--repos (default: %(default)s).",
+    )
     return parser
 
 
-def check_hugo_johntobin_ie() -> bool:
+def check_hugo_johntobin_ie(root: pathlib.Path | None = None) -> bool:
     """Checks if config.toml exists and contains the baseURL line.
 
+    Args:
+        root: The root of the repository; the current directory if not
+            provided.
+
     Returns:
         True if config.toml exists and contains the baseURL line,
         False otherwise.
     """
-    config_path = pathlib.Path("config.toml")
+    if root is None:
+        root = pathlib.Path(".")
+    config_path = pathlib.Path(root, "config.toml")
     if not config_path.exists():
         return False
     try:
@@ -310,100 +953,254 @@ def check_hugo_johntobin_ie() -> bool:
     return False
 
 
-def copy_zizmor(script_file: str) -> None:
-    """Copies zizmor.yaml unconditionally to the destination.
+def copy_zizmor(script_file: str, root: pathlib.Path) -> WriteStatus:
+    """Copies zizmor.yaml to the destination if it has changed.
 
     Args:
         script_file: The path to the script calling this function.
+        root: The root of the repository.
 
     Returns:
-        None.
+        Whether the destination was created, updated, or unchanged.
 
     Raises:
         OSError: If reading the source file or writing the destination file fails.
     """
     script_dir = pathlib.Path(script_file).resolve().parent
     zizmor_source = script_dir / "zizmor.yaml"
-    zizmor_dest = pathlib.Path(".github/zizmor.yaml")
-    zizmor_dest.parent.mkdir(parents=True, exist_ok=True)
-    zizmor_dest.write_text(zizmor_source.read_text(encoding="utf-8"), encoding="utf-8")
+    zizmor_dest = root / ".github/zizmor.yaml"
+    return write_if_changed(zizmor_dest, read_template(zizmor_source), CONFIG_MODE)
 
 
-def copy_actionlint(script_file: str) -> None:
-    """Copies actionlint.yaml unconditionally to the destination.
+def copy_actionlint(script_file: str, root: pathlib.Path) -> WriteStatus:
+    """Copies actionlint.yaml to the destination if it has changed.
 
     Args:
         script_file: The path to the script calling this function.
+        root: The root of the repository.
 
     Returns:
-        None.
+        Whether the destination was created, updated, or unchanged.
 
     Raises:
         OSError: If reading the source file or writing the destination file fails.
     """
     script_dir = pathlib.Path(script_file).resolve().parent
     actionlint_source = script_dir / "workflows" / "actionlint.yaml"
-    actionlint_dest = pathlib.Path(".github/actionlint.yaml")
-    actionlint_dest.parent.mkdir(parents=True, exist_ok=True)
-    actionlint_dest.write_text(
-        actionlint_source.read_text(encoding="utf-8"), encoding="utf-8"
+    actionlint_dest = root / ".github/actionlint.yaml"
+    return write_if_changed(
+        actionlint_dest, read_template(actionlint_source), CONFIG_MODE
     )
 
 
-def main() -> None:
-    """Parses arguments and generates the workflows."""
-    description = "Generate GitHub Actions workflows for a project."
-    parser = get_parser(description=description)
-    args = parser.parse_args(namespace=Args())
+def format_counts(statuses: dict[str, WriteStatus]) -> str:
+    """Formats how many files were in each status.
 
-    command_to_extra_args: dict[str, str] = {}
-    for item in args.extra_args or []:
-        if "=" not in item:
-            raise ValueError(
-                f"Invalid --extra-arg format: '{item}'. Expected 'command=args'."
-            )
-        command, extra = item.split("=", 1)
-        command_to_extra_args[command.strip()] = extra.strip()
+    Args:
+        statuses: The status of each file that was written.
 
-    script_file = str(pathlib.Path(__file__).absolute())
-    git_root = get_git_root.get_git_root()
-    os.chdir(git_root)
+    Returns:
+        The counts, e.g. '1 created, 0 updated, 4 unchanged'.
+    """
+    counts = collections.Counter(statuses.values())
+    return ", ".join(f"{counts[status]} {status.value}" for status in WriteStatus)
+
+
+def print_summary(statuses: dict[str, WriteStatus]) -> None:
+    """Prints the files that changed and how many were in each status.
+
+    Args:
+        statuses: The status of each file that was written.
+    """
+    for path, status in sorted(statuses.items()):
+        if status != WriteStatus.UNCHANGED:
+            print(f"{status.value}: {path}")
+    print(format_counts(statuses) + ".")
+
+
+def generate_repo(
+    root: pathlib.Path, script_file: str, extra_args: dict[str, str]
+) -> RepoResult:
+    """Generates the workflows for a single repository.
+
+    Args:
+        root: The root of the repository.
+        script_file: The path to the script (used for shebang and templates).
+        extra_args: A dictionary mapping commands to extra arguments.
+
+    Returns:
+        The result of generating the workflows.
+    """
+    start = time.monotonic()
+    # Find every package of every ecosystem at once.
+    packages = find_packages(root)
 
     # Generate dependabot.yml automatically.
     dependabot_content = generate_dependabot_config(
         script_file,
-        extra_args=command_to_extra_args,
+        extra_args=extra_args,
+        packages=packages,
+    )
+    statuses: dict[str, WriteStatus] = {}
+    statuses[".github/dependabot.yml"] = write_workflow(
+        str(root / ".github/dependabot.yml"), dependabot_content
     )
-    write_workflow(".github/dependabot.yml", dependabot_content)
-
-    # Copy zizmor.yaml unconditionally to the destination.
-    copy_zizmor(script_file)
 
-    # Copy actionlint.yaml unconditionally to the destination.
-    copy_actionlint(script_file)
+    # Copy zizmor.yaml and actionlint.yaml to the destination.
+    statuses[".github/zizmor.yaml"] = copy_zizmor(script_file, root)
+    statuses[".github/actionlint.yaml"] = copy_actionlint(script_file, root)
 
-    workflows_to_generate: set[tuple[str, str]] = set()
+    workflows_to_generate: dict[str, tuple[Workflow, LanguageConfig | None]] = {}
     for config in LANGUAGE_CONFIGS:
-        if any(pathlib.Path(f).exists() for f in config.trigger_files):
+        if config.ecosystem in packages:
             for workflow in config.workflows:
-                workflows_to_generate.add((workflow.template, workflow.output))
+                workflows_to_generate[workflow.output] = (
+                    workflow,
+                    config if workflow.per_package else None,
+                )
 
-    if check_hugo_johntobin_ie():
-        workflows_to_generate.add(
-            (
-                "hugo-johntobin.ie.yml",
-                ".github/workflows/hugo-johntobin.ie.yml",
-            )
+    if check_hugo_johntobin_ie(root):
+        workflows_to_generate[".github/workflows/hugo-johntobin.ie.yml"] = (
+            Workflow(
+                "hugo-johntobin.ie.yml", ".github/workflows/hugo-johntobin.ie.yml"
+            ),
+            None,
         )
 
-    for template, output_file in sorted(workflows_to_generate):
+    for output_file, (workflow, package_config) in sorted(
+        workflows_to_generate.items()
+    ):
+        workflow_packages = None
+        paths = None
+        if package_config is not None:
+            workflow_packages = packages[package_config.ecosystem]
+            paths = package_paths(
+                package_config.source_patterns,
+                workflow_packages,
+                [*package_config.root_source_patterns, workflow.output],
+            )
         content = generate_workflow(
-            template,
+            workflow.template,
             script_file,
+            extra_args=extra_args,
+            packages=workflow_packages,
+            paths=paths,
+            caches=workflow.caches,
+        )
+        statuses[output_file] = write_workflow(str(root / output_file), content)
+    return RepoResult(root=root, statuses=statuses, seconds=time.monotonic() - start)
+
+
+def generate_repo_keeping_args(
+    root: pathlib.Path, script_file: str, extra_args: dict[str, str]
+) -> RepoResult:
+    """Generates the workflows for a repository, keeping its extra arguments.
+
+    The extra arguments in the shebang of the repository's existing
+    .github/dependabot.yml are kept, overridden by extra_args.
+
+    Args:
+        root: The root of the repository.
+        script_file: The path to the script (used for shebang and templates).
+        extra_args: A dictionary mapping commands to extra arguments.
+
+    Returns:
+        The result of generating the workflows.
+    """
+    repo_extra_args = script_utils.read_shebang_extra_args(
+        root / ".github/dependabot.yml"
+    )
+    repo_extra_args.update(extra_args)
+    return generate_repo(root, script_file, repo_extra_args)
+
+
+def generate_repos(
+    *,
+    roots: list[pathlib.Path],
+    script_file: str,
+    extra_args: dict[str, str],
+    jobs: int,
+) -> int:
+    """Generates the workflows for many repositories in parallel.
+
+    Templates are read once and shared with the worker processes. With one job
+    everything runs in this process.
+
+    Args:
+        roots: The roots of the repositories.
+        script_file: The path to the script (used for shebang and templates).
+        extra_args: A dictionary mapping commands to extra arguments.
+        jobs: The number of repositories to generate workflows for at once.
+
+    Returns:
+        0 if the workflows for every repository were generated successfully, 1
+        otherwise.
+    """
+    templates = read_all_templates(script_file)
+    executor: concurrent.futures.Executor
+    if jobs == 1:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    else:
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=prime_template_cache,
+            initargs=(templates,),
+        )
+    with executor:
+        futures = [
+            executor.submit(generate_repo_keeping_args, root, script_file, extra_args)
+            for root in roots
+        ]
+
+    num_changed = num_unchanged = num_failed = 0
+    for root, future in zip(roots, futures):
+        try:
+            result = future.result()
+        except (OSError, ValueError, yaml.YAMLError) as e:
+            print(f"{root}: failed: {e}")
+            num_failed += 1
+            continue
+        for path, status in sorted(result.statuses.items()):
+            if status != WriteStatus.UNCHANGED:
+                print(f"{root}: {status.value}: {path}")
+        print(f"{root}: {format_counts(result.statuses)} in {result.seconds:.2f}s")
+        if any(s != WriteStatus.UNCHANGED for s in result.statuses.values()):
+            num_changed += 1
+        else:
+            num_unchanged += 1
+    print(
+        f"{len(roots)} repositories: {num_changed} changed, "
+        + f"{num_unchanged} unchanged, {num_failed} failed."
+    )
+    return 1 if num_failed else 0
+
+
+def main() -> int:
+    """Parses arguments and generates the workflows.
+
+    Returns:
+        The exit status for the script.
+    """
+    description = "Generate GitHub Actions workflows for a project."
+    parser = get_parser(description=description)
+    args = parser.parse_args(namespace=Args())
+
+    command_to_extra_args = script_utils.parse_extra_args(args.extra_args or [])
+    script_file = str(pathlib.Path(__file__).absolute())
+
+    if args.repos:
+        return generate_repos(
+            roots=[pathlib.Path(repo) for repo in args.repos],
+            script_file=script_file,
             extra_args=command_to_extra_args,
+            jobs=args.jobs,
         )
-        write_workflow(output_file, content)
+
+    git_root = pathlib.Path(get_git_root.get_git_root())
+    result = generate_repo(git_root, script_file, command_to_extra_args)
+    print_summary(result.statuses)
+    return 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -1,8 +1,12 @@
 """Tests for make_github_workflows.py."""
 
+import io
 import os
 import pathlib as pathlib
+import re
+import shutil
 import subprocess as subprocess
+import tempfile
 import unittest
 from typing import cast, override
 from unittest import mock
@@ -11,6 +15,7 @@ from pyfakefs import fake_filesystem_unittest
 
 import make_github_workflows
 import get_git_root
+import script_utils
 
 
 class TestArgs(unittest.TestCase):
@@ -20,6 +25,8 @@ class TestArgs(unittest.TestCase):
         """Tests that Args initializes with correct defaults."""
         args = make_github_workflows.Args()
         self.assertIsNone(args.ignored_filename)
+        self.assertEqual(args.repos, [])
+        self.assertEqual(args.jobs, make_github_workflows.DEFAULT_JOBS)
 
     def test_init_custom(self) -> None:
         """Tests that Args initializes with provided values."""
@@ -41,6 +48,24 @@ class TestGetParser(unittest.TestCase):
         )
         self.assertEqual(args.ignored_filename, "ignoreme.py")
 
+    def test_repos_and_jobs(self) -> None:
+        parser = make_github_workflows.get_parser("Test description")
+        args = parser.parse_args(
+            ["--jobs", "3", "--repos", "a", "b"],
+            namespace=make_github_workflows.Args(),
+        )
+        self.assertEqual(args.repos, ["a", "b"])
+        self.assertEqual(args.jobs, 3)
+
+    def test_invalid_jobs(self) -> None:
+        parser = make_github_workflows.get_parser("Test description")
+        with (
+            mock.patch("sys.stderr", new_callable=io.StringIO) as stderr,
+            self.assertRaises(SystemExit),
+        ):
+            parser.parse_args(["--jobs", "0"], namespace=make_github_workflows.Args())
+        self.assertIn("invalid positive_int value: '0'", stderr.getvalue())
+
 
 class TestWorkflowUtils(fake_filesystem_unittest.TestCase):
     """Tests for workflow generation and writing functions."""
@@ -48,6 +73,17 @@ class TestWorkflowUtils(fake_filesystem_unittest.TestCase):
     @override
     def setUp(self) -> None:
         self.setUpPyfakefs()
+        self.enterContext(
+            mock.patch.dict(make_github_workflows.TEMPLATE_CACHE, clear=True)
+        )
+        # pyfakefs can't fake the files that git sees, so walk the files instead.
+        self.enterContext(
+            mock.patch.object(
+                make_github_workflows.subprocess,
+                "run",
+                side_effect=FileNotFoundError(),
+            )
+        )
 
     def create_file(self, file_path: str, contents: str = "") -> None:
         self.fs.create_file(  # pyright: ignore[reportUnknownMemberType]
@@ -71,6 +107,523 @@ class TestWorkflowUtils(fake_filesystem_unittest.TestCase):
         self.assertTrue(content.startswith('#!/usr/bin/env -S "my_script.py"\n'))
         self.assertIn("Hello!", content)
 
+    def test_read_all_templates(self) -> None:
+        self.create_file("/fake/path/zizmor.yaml", contents="Z")
+        self.create_file("/fake/path/workflows/a.yml", contents="A")
+        self.fs.create_dir(  # pyright: ignore[reportUnknownMemberType]
+            "/fake/path/workflows/subdir"
+        )
+        templates = make_github_workflows.read_all_templates("/fake/path/script.py")
+        self.assertEqual(
+            templates,
+            {
+                pathlib.Path("/fake/path/zizmor.yaml"): "Z",
+                pathlib.Path("/fake/path/workflows/a.yml"): "A",
+            },
+        )
+        make_github_workflows.TEMPLATE_CACHE.clear()
+        make_github_workflows.prime_template_cache(templates)
+        self.assertEqual(make_github_workflows.TEMPLATE_CACHE, templates)
+
+    def test_generate_repo_without_chdir(self) -> None:
+        """Tests that generate_repo writes under root, not the current directory."""
+        script_dir = pathlib.Path(make_github_workflows.__file__).parent
+        self.create_file(
+            str(script_dir / "workflows" / "dependabot.yml"),
+            contents="version: 2\nupdates: []",
+        )
+        self.create_file(
+            str(script_dir / "workflows" / "hugo-johntobin.ie.yml"), contents="HUGO"
+        )
+        self.create_file(str(script_dir / "zizmor.yaml"), contents="ZIZMOR")
+        self.create_file(
+            str(script_dir / "workflows" / "actionlint.yaml"), contents="ACTIONLINT"
+        )
+        self.create_file(
+            "/repo/config.toml", contents='baseURL = "https://www.johntobin.ie/"\n'
+        )
+        cwd = os.getcwd()
+        result = make_github_workflows.generate_repo(
+            pathlib.Path("/repo"), make_github_workflows.__file__, {}
+        )
+        self.assertEqual(os.getcwd(), cwd)
+        self.assertEqual(
+            sorted(result.statuses),
+            [
+                ".github/actionlint.yaml",
+                ".github/dependabot.yml",
+                ".github/workflows/hugo-johntobin.ie.yml",
+                ".github/zizmor.yaml",
+            ],
+        )
+        self.assertTrue(
+            pathlib.Path("/repo/.github/workflows/hugo-johntobin.ie.yml").exists()
+        )
+        self.assertFalse(pathlib.Path(cwd, ".github").exists())
+
+    def test_generate_repos(self) -> None:
+        """Tests batch generation, keeping each repository's extra args."""
+        script_dir = pathlib.Path(make_github_workflows.__file__).parent
+        self.create_file(
+            str(script_dir / "workflows" / "dependabot.yml"),
+            contents="version: 2\nupdates: []",
+        )
+        self.create_file(str(script_dir / "workflows" / "dependabot_validation.yml"))
+        self.create_file(
+            str(script_dir / "workflows" / "rust_pull_request.yml"),
+            contents="jobs:\n  a:\n    steps:\n      - run: cargo test\n      - run: cargo build",
+        )
+        self.create_file(str(script_dir / "workflows" / "rust_security_audit.yml"))
+        self.create_file(str(script_dir / "zizmor.yaml"), contents="ZIZMOR")
+        self.create_file(
+            str(script_dir / "workflows" / "actionlint.yaml"), contents="ACTIONLINT"
+        )
+        self.create_file("/a/Cargo.toml")
+        self.fs.create_dir("/b")  # pyright: ignore[reportUnknownMemberType]
+        self.create_file(
+            "/a/.github/dependabot.yml",
+            contents='#!/usr/bin/env -S "x"'
+            + script_utils.build_shebang_args({"cargo test": "--all"})
+            + "\n",
+        )
+        self.create_file(
+            "/bad/.github/dependabot.yml",
+            contents='#!/usr/bin/env -S "x" --extra-arg invalid\n',
+        )
+        roots = [pathlib.Path("/a"), pathlib.Path("/b"), pathlib.Path("/bad")]
+        with (
+            mock.patch("sys.stdout", new_callable=io.StringIO) as mock_stdout,
+            mock.patch.object(
+                make_github_workflows.time, "monotonic", side_effect=[0, 1, 0, 2]
+            ),
+        ):
+            self.assertEqual(
+                make_github_workflows.generate_repos(
+                    roots=roots,
+                    script_file=make_github_workflows.__file__,
+                    extra_args={"cargo build": "--release"},
+                    jobs=1,
+                ),
+                1,
+            )
+        self.assertEqual(
+            mock_stdout.getvalue(),
+            "/a: created: .github/actionlint.yaml\n"
+            + "/a: updated: .github/dependabot.yml\n"
+            + "/a: created: .github/workflows/dependabot_validation.yml\n"
+            + "/a: created: .github/workflows/rust_pull_request.yml\n"
+            + "/a: created: .github/workflows/rust_security_audit.yml\n"
+            + "/a: created: .github/zizmor.yaml\n"
+            + "/a: 5 created, 1 updated, 0 unchanged in 1.00s\n"
+            + "/b: created: .github/actionlint.yaml\n"
+            + "/b: created: .github/dependabot.yml\n"
+            + "/b: created: .github/zizmor.yaml\n"
+            + "/b: 3 created, 0 updated, 0 unchanged in 2.00s\n"
+            + "/bad: failed: Invalid --extra-arg format: 'invalid'. "
+            + "Expected 'command=args'.\n"
+            + "3 repositories: 2 changed, 0 unchanged, 1 failed.\n",
+        )
+        with (
+            mock.patch("sys.stdout", new_callable=io.StringIO) as mock_stdout,
+            mock.patch.object(
+                make_github_workflows.time, "monotonic", side_effect=[0, 1]
+            ),
+        ):
+            self.assertEqual(
+                make_github_workflows.generate_repos(
+                    roots=[pathlib.Path("/b")],
+                    script_file=make_github_workflows.__file__,
+                    extra_args={},
+                    jobs=1,
+                ),
+                0,
+            )
+        self.assertEqual(
+            mock_stdout.getvalue(),
+            "/b: 0 created, 0 updated, 3 unchanged in 1.00s\n"
+            + "1 repositories: 0 changed, 1 unchanged, 0 failed.\n",
+        )
+        workflow = pathlib.Path("/a/.github/workflows/rust_pull_request.yml")
+        self.assertIn(
+            "run: cargo test --all\n      - run: cargo build --release",
+            workflow.read_text(encoding="utf-8"),
+        )
+
+    def test_main_repos(self) -> None:
+        args = make_github_workflows.Args(
+            extra_args=["go test=-v"], repos=["a", "b"], jobs=3
+        )
+        with (
+            mock.patch.object(
+                make_github_workflows.argparse.ArgumentParser,
+                "parse_args",
+                return_value=args,
+            ),
+            mock.patch.object(
+                make_github_workflows, "generate_repos", return_value=1
+            ) as mock_generate_repos,
+        ):
+            self.assertEqual(make_github_workflows.main(), 1)
+        mock_generate_repos.assert_called_once_with(
+            roots=[pathlib.Path("a"), pathlib.Path("b")],
+            script_file=mock.ANY,
+            extra_args={"go test": "-v"},
+            jobs=3,
+        )
+
+    def test_list_repo_files_walk(self) -> None:
+        """Tests listing files without git, which skips .git and ignored files."""
+        self.create_file("/repo/.gitignore", contents="node_modules/\nvendor/\n")
+        self.create_file("/repo/go.mod")
+        self.create_file("/repo/sub/dir/Cargo.toml")
+        self.create_file("/repo/.git/config")
+        self.create_file("/repo/node_modules/pkg/package.json")
+        self.create_file("/repo/vendor/example.com/mod/go.mod")
+        with mock.patch.object(
+            make_github_workflows.subprocess, "run", side_effect=FileNotFoundError()
+        ):
+            files = make_github_workflows.list_repo_files(pathlib.Path("/repo"))
+        self.assertEqual(sorted(files), [".gitignore", "go.mod", "sub/dir/Cargo.toml"])
+
+    def test_list_repo_files_git(self) -> None:
+        with mock.patch.object(
+            make_github_workflows.subprocess,
+            "run",
+            return_value=subprocess.CompletedProcess(
+                args=[], returncode=0, stdout=b"go.mod\0sub/Cargo.toml\0"
+            ),
+        ) as mock_run:
+            self.assertEqual(
+                make_github_workflows.list_repo_files(pathlib.Path("/repo")),
+                ["go.mod", "sub/Cargo.toml"],
+            )
+        self.assertEqual(mock_run.call_args.kwargs["cwd"], pathlib.Path("/repo"))
+
+    def test_find_packages(self) -> None:
+        """Tests finding trigger files at the root and in nested directories."""
+        for f in [
+            "/repo/go.mod",
+            "/repo/services/api/go.mod",
+            "/repo/crates/a/Cargo.toml",
+            "/repo/python/dummy.py",
+            "/repo/tools/python/dummy.py",
+            "/repo/web/package.json",
+            "/repo/README.md",
+        ]:
+            self.create_file(f)
+        self.assertEqual(
+            make_github_workflows.find_packages(pathlib.Path("/repo")),
+            {
+                "gomod": frozenset[str]({".", "services/api"}),
+                "cargo": frozenset[str]({"crates/a"}),
+                "pip": frozenset[str]({"."}),
+                "npm": frozenset[str]({"web"}),
+            },
+        )
+
+    def test_find_packages_root_triggers(self) -> None:
+        """Tests that manifests in a root trigger directory are the root package."""
+        self.create_file("/repo/pyrefly.toml")
+        self.create_file("/repo/python/tool.py")
+        self.create_file("/repo/Cargo.lock")
+        self.assertEqual(
+            make_github_workflows.find_packages(pathlib.Path("/repo")),
+            {"pip": frozenset[str]({"."})},
+        )
+        self.create_file("/repo/python/pyproject.toml")
+        self.assertEqual(
+            make_github_workflows.find_packages(pathlib.Path("/repo")),
+            {"pip": frozenset[str]({"."})},
+        )
+
+    def test_find_packages_root_and_nested(self) -> None:
+        """Tests that root trigger files keep the root package with nested ones."""
+        self.create_file("/repo/pyrefly.toml")
+        self.create_file("/repo/tools/lint/pyproject.toml")
+        self.create_file("/repo/services/api/requirements.txt")
+        self.assertEqual(
+            make_github_workflows.find_packages(pathlib.Path("/repo")),
+            {"pip": frozenset[str]({".", "services/api", "tools/lint"})},
+        )
+
+    def test_add_package_matrix(self) -> None:
+        template = (
+            "jobs:\n"
+            "  test:\n"
+            "    runs-on: ubuntu-latest\n"
+            "    concurrency:\n"
+            "      group: ${{ github.workflow }}-${{ github.ref }}\n"
+            "    steps:\n"
+            "      - run: go test\n"
+        )
+        workflow = cast(
+            dict[str, dict[str, dict[str, object]]],
+            make_github_workflows.yaml.safe_load(
+                make_github_workflows.add_package_matrix(
+                    template, frozenset[str]({"b", ".", "it's"})
+                )
+            ),
+        )
+        job = workflow["jobs"]["test"]
+        self.assertEqual(
+            job["strategy"],
+            {"fail-fast": False, "matrix": {"package": [".", "b", "it's"]}},
+        )
+        self.assertEqual(
+            job["defaults"], {"run": {"working-directory": "${{ matrix.package }}"}}
+        )
+        self.assertEqual(
+            job["concurrency"],
+            {"group": "${{ github.workflow }}-${{ matrix.package }}-${{ github.ref }}"},
+        )
+
+    def test_add_package_matrix_actions(self) -> None:
+        """Tests that actions run in the package directory, not the root."""
+        template = (
+            "jobs:\n"
+            "  test:\n"
+            "    runs-on: ubuntu-latest\n"
+            "    steps:\n"
+            "      - uses: actions/checkout@v7\n"
+            "        with:\n"
+            "          persist-credentials: true\n"
+            "      - name: golangci-lint\n"
+            "        uses: golangci/golangci-lint-action@v9.3.0\n"
+            "\n"
+            "      - uses: golang/govulncheck-action@v1.1.0\n"
+            "        with:\n"
+            "          repo-checkout: false\n"
+            "      - uses: stefanzweifel/git-auto-commit-action@v7.2.0\n"
+        )
+        workflow = cast(
+            dict[str, dict[str, dict[str, list[dict[str, object]]]]],
+            make_github_workflows.yaml.safe_load(
+                make_github_workflows.add_package_matrix(
+                    template, frozenset[str]({".", "b"})
+                )
+            ),
+        )
+        self.assertEqual(
+            [step.get("with") for step in workflow["jobs"]["test"]["steps"]],
+            [
+                {"persist-credentials": True},
+                {"working-directory": "${{ matrix.package }}"},
+                {"work-dir": "${{ matrix.package }}", "repo-checkout": False},
+                {"repository": "${{ matrix.package }}"},
+            ],
+        )
+
+    def test_package_paths(self) -> None:
+        self.assertEqual(
+            make_github_workflows.package_paths(
+                ["**.go", "go.mod"],
+                frozenset[str]({"svc/api", "."}),
+                [".pre-commit-config.yaml", ".github/workflows/go.yml"],
+            ),
+            [
+                "**.go",
+                "go.mod",
+                "svc/api/**.go",
+                "svc/api/go.mod",
+                ".pre-commit-config.yaml",
+                ".github/workflows/go.yml",
+            ],
+        )
+        # Duplicates are removed.
+        self.assertEqual(
+            make_github_workflows.package_paths(
+                ["go.mod", "go.mod"], frozenset[str]({"."}), ["go.mod"]
+            ),
+            ["go.mod"],
+        )
+
+    def test_set_path_filters(self) -> None:
+        # PyYAML loads an "on" key as True, so use a different key.
+        template = (
+            "triggers:\n"
+            "  push:\n"
+            "    paths:\n"
+            "      - '**.go'\n"
+            "  pull_request:\n"
+            "    paths:\n"
+            "      - '**.go'\n"
+            "      - 'go.mod'\n"
+            "jobs: {}\n"
+        )
+        workflow = cast(
+            dict[str, dict[str, dict[str, list[str]]]],
+            make_github_workflows.yaml.safe_load(
+                make_github_workflows.set_path_filters(template, ["a/**.go", "it's.go"])
+            ),
+        )
+        self.assertEqual(
+            workflow["triggers"],
+            {
+                "push": {"paths": ["a/**.go", "it's.go"]},
+                "pull_request": {"paths": ["a/**.go", "it's.go"]},
+            },
+        )
+
+    def test_add_cache_steps(self) -> None:
+        template = (
+            "jobs:\n"
+            "  test:\n"
+            "    steps:\n"
+            "      - name: Checkout\n"
+            "        uses: actions/checkout@v7\n"
+            "        with:\n"
+            "          ref: main\n"
+            "\n"
+            "      - run: cargo test\n"
+            "  other:\n"
+            "    steps:\n"
+            "      - run: echo\n"
+        )
+        self.assertEqual(
+            make_github_workflows.add_cache_steps(template, (), matrix=False),
+            template,
+        )
+        for matrix, directory, key in [
+            (False, "./target", "${{ runner.os }}-cargo-${{ hashFiles("),
+            (
+                True,
+                "${{ matrix.package }}/target",
+                "${{ runner.os }}-cargo-${{ matrix.package }}-${{ hashFiles(",
+            ),
+        ]:
+            with self.subTest(matrix=matrix):
+                workflow = cast(
+                    dict[str, dict[str, dict[str, list[dict[str, object]]]]],
+                    make_github_workflows.yaml.safe_load(
+                        make_github_workflows.add_cache_steps(
+                            template, ("cargo", "pre-commit"), matrix=matrix
+                        )
+                    ),
+                )
+                steps = workflow["jobs"]["test"]["steps"]
+                self.assertEqual(
+                    [step.get("uses", step.get("run")) for step in steps],
+                    [
+                        "actions/checkout@v7",
+                        "actions/cache@v4",
+                        "actions/cache@v4",
+                        "cargo test",
+                    ],
+                )
+                cargo = cast(dict[str, str], steps[1]["with"])
+                self.assertIn(directory, cargo["path"].splitlines())
+                self.assertTrue(cargo["key"].startswith(key), cargo["key"])
+                pre_commit = cast(dict[str, str], steps[2]["with"])
+                self.assertEqual(
+                    pre_commit["key"],
+                    "${{ runner.os }}-pre-commit-"
+                    + "${{ hashFiles('.pre-commit-config.yaml') }}",
+                )
+                # Jobs without a checkout step don't get caches.
+                self.assertEqual(workflow["jobs"]["other"]["steps"], [{"run": "echo"}])
+
+    def test_generate_workflow_paths_and_caches(self) -> None:
+        self.create_file(
+            "/fake/path/workflows/test.yml",
+            contents=(
+                "on:\n"
+                "  push:\n"
+                "    paths:\n"
+                "      - '**.go'\n"
+                "jobs:\n"
+                "  test:\n"
+                "    runs-on: ubuntu-latest\n"
+                "    steps:\n"
+                "      - uses: actions/checkout@v7\n"
+            ),
+        )
+        content = make_github_workflows.generate_workflow(
+            "test.yml",
+            "/fake/path/script.py",
+            packages=frozenset[str]({".", "sub"}),
+            paths=["sub/**.go"],
+            caches=("go",),
+        )
+        self.assertIn("      - 'sub/**.go'\n", content)
+        self.assertNotIn("'**.go'", content)
+        self.assertIn("-go-${{ matrix.package }}-", content)
+
+    def test_generate_workflow_packages(self) -> None:
+        """Tests that a matrix is only added for packages outside the root."""
+        self.create_file(
+            "/fake/path/workflows/test.yml",
+            contents="jobs:\n  test:\n    runs-on: ubuntu-latest\n",
+        )
+        for packages, expect_matrix in [
+            (None, False),
+            (frozenset[str]({"."}), False),
+            (frozenset[str]({".", "sub"}), True),
+        ]:
+            with self.subTest(packages=packages):
+                content = make_github_workflows.generate_workflow(
+                    "test.yml", "/fake/path/script.py", packages=packages
+                )
+                self.assertEqual("matrix:" in content, expect_matrix)
+
+    def test_read_template_cached(self) -> None:
+        """Tests that each template is only read once."""
+        self.create_file("/fake/path/workflows/a.yml", contents="A")
+        path = pathlib.Path("/fake/path/workflows/a.yml")
+        self.assertEqual(make_github_workflows.read_template(path), "A")
+        with mock.patch.object(pathlib.Path, "read_text") as mock_read_text:
+            self.assertEqual(make_github_workflows.read_template(path), "A")
+        mock_read_text.assert_not_called()
+
+    def test_template_model(self) -> None:
+        template = (
+            "jobs:\n"
+            "  a:\n"
+            "    steps:\n"
+            "      - run: go test # comment\n"
+            "      - run: 'go test'\n"
+            "      - run: >\n"
+            "          go test\n"
+            "      - run: |\n"
+            "          go vet\n"
+            "\n"
+            "          go test\n"
+            "      - uses: actions/checkout@v7\n"
+            "      - run: [go test]\n"
+            "  b:\n"
+            "    runs-on: ubuntu-latest\n"
+            "  c:\n"
+            "    steps:\n"
+            "      - run: go test\n"
+        )
+        model = make_github_workflows.TemplateModel.parse(template)
+        self.assertEqual(set(model.command_ends), {"go test", "go vet"})
+        lines = template.splitlines(keepends=True)
+        for i in [3, 10, 17]:
+            lines[i] = lines[i].replace("go test", "go test -race")
+        lines[8] = lines[8].replace("go vet", "go vet ./...")
+        self.assertEqual(
+            model.with_extra_args({"go test": "-race", "go vet": "./..."}),
+            "".join(lines),
+        )
+        self.assertEqual(model.with_extra_args({"missing": "-x"}), template)
+        for text in ["Hello!", "jobs: []", "jobs:\n  a:\n    steps: {}"]:
+            with self.subTest(text=text):
+                model = make_github_workflows.TemplateModel.parse(text)
+                self.assertEqual(model.command_ends, {})
+
+    def test_apply_extra_args_cached(self) -> None:
+        template = "jobs:\n  a:\n    steps:\n      - run: go test\n"
+        extra_args = (("go test", "-race"),)
+        self.assertEqual(
+            make_github_workflows.apply_extra_args(template, extra_args),
+            "jobs:\n  a:\n    steps:\n      - run: go test -race\n",
+        )
+        with mock.patch.object(
+            make_github_workflows.TemplateModel, "parse"
+        ) as mock_parse:
+            make_github_workflows.apply_extra_args(template, (("go test", "-v"),))
+        mock_parse.assert_not_called()
+
     def test_write_workflow(self) -> None:
         """Tests that write_workflow creates directories and sets permissions."""
         output_file = "/fake/out/dir/workflow.yml"
@@ -83,6 +636,117 @@ class TestWorkflowUtils(fake_filesystem_unittest.TestCase):
         st = os.stat(output_file)
         self.assertEqual(st.st_mode & 0o777, 0o755)
 
+    def test_write_if_changed(self) -> None:
+        """Tests that files are only written when their contents change."""
+        path = pathlib.Path("/fake/out/file.yml")
+        self.assertEqual(
+            make_github_workflows.write_if_changed(path, "one\n", 0o755),
+            make_github_workflows.WriteStatus.CREATED,
+        )
+        self.assertEqual(path.read_text(encoding="utf-8"), "one\n")
+        self.assertEqual(path.stat().st_mode & 0o777, 0o755)
+
+        os.utime(path, ns=(1, 1))
+        with mock.patch.object(tempfile, "mkstemp") as mock_mkstemp:
+            self.assertEqual(
+                make_github_workflows.write_if_changed(path, "one\n", 0o755),
+                make_github_workflows.WriteStatus.UNCHANGED,
+            )
+        mock_mkstemp.assert_not_called()
+        self.assertEqual(path.stat().st_mtime_ns, 1)
+
+        self.assertEqual(
+            make_github_workflows.write_if_changed(path, "two\n", 0o755),
+            make_github_workflows.WriteStatus.UPDATED,
+        )
+        self.assertEqual(path.read_text(encoding="utf-8"), "two\n")
+        self.assertEqual(os.listdir("/fake/out"), ["file.yml"])
+
+    def test_write_if_changed_fixes_mode(self) -> None:
+        self.create_file("/fake/out/file.yml", contents="one\n")
+        path = pathlib.Path("/fake/out/file.yml")
+        path.chmod(0o600)
+        self.assertEqual(
+            make_github_workflows.write_if_changed(path, "one\n", 0o644),
+            make_github_workflows.WriteStatus.UPDATED,
+        )
+        self.assertEqual(path.stat().st_mode & 0o777, 0o644)
+
+    def test_write_if_changed_follows_symlinks(self) -> None:
+        self.create_file("/fake/real.yml", contents="one\n")
+        link = pathlib.Path("/fake/out/link.yml")
+        link.parent.mkdir(parents=True)
+        link.symlink_to("/fake/real.yml")
+        _ = make_github_workflows.write_if_changed(link, "two\n", 0o644)
+        self.assertTrue(link.is_symlink())
+        self.assertEqual(
+            pathlib.Path("/fake/real.yml").read_text(encoding="utf-8"), "two\n"
+        )
+
+    def test_write_if_changed_failure(self) -> None:
+        """Tests that the temporary file is removed if writing fails."""
+        self.create_file("/fake/out/file.yml", contents="one\n")
+        path = pathlib.Path("/fake/out/file.yml")
+        with mock.patch.object(
+            make_github_workflows.os, "replace", side_effect=OSError("full")
+        ):
+            with self.assertRaises(OSError):
+                _ = make_github_workflows.write_if_changed(path, "two\n", 0o644)
+        self.assertEqual(os.listdir("/fake/out"), ["file.yml"])
+        self.assertEqual(path.read_text(encoding="utf-8"), "one\n")
+
+    def test_print_summary(self) -> None:
+        with mock.patch("sys.stdout", new_callable=io.StringIO) as mock_stdout:
+            make_github_workflows.print_summary(
+                {
+                    "b": make_github_workflows.WriteStatus.UPDATED,
+                    "c": make_github_workflows.WriteStatus.UNCHANGED,
+                    "a": make_github_workflows.WriteStatus.CREATED,
+                    "d": make_github_workflows.WriteStatus.UNCHANGED,
+                }
+            )
+        self.assertEqual(
+            mock_stdout.getvalue(),
+            "created: a\nupdated: b\n1 created, 1 updated, 2 unchanged.\n",
+        )
+
+    def test_main_twice_is_unchanged(self) -> None:
+        """Tests that running main again does not rewrite anything."""
+        script_dir = pathlib.Path(make_github_workflows.__file__).parent
+        self.create_file(
+            str(script_dir / "workflows" / "dependabot.yml"),
+            contents="version: 2\nupdates: []",
+        )
+        self.create_file(
+            str(script_dir / "workflows" / "dependabot_validation.yml"),
+            contents="VALIDATION_CONTENT",
+        )
+        self.create_file(
+            str(script_dir / "workflows" / "golang_pre-commit.yml"),
+            contents="GOLANG_CONTENT",
+        )
+        self.create_file(str(script_dir / "zizmor.yaml"), contents="ZIZMOR")
+        self.create_file(
+            str(script_dir / "workflows" / "actionlint.yaml"), contents="ACTIONLINT"
+        )
+        self.create_file("go.mod")
+
+        outputs: list[str] = []
+        for _ in range(2):
+            with (
+                mock.patch.object(get_git_root, "get_git_root", return_value="."),
+                mock.patch.object(
+                    make_github_workflows.argparse.ArgumentParser,
+                    "parse_args",
+                    return_value=make_github_workflows.Args(),
+                ),
+                mock.patch("sys.stdout", new_callable=io.StringIO) as mock_stdout,
+            ):
+                make_github_workflows.main()
+            outputs.append(mock_stdout.getvalue())
+        self.assertTrue(outputs[0].endswith("5 created, 0 updated, 0 unchanged.\n"))
+        self.assertEqual(outputs[1], "0 created, 0 updated, 5 unchanged.\n")
+
     def test_generate_dependabot_config(self) -> None:
         """Tests dependabot config generation with various ecosystems."""
         script_dir = "/fake/path"
@@ -235,7 +899,18 @@ class TestWorkflowUtils(fake_filesystem_unittest.TestCase):
         template_path = str(pathlib.Path(script_dir) / "workflows" / template_name)
 
         self.create_file(
-            template_path, contents="run: cargo llvm-cov test\nrun: other command"
+            template_path,
+            contents=(
+                "jobs:\n"
+                "  test:\n"
+                "    steps:\n"
+                "      - run: cargo llvm-cov test\n"
+                "      - run: other command\n"
+                "      - run: |\n"
+                "          cargo fmt\n"
+                "          cargo llvm-cov test  \n"
+                "          cargo test\n"
+            ),
         )
 
         extra_args = {"cargo llvm-cov test": "--foo --bar"}
@@ -250,8 +925,11 @@ class TestWorkflowUtils(fake_filesystem_unittest.TestCase):
                 '#!/usr/bin/env -S "my_script.py"\\_--extra-arg\\_"cargo\\_llvm-cov\\_test=--foo\\_--bar"\n'
             )
         )
-        self.assertIn("run: cargo llvm-cov test --foo --bar", content)
-        self.assertIn("run: other command", content)
+        self.assertIn("run: cargo llvm-cov test --foo --bar\n", content)
+        self.assertIn("run: other command\n", content)
+        self.assertIn(
+            "  cargo fmt\n          cargo llvm-cov test --foo --bar  ", content
+        )
 
     def test_main_with_extra_args(self) -> None:
         """Tests the main orchestration function with extra arguments."""
@@ -267,7 +945,7 @@ class TestWorkflowUtils(fake_filesystem_unittest.TestCase):
         )
         self.create_file(
             str(pathlib.Path(script_dir) / "workflows" / "rust_pull_request.yml"),
-            contents="run: cargo llvm-cov test",
+            contents="jobs:\n  test:\n    steps:\n      - run: cargo llvm-cov test",
         )
         self.create_file(
             str(pathlib.Path(script_dir) / "workflows" / "rust_security_audit.yml"),
@@ -342,6 +1020,38 @@ class TestWorkflowUtils(fake_filesystem_unittest.TestCase):
                 make_github_workflows.main()
             self.assertIn("Invalid --extra-arg format", str(cm.exception))
 
+    def test_generate_dependabot_config_packages(self) -> None:
+        """Tests that each package directory gets its own update."""
+        template_path = "/fake/path/workflows/dependabot.yml"
+        self.create_file(
+            template_path,
+            contents=make_github_workflows.yaml.dump(
+                {
+                    "version": 2,
+                    "updates": [
+                        {"package-ecosystem": "gomod", "directory": "/", "x": 1},
+                        {"package-ecosystem": "npm", "directory": "/"},
+                    ],
+                },
+                sort_keys=False,
+            ),
+        )
+        content = make_github_workflows.generate_dependabot_config(
+            script_file="/fake/path/my_script.py",
+            packages={"gomod": frozenset[str]({"services/api", "."})},
+        )
+        config = cast(
+            dict[str, list[dict[str, object]]],
+            make_github_workflows.yaml.safe_load(content),
+        )
+        self.assertEqual(
+            config["updates"],
+            [
+                {"package-ecosystem": "gomod", "directory": "/", "x": 1},
+                {"package-ecosystem": "gomod", "directory": "/services/api", "x": 1},
+            ],
+        )
+
     def test_generate_dependabot_config_unknown_ecosystem(self) -> None:
         """Tests dependabot config generation with an unknown ecosystem."""
         script_dir = "/fake/path"
@@ -451,5 +1161,126 @@ class TestWorkflowUtils(fake_filesystem_unittest.TestCase):
             )
 
 
+class TestGenerateReposRealFilesystem(unittest.TestCase):
+    """Tests generate_repos with worker processes, which pyfakefs can't fake."""
+
+    def test_process_pool(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            roots = [pathlib.Path(tmpdir) / name for name in ["go", "rust"]]
+            for root in roots:
+                root.mkdir()
+            (roots[0] / "go.mod").touch()
+            (roots[1] / "Cargo.toml").touch()
+            with mock.patch("sys.stdout", new_callable=io.StringIO) as mock_stdout:
+                status = make_github_workflows.generate_repos(
+                    roots=roots,
+                    script_file=make_github_workflows.__file__,
+                    extra_args={},
+                    jobs=2,
+                )
+            self.assertEqual(status, 0, mock_stdout.getvalue())
+            self.assertTrue(
+                (roots[0] / ".github/workflows/golang_pre-commit.yml").exists()
+            )
+            self.assertTrue(
+                (roots[1] / ".github/workflows/rust_pull_request.yml").exists()
+            )
+            self.assertIn(
+                "2 repositories: 2 changed, 0 unchanged, 0 failed.",
+                mock_stdout.getvalue(),
+            )
+
+
+class TestGeneratedPathFilters(unittest.TestCase):
+    """Tests the path filters of workflows generated from the real templates."""
+
+    def test_root_config_is_not_prefixed(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            root = pathlib.Path(tmpdir)
+            for package in ["a", "b"]:
+                (root / package).mkdir()
+                (root / package / "pyproject.toml").touch()
+            with mock.patch("sys.stdout", new_callable=io.StringIO):
+                make_github_workflows.generate_repo(
+                    root, make_github_workflows.__file__, {}
+                )
+            workflow = cast(
+                dict[object, dict[str, dict[str, list[str]]]],
+                make_github_workflows.yaml.safe_load(
+                    (root / ".github/workflows/python_pre-commit.yml").read_text()
+                ),
+            )
+        # PyYAML loads the on: key as True.
+        paths = workflow[True]["push"]["paths"]
+        self.assertEqual(paths.count(".pre-commit-config.yaml"), 1)
+        self.assertNotIn("a/.pre-commit-config.yaml", paths)
+        self.assertIn("a/**.py", paths)
+        self.assertIn("b/pyproject.toml", paths)
+
+
+class TestExtraArgsByteStable(unittest.TestCase):
+    """Tests that extra args only change the commands in the real templates."""
+
+    def test_templates(self) -> None:
+        workflows = pathlib.Path(make_github_workflows.__file__).parent / "workflows"
+        for path in sorted(workflows.glob("*.yml")):
+            template = path.read_text(encoding="utf-8")
+            commands = {
+                match.group(1)
+                for match in re.finditer(r"^ *run: (\S.*?)\s*$", template, re.M)
+                if match.group(1) != "|"
+            }
+            extra_args = {command: "--extra" for command in commands}
+            expected = template
+            for command, extra in extra_args.items():
+                pattern = re.compile(rf"^(\s*run:\s*{re.escape(command)})(\s*)$", re.M)
+                expected = pattern.sub(rf"\1 {extra}\2", expected)
+            with self.subTest(template=path.name):
+                self.assertEqual(
+                    make_github_workflows.apply_extra_args(
+                        template, tuple(sorted(extra_args.items()))
+                    ),
+                    expected,
+                )
+
+
+@unittest.skipUnless(shutil.which("actionlint"), "actionlint is not installed")
+class TestActionlint(unittest.TestCase):
+    """Checks the generated workflows with actionlint."""
+
+    def test_generated_workflows(self) -> None:
+        for name, files in [
+            ("root", ["go.mod", "Cargo.toml", "pyproject.toml"]),
+            (
+                "monorepo",
+                [
+                    "go.mod",
+                    "svc/api/go.mod",
+                    "Cargo.toml",
+                    "crates/a/Cargo.toml",
+                    "pyproject.toml",
+                    "tools/requirements.txt",
+                ],
+            ),
+        ]:
+            with self.subTest(name=name), tempfile.TemporaryDirectory() as tmpdir:
+                root = pathlib.Path(tmpdir)
+                for f in files:
+                    (root / f).parent.mkdir(parents=True, exist_ok=True)
+                    (root / f).touch()
+                with mock.patch("sys.stdout", new_callable=io.StringIO):
+                    make_github_workflows.generate_repo(
+                        root, make_github_workflows.__file__, {}
+                    )
+                result = subprocess.run(
+                    ["actionlint"],
+                    capture_output=True,
+                    check=False,
+                    cwd=root,
+                    text=True,
+                )
+                self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -2,24 +2,64 @@
 """Populates .pre-commit-config.yaml with managed snippets.
 
 This script detects the types of files in the current repository and includes
-corresponding pre-commit hooks from a central snippets directory. It uses
+corresponding pre-commit hooks from a central snippets directory. Which snippets
+a repository needs is decided by the rules in pre-commit-rules.toml. It uses
 markers to identify and update managed sections in .pre-commit-config.yaml.
+
+The script runs from the shebang of every .pre-commit-config.yaml, so startup
+time matters: modules that are only needed on some code paths (yaml, pathspec,
+subprocess, concurrent.futures, tempfile, hashlib, json, tomllib) are imported
+in the functions that use them. populate_pre_commit_test.py checks that
+importing this module stays within STARTUP_BUDGET_US.
 """
 
 import argparse
+import collections
+import dataclasses
+import errno
 import functools
-import get_git_root
 import os
 import pathlib
-import subprocess
-import pathspec
-import yaml
+import script_utils
+import stat
+import sys
+from collections import abc
 from typing import cast, TypedDict
 
 # Path to the directory containing pre-commit snippets.
 SNIPPETS_DIR = pathlib.Path(__file__).resolve().parent / "pre-commit-snippets"
+# Path to the rules deciding which snippets a repository needs.
+RULES_FILE = pathlib.Path(__file__).resolve().parent / "pre-commit-rules.toml"
+# The conditions that a rule in RULES_FILE can use.
+RULE_KEYS = frozenset(
+    {
+        "always",
+        "exclude_files",
+        "extensions",
+        "interpreters",
+        "path_prefix",
+        "root_files",
+    }
+)
 # The pre-commit configuration file to update.
 CONFIG_FILE = pathlib.Path(".pre-commit-config.yaml")
+# Where detection results are cached, relative to the repository root.
+DETECTION_CACHE_FILE = pathlib.Path(".git/populate-pre-commit-cache.json")
+# Permissions for the config, which is executable so it can update itself.
+CONFIG_MODE = 0o755
+# Comments marking the start and end of a managed block in the config.
+MARKER_START = "# managed-by-populate-pre-commit start:"
+MARKER_END = "# managed-by-populate-pre-commit end:"
+# Number of bytes read from the start of a file when looking for a shebang.
+SHEBANG_READ_SIZE = 128
+# Maximum number of threads reading shebangs at once.
+SHEBANG_WORKERS = 16
+# Default number of repositories to update at once with --repos.
+DEFAULT_JOBS = os.cpu_count() or 1
+# Modules that are not in the standard library but are needed to update configs.
+REQUIRED_MODULES = ("pathspec", "yaml")
+# Interpreters found by sniff_interpreter, keyed by (device, inode, mtime).
+SHEBANG_CACHE: dict[tuple[int, int, int], str | None] = {}
 
 
 class Hook(TypedDict):
@@ -42,59 +82,63 @@ class RepoEntry(TypedDict):
 PreCommitConfig = list[RepoEntry]
 
 
+class DetectionCache(TypedDict):
+    """Represents the cached detection results for a repository."""
+
+    fingerprint: str
+    snippets: dict[str, bool]
+
+
 class Args(argparse.Namespace):
     """Arguments for the pre-commit population script."""
 
     ignored_filename: str | None
     extra_args: list[str]
+    repos: list[str]
+    jobs: int
+    no_cache: bool
+    check: bool
 
     def __init__(
         self,
         ignored_filename: str | None = None,
         extra_args: list[str] | None = None,
+        repos: list[str] | None = None,
+        jobs: int = DEFAULT_JOBS,
+        no_cache: bool = False,
+        check: bool = False,
     ) -> None:
         """Initializes the arguments.
 
         Args:
             ignored_filename: An optional filename that is ignored.
             extra_args: Extra arguments for a hook, in the format 'hook_id=args'.
+            repos: Roots of repositories to update instead of the current one.
+            jobs: The number of repositories to update at once.
+            no_cache: Whether to ignore cached detection results.
+            check: Whether to only check that REQUIRED_MODULES are installed.
         """
         super().__init__()
         self.ignored_filename = ignored_filename
         self.extra_args = list(extra_args) if extra_args is not None else []
+        self.repos = list(repos) if repos is not None else []
+        self.jobs = jobs
+        self.no_cache = no_cache
+        self.check = check
 
 
-def escape_for_env_s(text: str) -> str:
-    r"""Escapes a string for use within an env -S shebang.
+def find_missing_modules() -> list[str]:
+    """Finds the modules in REQUIRED_MODULES that are not installed.
 
-    Replace spaces with \_ for env -S compatibility in shebangs.
-    env -S will treat \_ as a space when inside quotes.
-    We also need to escape double quotes and backslashes.
-
-    Args:
-        text: The string to escape.
+    The modules are looked up without importing them, so this is cheap enough
+    to run before every update.
 
     Returns:
-        The escaped string.
+        The names of the missing modules.
     """
-    return text.replace("\\", "\\\\").replace(" ", r"\_").replace('"', r"\"")
-
+    import importlib.util
 
-def build_shebang_args(extra_args: dict[str, str]) -> str:
-    """Builds the argument string for the shebang.
-
-    Args:
-        extra_args: The dictionary of extra arguments.
-
-    Returns:
-        The string of extra arguments formatted for the shebang.
-    """
-    args_str = ""
-    for cmd, args in sorted(extra_args.items()):
-        escaped_cmd = escape_for_env_s(cmd)
-        escaped_args = escape_for_env_s(args)
-        args_str += f'\\_--extra-arg\\_"{escaped_cmd}={escaped_args}"'
-    return args_str
+    return [name for name in REQUIRED_MODULES if importlib.util.find_spec(name) is None]
 
 
 def apply_extra_args(content: str, extra_args: dict[str, str]) -> str:
@@ -107,7 +151,12 @@ def apply_extra_args(content: str, extra_args: dict[str, str]) -> str:
     Returns:
         The modified YAML content.
     """
-    config_snippet = cast(PreCommitConfig, yaml.safe_load(content))
+    import yaml
+
+    # Use the C implementation of YAML when available because it is much faster.
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    dumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+    config_snippet = cast(PreCommitConfig, yaml.load(content, Loader=loader))
     for repo in config_snippet:
         for hook in repo["hooks"]:
             hook_id = hook["id"]
@@ -116,297 +165,945 @@ def apply_extra_args(content: str, extra_args: dict[str, str]) -> str:
                 if "args" not in hook:
                     hook["args"] = []
                 hook["args"].extend(extra_args[hook_id].split())
-    return yaml.dump(config_snippet, sort_keys=False, default_flow_style=False)
-
+    return yaml.dump(
+        config_snippet, Dumper=dumper, sort_keys=False, default_flow_style=False
+    )
 
-def get_non_ignored_files() -> frozenset[str]:
-    """Returns a set of all non-ignored files in the repository.
 
-    Reads from local and global .gitignore files and prunes ignored
-    directories efficiently.
+@dataclasses.dataclass
+class Snippet:
+    """A config snippet, with its rendered forms cached.
 
-    Returns:
-        A set of relative file paths.
+    Attributes:
+        path: The path to the snippet file.
+        text: The contents of the snippet file.
+        rendered: The rendered YAML, keyed by the extra arguments that apply to
+            the snippet.
     """
-    patterns: list[str] = []
-
-    # Local ignores
-    gitignore = pathlib.Path(".gitignore")
-    if gitignore.exists():
-        with gitignore.open("r", encoding="utf-8") as f:
-            patterns.extend(f.readlines())
-    exclude = pathlib.Path(".git/info/exclude")
-    if exclude.exists():
-        with exclude.open("r", encoding="utf-8") as f:
-            patterns.extend(f.readlines())
-
-    # Global ignores
-    try:
-        ret = subprocess.run(
-            ["git", "config", "--get", "core.excludesfile"],
-            capture_output=True,
-            text=True,
-            check=True,
-        )
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        global_ignore_path = pathlib.Path("~/.config/git/ignore").expanduser()
-    else:
-        assert ret.stdout is not None
-        global_ignore_path = pathlib.Path(ret.stdout.strip()).expanduser()
 
-    if global_ignore_path.exists():
-        with global_ignore_path.open("r", encoding="utf-8") as f:
-            patterns.extend(f.readlines())
+    path: pathlib.Path
+    text: str
+    rendered: dict[tuple[tuple[str, str], ...], str] = dataclasses.field(
+        default_factory=dict
+    )
 
-    spec = pathspec.PathSpec.from_lines("gitignore", patterns)
-    all_files: set[str] = set()
+    def render(self, extra_args: dict[str, str]) -> str:
+        """Renders the snippet with extra arguments applied to its hooks.
 
-    for root, dirs, files in pathlib.Path(".").walk():
-        # Prune ignored directories in-place
-        dirs_to_keep: list[str] = []
-        for d in dirs:
-            if d == ".git":
-                continue
-            rel_dir = (root / d).as_posix()
-            # Check directory against pathspec (trailing slash required for some
-            # director patterns)
-            if not spec.match_file(rel_dir) and not spec.match_file(rel_dir + "/"):
-                dirs_to_keep.append(d)
-        dirs[:] = dirs_to_keep
+        Rendering normalises the YAML, so it is done once per combination of
+        extra arguments that apply to this snippet; extra arguments for hooks
+        that do not appear in the snippet are ignored.
 
-        # Add non-ignored files
-        for filename in files:
-            rel_file = (root / filename).as_posix()
-            if not spec.match_file(rel_file):
-                all_files.add(rel_file)
+        Args:
+            extra_args: A dictionary mapping hook IDs to extra argument strings.
 
-    return frozenset(all_files)
+        Returns:
+            The rendered YAML content.
+        """
+        relevant = tuple(
+            sorted(
+                (hook_id, args)
+                for hook_id, args in extra_args.items()
+                if hook_id in self.text
+            )
+        )
+        if relevant not in self.rendered:
+            self.rendered[relevant] = apply_extra_args(self.text, dict(relevant))
+        return self.rendered[relevant]
 
 
 @functools.cache
-def has_extension(files: frozenset[str], extension: str) -> bool:
-    """Checks if any file in the set has the given extension.
+def load_snippets(directory: pathlib.Path) -> dict[str, Snippet]:
+    """Reads every snippet in a directory, once per process.
 
     Args:
-        files: A set of relative file paths.
-        extension: The extension to check for (e.g., '.py').
+        directory: The directory containing the snippets.
 
     Returns:
-        True if any file ends with the extension.
+        A dictionary mapping snippet file names to snippets.
     """
-    return any(f.endswith(extension) for f in files)
+    return {
+        path.name: Snippet(path=path, text=path.read_text(encoding="utf-8"))
+        for path in directory.glob("*.yaml")
+    }
 
 
-def is_shell_script(filepath: pathlib.Path) -> bool:
-    """Checks if a file is a shell script by inspecting its shebang.
+def get_non_ignored_files(root: pathlib.Path) -> frozenset[str]:
+    """Returns a set of all non-ignored files in the repository.
+
+    Uses git when possible, falling back to walking the filesystem when root is
+    not in a git repository or git is not installed.
 
     Args:
-        filepath: The path to the file to check.
+        root: The root of the repository.
 
     Returns:
-        True if the file starts with a shell shebang.
+        A set of file paths relative to root.
     """
-    if not filepath.is_file():
-        return False
+    import subprocess
+
     try:
-        with filepath.open("r", encoding="utf-8") as f:
-            first_line = f.readline()
-    except (UnicodeDecodeError, PermissionError, OSError):
-        return False
+        return frozenset(script_utils.get_git_files(root))
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return frozenset(script_utils.walk_non_ignored_files(root))
 
-    if not first_line.startswith("#!"):
-        return False
-    # Common shell shebangs
-    return any(
-        shell in first_line
-        for shell in [
-            "/bin/sh",
-            "/bin/bash",
-            "/bin/dash",
-            "/bin/ksh",
-            "/bin/zsh",
-        ]
-    )
 
+@dataclasses.dataclass(frozen=True)
+class RepoProfile:
+    """An index of the files in a repository, built in a single pass.
 
-@functools.cache
-def should_include_actionlint(files: frozenset[str]) -> bool:
-    """Checks if GitHub Actions workflows exist.
+    Every detection rule is a constant time lookup in this index rather than a
+    scan over all the files in the repository.
+
+    Attributes:
+        root: The root of the repository.
+        files: All non-ignored file paths in the repository, relative to root.
+        extension_counts: The number of files with each extension, e.g. '.py'.
+        root_files: Files at the root of the repository.
+        prefix_extensions: The extensions of files under each watched directory.
+        extensionless_files: Files whose names do not contain a '.'.
+    """
+
+    root: pathlib.Path
+    files: frozenset[str]
+    extension_counts: collections.Counter[str]
+    root_files: frozenset[str]
+    prefix_extensions: dict[str, frozenset[str]]
+    extensionless_files: tuple[str, ...]
+
+    @classmethod
+    def from_files(
+        cls,
+        files: frozenset[str],
+        *,
+        root: pathlib.Path,
+        prefixes: abc.Iterable[str] = (),
+    ) -> "RepoProfile":
+        """Builds a profile from a set of files.
+
+        Args:
+            files: A set of all non-ignored file paths in the repository.
+            root: The root of the repository that files are relative to.
+            prefixes: Directories whose files' extensions are indexed separately.
+
+        Returns:
+            A RepoProfile indexing the files.
+        """
+        extension_counts = collections.Counter[str]()
+        root_files: set[str] = set()
+        prefix_extensions: dict[str, set[str]] = {prefix: set() for prefix in prefixes}
+        extensionless_files: list[str] = []
+        for f in files:
+            directory, slash, name = f.rpartition("/")
+            if not slash:
+                root_files.add(f)
+            dot = name.rfind(".")
+            if dot == -1:
+                extensionless_files.append(f)
+                continue
+            extension = name[dot:]
+            extension_counts[extension] += 1
+            if directory:
+                for prefix in prefix_extensions:
+                    if f.startswith(prefix):
+                        prefix_extensions[prefix].add(extension)
+        return cls(
+            root=root,
+            files=files,
+            extension_counts=extension_counts,
+            root_files=frozenset(root_files),
+            prefix_extensions={
+                prefix: frozenset(extensions)
+                for prefix, extensions in prefix_extensions.items()
+            },
+            extensionless_files=tuple(sorted(extensionless_files)),
+        )
+
+
+def parse_interpreter(header: bytes) -> str | None:
+    """Extracts the interpreter from the start of a file.
+
+    Directory components, `env` and its flags, and trailing version numbers are
+    removed, so '#!/usr/bin/env -S python3 -u' gives 'python'.
 
     Args:
-        files: A set of all non-ignored file paths in the repository.
+        header: The first bytes of a file.
 
     Returns:
-        True if any .yaml or .yml files exist in .github/workflows/.
+        The name of the interpreter, or None if there is no shebang.
     """
-    return any(
-        f.startswith(".github/workflows/")
-        and (f.endswith(".yaml") or f.endswith(".yml"))
-        for f in files
-    )
+    if not header.startswith(b"#!"):
+        return None
+    words = header[2:].split(b"\n", 1)[0].decode("utf-8", "replace").split()
+    if words and words[0].rpartition("/")[2] == "env":
+        words = [w for w in words[1:] if not w.startswith("-") and "=" not in w]
+    if not words:
+        return None
+    program = words[0].strip('"').rpartition("/")[2]
+    return program.rstrip("0123456789.") or None
 
 
-@functools.cache
-def should_include_golang(files: frozenset[str]) -> bool:
-    """Checks if Go files or a go.mod file exist.
+def sniff_interpreter(filepath: pathlib.Path) -> str | None:
+    """Finds the interpreter of a file by reading its shebang.
+
+    Only the first SHEBANG_READ_SIZE bytes are read, and results are cached by
+    device, inode, and modification time so unchanged files are only read once.
 
     Args:
-        files: A set of all non-ignored file paths in the repository.
+        filepath: The path to the file to check.
 
     Returns:
-        True if any .go files or a go.mod file exist.
+        The name of the interpreter, or None if the file is not a regular file or
+        does not have a shebang.
     """
-    return "go.mod" in files or has_extension(files, ".go")
-
-
-@functools.cache
-def should_include_json(files: frozenset[str]) -> bool:
-    """Checks if JSON files exist, excluding .vscode/settings.json.
+    try:
+        file_stat = filepath.stat()
+    except OSError:
+        return None
+    if not stat.S_ISREG(file_stat.st_mode):
+        return None
+    key = (file_stat.st_dev, file_stat.st_ino, file_stat.st_mtime_ns)
+    if key in SHEBANG_CACHE:
+        return SHEBANG_CACHE[key]
+    try:
+        with filepath.open("rb") as f:
+            interpreter = parse_interpreter(f.read(SHEBANG_READ_SIZE))
+    except OSError:
+        interpreter = None
+    SHEBANG_CACHE[key] = interpreter
+    return interpreter
+
+
+def find_interpreters(
+    files: abc.Iterable[str],
+    *,
+    root: pathlib.Path,
+    stop_at: frozenset[str] | None = None,
+) -> dict[str, str]:
+    """Finds the interpreters of many files in parallel.
 
     Args:
-        files: A set of all non-ignored file paths in the repository.
+        files: Paths of the files to check, relative to root.
+        root: The directory that files are relative to.
+        stop_at: Stop as soon as a file using one of these interpreters is
+            found; the remaining files are not checked. If None, every file is
+            checked.
 
     Returns:
-        True if any .json files exist, excluding .vscode/settings.json.
+        A mapping from file to interpreter for files with a shebang.
+    """
+    import concurrent.futures
+
+    interpreters: dict[str, str] = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=SHEBANG_WORKERS) as executor:
+        futures = {executor.submit(sniff_interpreter, root / f): f for f in files}
+        for future in concurrent.futures.as_completed(futures):
+            interpreter = future.result()
+            if interpreter is None:
+                continue
+            interpreters[futures[future]] = interpreter
+            if stop_at is not None and interpreter in stop_at:
+                executor.shutdown(wait=False, cancel_futures=True)
+                break
+    return interpreters
+
+
+@dataclasses.dataclass(frozen=True)
+class Rule:
+    """The conditions for including a snippet, from a table in RULES_FILE.
+
+    Attributes:
+        snippet: The name of the snippet in SNIPPETS_DIR.
+        always: Whether to include the snippet in every repository.
+        extensions: Include the snippet if any file has one of these extensions.
+        path_prefix: Only files under this directory count for extensions.
+        exclude_files: Files that do not count for extensions.
+        root_files: Include the snippet if any of these files are at the root.
+        interpreters: Include the snippet if any extension-less file has a
+            shebang using one of these interpreters.
     """
-    return any(f.endswith(".json") and f != ".vscode/settings.json" for f in files)
 
+    snippet: str
+    always: bool = False
+    extensions: frozenset[str] = frozenset()
+    path_prefix: str = ""
+    exclude_files: frozenset[str] = frozenset()
+    root_files: frozenset[str] = frozenset()
+    interpreters: frozenset[str] = frozenset()
 
-@functools.cache
-def should_include_readme_toc(files: frozenset[str]) -> bool:
-    """Checks if a README.md file exists at the root of the repository.
+    @classmethod
+    def from_table(cls, snippet: str, table: dict[str, object]) -> "Rule":
+        """Builds a rule from a table in RULES_FILE.
 
-    Args:
-        files: A set of all non-ignored file paths in the repository.
+        Args:
+            snippet: The name of the table, which is the name of the snippet.
+            table: The conditions in the table.
 
-    Returns:
-        True if a README.md file exists at the root of the repository.
+        Returns:
+            The rule.
+
+        Raises:
+            ValueError: if the table has unknown conditions or conditions with
+                the wrong type.
+        """
+        unknown = table.keys() - RULE_KEYS
+        if unknown:
+            raise ValueError(
+                f"{snippet}: unknown conditions: {', '.join(sorted(unknown))}"
+            )
+        always = table.get("always", False)
+        if not isinstance(always, bool):
+            raise ValueError(f"{snippet}: always must be a boolean")
+        path_prefix = table.get("path_prefix", "")
+        if not isinstance(path_prefix, str):
+            raise ValueError(f"{snippet}: path_prefix must be a string")
+        lists: dict[str, frozenset[str]] = {}
+        for key in ["extensions", "exclude_files", "root_files", "interpreters"]:
+            value = table.get(key, [])
+            if not isinstance(value, list) or not all(
+                isinstance(item, str) for item in cast(list[object], value)
+            ):
+                raise ValueError(f"{snippet}: {key} must be a list of strings")
+            lists[key] = frozenset(cast(list[str], value))
+        if path_prefix and lists["exclude_files"]:
+            raise ValueError(
+                f"{snippet}: exclude_files cannot be used with path_prefix"
+            )
+        return cls(
+            snippet=snippet,
+            always=always,
+            extensions=lists["extensions"],
+            path_prefix=path_prefix,
+            exclude_files=lists["exclude_files"],
+            root_files=lists["root_files"],
+            interpreters=lists["interpreters"],
+        )
+
+
+@dataclasses.dataclass(frozen=True)
+class SnippetRules:
+    """Rules compiled into lookup tables so they are all evaluated together.
+
+    Detection looks at each distinct extension, root file, and watched directory
+    in a RepoProfile once, rather than evaluating each rule separately, and
+    reads shebangs at most once for all the rules that need them.
+
+    Attributes:
+        order: Every snippet with a rule, in output order.
+        always: Snippets included in every repository.
+        by_extension: For each extension, the snippets it includes and the
+            files with that extension that do not count.
+        by_prefix_extension: For each (path prefix, extension), the snippets
+            it includes.
+        by_root_file: For each root file, the snippets it includes.
+        by_interpreter: For each interpreter, the snippets it includes.
     """
-    return "README.md" in files
+
+    order: tuple[str, ...]
+    always: frozenset[str]
+    by_extension: dict[str, list[tuple[str, frozenset[str]]]]
+    by_prefix_extension: dict[tuple[str, str], list[str]]
+    by_root_file: dict[str, list[str]]
+    by_interpreter: dict[str, list[str]]
+
+    @property
+    def prefixes(self) -> frozenset[str]:
+        """The directories that RepoProfile needs to watch for these rules."""
+        return frozenset(prefix for prefix, _ in self.by_prefix_extension)
+
+    @classmethod
+    def compile(cls, rules: abc.Iterable[Rule]) -> "SnippetRules":
+        """Compiles rules into lookup tables.
+
+        Args:
+            rules: The rules, in output order.
+
+        Returns:
+            The compiled rules.
+        """
+        order: list[str] = []
+        always: set[str] = set()
+        by_extension: dict[str, list[tuple[str, frozenset[str]]]] = {}
+        by_prefix_extension: dict[tuple[str, str], list[str]] = {}
+        by_root_file: dict[str, list[str]] = {}
+        by_interpreter: dict[str, list[str]] = {}
+        for rule in rules:
+            order.append(rule.snippet)
+            if rule.always:
+                always.add(rule.snippet)
+            for extension in sorted(rule.extensions):
+                if rule.path_prefix:
+                    by_prefix_extension.setdefault(
+                        (rule.path_prefix, extension), []
+                    ).append(rule.snippet)
+                    continue
+                excluded = frozenset(
+                    f for f in rule.exclude_files if f.endswith(extension)
+                )
+                by_extension.setdefault(extension, []).append((rule.snippet, excluded))
+            for root_file in sorted(rule.root_files):
+                by_root_file.setdefault(root_file, []).append(rule.snippet)
+            for interpreter in sorted(rule.interpreters):
+                by_interpreter.setdefault(interpreter, []).append(rule.snippet)
+        return cls(
+            order=tuple(order),
+            always=frozenset(always),
+            by_extension=by_extension,
+            by_prefix_extension=by_prefix_extension,
+            by_root_file=by_root_file,
+            by_interpreter=by_interpreter,
+        )
+
+    def detect(self, profile: RepoProfile) -> list[tuple[str, bool]]:
+        """Decides which snippets a repository needs.
+
+        Shebangs are only read if a snippet can still be included by its
+        interpreter conditions, and reading stops at the first match when only
+        one snippet is waiting.
+
+        Args:
+            profile: The profile of the repository, built with prefixes.
+
+        Returns:
+            A list of snippets and whether they should be included, in the
+            desired output order.
+        """
+        matched = set(self.always)
+        for extension, count in profile.extension_counts.items():
+            for snippet, excluded in self.by_extension.get(extension, []):
+                if count > len(excluded & profile.files):
+                    matched.add(snippet)
+        for prefix, extensions in profile.prefix_extensions.items():
+            for extension in extensions:
+                matched.update(self.by_prefix_extension.get((prefix, extension), []))
+        for root_file in profile.root_files & self.by_root_file.keys():
+            matched.update(self.by_root_file[root_file])
+        pending = {
+            interpreter: [s for s in snippets if s not in matched]
+            for interpreter, snippets in self.by_interpreter.items()
+        }
+        waiting = {s for snippets in pending.values() for s in snippets}
+        if waiting:
+            stop_at = (
+                frozenset(i for i, snippets in pending.items() if snippets)
+                if len(waiting) == 1
+                else frozenset[str]()
+            )
+            interpreters = find_interpreters(
+                profile.extensionless_files, root=profile.root, stop_at=stop_at
+            )
+            for interpreter in set(interpreters.values()):
+                matched.update(pending.get(interpreter, []))
+        return [(snippet, snippet in matched) for snippet in self.order]
 
 
 @functools.cache
-def should_include_rust(files: frozenset[str]) -> bool:
-    """Checks if Rust files or a Cargo.toml file exist.
+def load_rules(path: pathlib.Path) -> SnippetRules:
+    """Reads and compiles a rules file, once per process.
+
+    Each table in the file is named after a snippet and holds the conditions
+    that include it; the order of the tables is the output order.
 
     Args:
-        files: A set of all non-ignored file paths in the repository.
+        path: The path to the rules file.
 
     Returns:
-        True if any .rs files or a Cargo.toml file exist.
+        The compiled rules.
+
+    Raises:
+        ValueError: if the file is not valid TOML or a rule is invalid.
     """
-    return "Cargo.toml" in files or has_extension(files, ".rs")
+    import tomllib
+
+    with path.open("rb") as f:
+        tables = cast(dict[str, object], tomllib.load(f))
+    rules: list[Rule] = []
+    for snippet, table in tables.items():
+        if not isinstance(table, dict):
+            raise ValueError(f"{path}: {snippet} must be a table")
+        try:
+            rules.append(Rule.from_table(snippet, cast(dict[str, object], table)))
+        except ValueError as e:
+            raise ValueError(f"{path}: {e}") from e
+    return SnippetRules.compile(rules)
 
 
-@functools.cache
-def should_include_shellcheck(files: frozenset[str]) -> bool:
-    """Checks if Shell scripts exist.
+@dataclasses.dataclass(frozen=True)
+class ConfigBlock:
+    """A run of consecutive lines in a config.
 
-    Args:
-        files: A set of all non-ignored file paths in the repository.
+    Attributes:
+        lines: The lines in the block, including the markers of a managed block.
+        name: The snippet name of a managed block, or None for a user block.
+    """
 
-    Returns:
-        True if any .sh files exist or any extension-less files are shell scripts.
+    lines: tuple[str, ...]
+    name: str | None = None
+
+
+@dataclasses.dataclass(frozen=True)
+class ConfigModel:
+    """A config split into user blocks and managed blocks.
+
+    The `repos:` line always ends a user block, so managed blocks can be
+    inserted after it without splitting a block.
+
+    Attributes:
+        shebang: The shebang line, or None if the config does not have one.
+        blocks: The blocks in the config, in order.
+        managed: The index in blocks of the managed block for each snippet.
+        repos_index: The index in blocks of the block ending with `repos:`, or
+            None if the config does not have a `repos:` line.
     """
 
-    return has_extension(files, ".sh") or any(
-        "." not in pathlib.Path(f).name and is_shell_script(pathlib.Path(f))
-        for f in files
-    )
+    shebang: str | None
+    blocks: tuple[ConfigBlock, ...]
+    managed: dict[str, int]
+    repos_index: int | None
+
+    @classmethod
+    def parse(cls, lines: list[str]) -> "ConfigModel":
+        """Parses a config in a single pass.
+
+        End markers outside a managed block are dropped, and a managed block
+        without an end marker runs to the end of the file. Only the first
+        managed block for each snippet is indexed.
+
+        Args:
+            lines: The lines of the config.
+
+        Returns:
+            The model of the config.
+        """
+        shebang = lines[0] if lines and lines[0].startswith("#!") else None
+        blocks: list[ConfigBlock] = []
+        managed: dict[str, int] = {}
+        repos_index: int | None = None
+        current: list[str] = []
+        name: str | None = None
+
+        def finish_block() -> None:
+            """Ends the current block and indexes it if it is a managed block."""
+            if name is not None:
+                _ = managed.setdefault(name, len(blocks))
+            if current:
+                blocks.append(ConfigBlock(lines=tuple(current), name=name))
+            current.clear()
+
+        for line in lines[1:] if shebang is not None else lines:
+            stripped = line.strip()
+            if name is not None:
+                current.append(line)
+                if stripped.startswith(MARKER_END):
+                    finish_block()
+                    name = None
+            elif stripped.startswith(MARKER_START):
+                finish_block()
+                current.append(line)
+                name = stripped.removeprefix(MARKER_START).strip()
+            elif stripped.startswith(MARKER_END):
+                continue
+            else:
+                current.append(line)
+                if repos_index is None and stripped.startswith("repos:"):
+                    finish_block()
+                    repos_index = len(blocks) - 1
+        finish_block()
+        return cls(
+            shebang=shebang,
+            blocks=tuple(blocks),
+            managed=managed,
+            repos_index=repos_index,
+        )
+
+    def update(
+        self, *, shebang: str, managed_blocks: dict[str, tuple[str, ...]]
+    ) -> "ConfigModel":
+        """Replaces the shebang and the managed blocks.
+
+        Existing managed blocks are replaced where they are, and managed blocks
+        that are not wanted are removed, so user blocks and the order of
+        existing managed blocks are untouched. A new managed block is inserted
+        after the block of the snippet before it in managed_blocks, or after
+        `repos:` if there isn't one; `repos:` is added if it is missing.
+
+        Args:
+            shebang: The new shebang line.
+            managed_blocks: The lines of each wanted managed block, including
+                the markers, in the desired order.
+
+        Returns:
+            The updated model.
+        """
+        blocks = list(self.blocks)
+        repos_index = self.repos_index
+        if repos_index is None:
+            blocks.append(ConfigBlock(lines=("repos:\n",)))
+            repos_index = len(blocks) - 1
+
+        # New blocks grouped by the existing snippet they follow.
+        inserts: dict[str | None, list[str]] = {}
+        anchor: str | None = None
+        for name in managed_blocks:
+            if name in self.managed:
+                anchor = name
+            else:
+                inserts.setdefault(anchor, []).append(name)
+
+        new_blocks: list[ConfigBlock] = []
+        managed: dict[str, int] = {}
+        new_repos_index = repos_index
+
+        def insert_after(name: str | None) -> None:
+            """Appends the new managed blocks that follow a snippet.
+
+            Args:
+                name: The snippet the new blocks follow, or None for the blocks
+                    that follow `repos:`.
+            """
+            for new_name in inserts.get(name, []):
+                managed[new_name] = len(new_blocks)
+                new_blocks.append(
+                    ConfigBlock(lines=managed_blocks[new_name], name=new_name)
+                )
+
+        for i, block in enumerate(blocks):
+            if block.name is None:
+                new_blocks.append(block)
+                if i == repos_index:
+                    new_repos_index = len(new_blocks) - 1
+                    insert_after(None)
+            elif block.name in managed_blocks and self.managed[block.name] == i:
+                managed[block.name] = len(new_blocks)
+                new_blocks.append(
+                    ConfigBlock(lines=managed_blocks[block.name], name=block.name)
+                )
+                insert_after(block.name)
+        return ConfigModel(
+            shebang=shebang,
+            blocks=tuple(new_blocks),
+            managed=managed,
+            repos_index=new_repos_index,
+        )
+
+    def render(self) -> str:
+        """Renders the model back into the text of a config.
+
+        Returns:
+            The text of the config.
+        """
+        return (self.shebang or "") + "".join(
+            line for block in self.blocks for line in block.lines
+        )
 
 
 def populate_pre_commit(
-    *, extra_args: dict[str, str], script_file: str, snippets: list[tuple[str, bool]]
-) -> None:
+    *,
+    root: pathlib.Path,
+    extra_args: dict[str, str],
+    script_file: str,
+    snippets: list[tuple[str, bool]],
+) -> bool:
     """Updates .pre-commit-config.yaml with detected snippets.
 
     Args:
+        root: The root of the repository containing the config.
         extra_args: A dictionary mapping hook IDs to extra arguments.
         script_file: The path to the script calling this function (used for shebang).
         snippets: A list of snippets and whether they should be included.
+
+    Returns:
+        True if the contents of the config changed; the config is not rewritten
+        if it is already up to date.
     """
+    config_file = root / CONFIG_FILE
+    original = ""
     lines: list[str] = []
-    if CONFIG_FILE.exists():
-        with CONFIG_FILE.open("r", encoding="utf-8") as f:
+    if config_file.exists():
+        with config_file.open("r", encoding="utf-8") as f:
             lines = f.readlines()
+        original = "".join(lines)
     else:
         lines = ["repos:\n"]
 
-    # Determine which snippets to include.
-    to_include: list[str] = []
+    all_snippets = load_snippets(SNIPPETS_DIR)
+    managed_blocks: dict[str, tuple[str, ...]] = {}
     for snippet_name, should_include in snippets:
-        if should_include:
-            to_include.append(snippet_name)
-
-    # 1. Remove all existing managed blocks AND the shebang.
-    new_lines: list[str] = []
-    skip: bool = False
-    for i, line in enumerate(lines):
-        if i == 0 and line.startswith("#!"):
-            continue
-        if line.strip().startswith("# managed-by-populate-pre-commit start:"):
-            skip = True
+        if not should_include:
             continue
-        if line.strip().startswith("# managed-by-populate-pre-commit end:"):
-            skip = False
-            continue
-        if not skip:
-            new_lines.append(line)
-
-    # 2. Find where to insert. Ideally immediately after 'repos:'.
-    repos_idx: int = -1
-    for i, line in enumerate(new_lines):
-        if line.strip().startswith("repos:"):
-            repos_idx = i
-            break
-
-    if repos_idx == -1:
-        # If 'repos:' is missing, add it.
-        new_lines.append("repos:\n")
-        repos_idx = len(new_lines) - 1
-
-    # 3. Prepare snippet lines.
-    snippet_lines: list[str] = []
-    for snippet_name in to_include:
         snippet_path = SNIPPETS_DIR / snippet_name
-        try:
-            content = snippet_path.read_text(encoding="utf-8")
-        except FileNotFoundError:
-            raise
-        if not content.strip():
+        if snippet_name not in all_snippets:
+            raise FileNotFoundError(
+                errno.ENOENT, os.strerror(errno.ENOENT), str(snippet_path)
+            )
+        snippet = all_snippets[snippet_name]
+        if not snippet.text.strip():
             raise ValueError(f"config snippet {snippet_path} is empty")
+        managed_blocks[snippet_name] = (
+            f"  {MARKER_START} {snippet_name}\n",
+            *(f"  {line}\n" for line in snippet.render(extra_args).splitlines()),
+            f"  {MARKER_END} {snippet_name}\n",
+        )
+
+    shebang_args = script_utils.build_shebang_args(extra_args)
+    script_name = script_utils.escape_for_env_s(pathlib.Path(script_file).name)
+    shebang = f'#!/usr/bin/env -S "{script_name}"{shebang_args}\n'
+    model = ConfigModel.parse(lines).update(
+        shebang=shebang, managed_blocks=managed_blocks
+    )
+
+    new_config = model.render()
+    if new_config == original:
+        if config_file.stat().st_mode & 0o777 != CONFIG_MODE:
+            config_file.chmod(CONFIG_MODE)
+        return False
+    script_utils.write_atomically(config_file, new_config, CONFIG_MODE)
+    return True
 
-        snippet_lines.append(
-            f"  # managed-by-populate-pre-commit start: {snippet_name}\n"
+
+@dataclasses.dataclass(frozen=True)
+class RepoResult:
+    """The result of updating a single repository.
+
+    Attributes:
+        root: The root of the repository.
+        num_snippets: The number of snippets included in the config.
+        changed: Whether the contents of the config changed.
+    """
+
+    root: pathlib.Path
+    num_snippets: int
+    changed: bool
+
+
+def detection_fingerprint(root: pathlib.Path) -> str | None:
+    """Fingerprints everything that detection results depend on.
+
+    The fingerprint covers the size and modification time of the git index, the
+    untracked files that git does not ignore, and the snippets directory, the
+    rules file, and this script. Listing the untracked files honours every
+    .gitignore, so adding or ignoring a file changes the fingerprint; changing
+    a file's shebang without staging it does not, and --no-cache forces
+    detection.
+
+    Args:
+        root: The root of the repository.
+
+    Returns:
+        The fingerprint, or None if root does not have a .git directory or git
+        cannot list its untracked files.
+    """
+    import hashlib
+    import subprocess
+
+    git_dir = root / ".git"
+    if not git_dir.is_dir():
+        return None
+    try:
+        untracked = script_utils.get_git_files(root, cached=False)
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return None
+    digest = hashlib.sha256()
+    try:
+        index_stat = (git_dir / "index").stat()
+    except FileNotFoundError:
+        digest.update(b"index: missing\n")
+    else:
+        digest.update(
+            f"index: {index_stat.st_mtime_ns} {index_stat.st_size}\n".encode()
         )
-        snippet_content = apply_extra_args(content, extra_args)
-        for line in snippet_content.splitlines():
-            snippet_lines.append(f"  {line}\n")
-        snippet_lines.append(
-            f"  # managed-by-populate-pre-commit end: {snippet_name}\n"
+    for name in sorted(untracked):
+        digest.update(f"untracked: {name}\n".encode())
+    for path in [
+        pathlib.Path(__file__),
+        RULES_FILE,
+        *sorted(SNIPPETS_DIR.iterdir()),
+    ]:
+        path_stat = path.stat()
+        digest.update(
+            f"{path.name}: {path_stat.st_mtime_ns} {path_stat.st_size}\n".encode()
         )
+    return digest.hexdigest()
+
+
+def read_detection_cache(
+    root: pathlib.Path, fingerprint: str
+) -> list[tuple[str, bool]] | None:
+    """Reads cached detection results for a repository.
+
+    Args:
+        root: The root of the repository.
+        fingerprint: The current fingerprint of the repository.
+
+    Returns:
+        The cached snippets and whether they should be included, or None if
+        there are no cached results or they are out of date.
+    """
+    import json
+
+    try:
+        cache = cast(
+            DetectionCache,
+            json.loads((root / DETECTION_CACHE_FILE).read_text(encoding="utf-8")),
+        )
+        if cache["fingerprint"] != fingerprint:
+            return None
+        return list(cache["snippets"].items())
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+
+def write_detection_cache(
+    root: pathlib.Path, fingerprint: str, snippets: list[tuple[str, bool]]
+) -> None:
+    """Caches detection results for a repository.
 
-    # 4. Insert snippets.
-    insert_pos: int = repos_idx + 1
-    final_lines: list[str] = (
-        new_lines[:insert_pos] + snippet_lines + new_lines[insert_pos:]
+    Failing to write the cache is not an error, because the results will simply
+    be detected again next time.
+
+    Args:
+        root: The root of the repository.
+        fingerprint: The current fingerprint of the repository.
+        snippets: A list of snippets and whether they should be included.
+    """
+    import json
+
+    cache: DetectionCache = {"fingerprint": fingerprint, "snippets": dict(snippets)}
+    try:
+        script_utils.write_atomically(
+            root / DETECTION_CACHE_FILE, json.dumps(cache) + "\n", 0o644
+        )
+    except OSError:
+        pass
+
+
+def update_repo(
+    *,
+    root: pathlib.Path,
+    extra_args: dict[str, str],
+    script_file: str,
+    use_cache: bool = True,
+) -> RepoResult:
+    """Detects the snippets a repository needs and updates its config.
+
+    Detection results are cached in the repository's .git directory once the
+    config has been written, and reused without looking at any files while the
+    repository's fingerprint is unchanged.
+
+    Args:
+        root: The root of the repository.
+        extra_args: A dictionary mapping hook IDs to extra arguments.
+        script_file: The path to the script (used for shebang).
+        use_cache: Whether to use cached detection results; the cache is
+            updated either way.
+
+    Returns:
+        The result of updating the repository.
+    """
+    fingerprint = detection_fingerprint(root)
+    snippets: list[tuple[str, bool]] | None = None
+    detected = False
+    if use_cache and fingerprint is not None:
+        snippets = read_detection_cache(root, fingerprint)
+    if snippets is None:
+        rules = load_rules(RULES_FILE)
+        profile = RepoProfile.from_files(
+            get_non_ignored_files(root), root=root, prefixes=rules.prefixes
+        )
+        snippets = rules.detect(profile)
+        detected = True
+    changed = populate_pre_commit(
+        root=root, extra_args=extra_args, script_file=script_file, snippets=snippets
+    )
+    # Only cache results that produced a config, so a failed update is retried
+    # with fresh detection.
+    if detected and fingerprint is not None:
+        write_detection_cache(root, fingerprint, snippets)
+    return RepoResult(
+        root=root,
+        num_snippets=sum(1 for _, include in snippets if include),
+        changed=changed,
     )
 
-    # 5. Write back to file with shebang.
-    shebang_args = build_shebang_args(extra_args)
-    script_name = escape_for_env_s(pathlib.Path(script_file).name)
-    shebang = f'#!/usr/bin/env -S "{script_name}"{shebang_args}\n'
 
-    with CONFIG_FILE.open("w", encoding="utf-8") as f:
-        f.write(shebang)
-        f.writelines(final_lines)
-    CONFIG_FILE.chmod(0o755)
+def update_repos(
+    *,
+    roots: list[pathlib.Path],
+    extra_args: dict[str, str],
+    script_file: str,
+    jobs: int,
+    use_cache: bool = True,
+) -> int:
+    """Updates many repositories in parallel and prints a summary.
+
+    Each repository keeps the extra arguments from the shebang of its existing
+    config, overridden by extra_args.
+
+    Args:
+        roots: The roots of the repositories.
+        extra_args: A dictionary mapping hook IDs to extra arguments.
+        script_file: The path to the script (used for shebang).
+        jobs: The number of repositories to update at once.
+        use_cache: Whether to use cached detection results.
+
+    Returns:
+        0 if every repository was updated successfully, 1 otherwise.
+    """
+    import concurrent.futures
+    import subprocess
+
+    def update_one(root: pathlib.Path) -> RepoResult:
+        """Updates one repository, merging in the extra args from its shebang.
+
+        Args:
+            root: The root of the repository.
+
+        Returns:
+            The result of updating the repository.
+        """
+        repo_extra_args = script_utils.read_shebang_extra_args(
+            root / CONFIG_FILE, "hook_id"
+        )
+        repo_extra_args.update(extra_args)
+        return update_repo(
+            root=root,
+            extra_args=repo_extra_args,
+            script_file=script_file,
+            use_cache=use_cache,
+        )
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(update_one, root) for root in roots]
+
+    num_changed = num_unchanged = num_failed = 0
+    for root, future in zip(roots, futures):
+        try:
+            result = future.result()
+        except (OSError, ValueError, subprocess.CalledProcessError) as e:
+            print(f"{root}: failed: {e}")
+            num_failed += 1
+            continue
+        if result.changed:
+            print(f"{root}: updated with {result.num_snippets} snippets")
+            num_changed += 1
+        else:
+            print(f"{root}: unchanged")
+            num_unchanged += 1
+    print(
+        f"{len(roots)} repositories: {num_changed} updated, "
+        + f"{num_unchanged} unchanged, {num_failed} failed."
+    )
+    return 1 if num_failed else 0
 
-    print(f"Updated {CONFIG_FILE} with {len(to_include)} snippets.")
 
+def main() -> int:
+    """Parses arguments and populates the pre-commit config.
+
+    Returns:
+        The exit status for the script.
+    """
+    import get_git_root
 
-def main() -> None:
-    """Parses arguments and populates the pre-commit config."""
     parser = argparse.ArgumentParser(
         description="Populate .pre-commit-config.yaml with managed snippets."
     )
@@ -421,53 +1118,65 @@ def main() -> None:
         action="append",
         help="Extra arguments for a hook, in the format 'hook_id=args'.",
     )
+    parser.add_argument(
+        "--repos",
+        nargs="+",
+        metavar="DIR",
+        help="Update the repositories rooted at these directories rather than "
+        + "the current repository; extra arguments are read from each config.",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=script_utils.positive_int,
+        default=DEFAULT_JOBS,
+        help="The number of repositories to update at once with --repos "
+        + "(default: %(default)s).",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Detect file types again rather than using cached results, e.g. "
+        + "after changing the shebang of a file without staging it.",
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Exit with status 1 if the Python modules needed to update configs "
+        + "are not installed, without updating anything.",
+    )
     args = parser.parse_args(namespace=Args())
 
-    command_to_extra_args: dict[str, str] = {}
-    for item in args.extra_args:
-        if "=" not in item:
-            raise ValueError(
-                f"Invalid --extra-arg format: '{item}'. Expected 'hook_id=args'."
-            )
-        hook_id, extra = item.split("=", 1)
-        command_to_extra_args[hook_id.strip()] = extra.strip()
-
-    git_root = get_git_root.get_git_root()
-    os.chdir(git_root)
-
-    all_files = get_non_ignored_files()
-    # Define snippets and their detection logic in the desired output order.
-    snippets: list[tuple[str, bool]] = [
-        # keep-sorted start
-        ("actionlint.yaml", should_include_actionlint(all_files)),
-        ("basedpyright.yaml", has_extension(all_files, ".py")),
-        ("black.yaml", has_extension(all_files, ".py")),
-        ("conventional-pre-commit.yaml", True),
-        ("golang-coverage-check.yaml", should_include_golang(all_files)),
-        ("golang.yaml", should_include_golang(all_files)),
-        ("golangci-lint.yaml", should_include_golang(all_files)),
-        ("hooks.yaml", True),
-        ("json.yaml", should_include_json(all_files)),
-        ("keep-sorted.yaml", True),
-        ("markdownlint.yaml", has_extension(all_files, ".md")),
-        ("meta.yaml", True),
-        ("mypy.yaml", has_extension(all_files, ".py")),
-        ("pygrep-hooks.yaml", has_extension(all_files, ".py")),
-        ("pyrefly.yaml", has_extension(all_files, ".py")),
-        ("pytest.yaml", has_extension(all_files, ".py")),
-        ("python.yaml", has_extension(all_files, ".py")),
-        ("readme-toc.yaml", should_include_readme_toc(all_files)),
-        ("rust.yaml", should_include_rust(all_files)),
-        ("shellcheck.yaml", should_include_shellcheck(all_files)),
-        ("spellcheck.yaml", True),
-        ("toml.yaml", has_extension(all_files, ".toml")),
-        # keep-sorted end
-    ]
-
-    populate_pre_commit(
-        extra_args=command_to_extra_args, script_file=__file__, snippets=snippets
+    if args.check:
+        missing = find_missing_modules()
+        if missing:
+            print(f"Missing Python modules: {', '.join(missing)}", file=sys.stderr)
+            return 1
+        return 0
+
+    command_to_extra_args = script_utils.parse_extra_args(args.extra_args, "hook_id")
+
+    if args.repos:
+        return update_repos(
+            roots=[pathlib.Path(repo) for repo in args.repos],
+            extra_args=command_to_extra_args,
+            script_file=__file__,
+            jobs=args.jobs,
+            use_cache=not args.no_cache,
+        )
+
+    git_root = pathlib.Path(get_git_root.get_git_root())
+    result = update_repo(
+        root=git_root,
+        extra_args=command_to_extra_args,
+        script_file=__file__,
+        use_cache=not args.no_cache,
     )
+    if result.changed:
+        print(f"Updated {CONFIG_FILE} with {result.num_snippets} snippets.")
+    else:
+        print(f"{CONFIG_FILE} is unchanged with {result.num_snippets} snippets.")
+    return 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
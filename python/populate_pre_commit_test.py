@@ -1,25 +1,52 @@
 """Tests for populate_pre_commit.py."""
 
+import importlib.machinery
+import importlib.util
+import io
 import os
 import pathlib
 import subprocess
+import sys
+import tempfile
 import textwrap
 from typing import cast, override
 import unittest
 from unittest import mock
 
 import pyfakefs.fake_filesystem_unittest
+import yaml
 
 import get_git_root
 import populate_pre_commit
+import script_utils
 
+# The rules that ship with populate_pre_commit.py.
+RULES = populate_pre_commit.load_rules(populate_pre_commit.RULES_FILE)
 
-class TestShouldInclude(pyfakefs.fake_filesystem_unittest.TestCase):
-    """Tests for the should_include_* detection functions."""
+
+def make_profile(*files: str) -> populate_pre_commit.RepoProfile:
+    """Builds a RepoProfile from the given files."""
+    return populate_pre_commit.RepoProfile.from_files(
+        frozenset[str](files), root=pathlib.Path("."), prefixes=RULES.prefixes
+    )
+
+
+def included(snippet: str, *files: str) -> bool:
+    """Checks whether RULES include a snippet for the given files."""
+    return dict(RULES.detect(make_profile(*files)))[snippet]
+
+
+class TestDetection(pyfakefs.fake_filesystem_unittest.TestCase):
+    """Tests for detecting which snippets a repository needs."""
 
     @override
     def setUp(self) -> None:
         self.setUpPyfakefs()
+        self.enterContext(
+            mock.patch.dict(populate_pre_commit.SHEBANG_CACHE, clear=True)
+        )
+        # pyfakefs is not thread-safe, so only use one thread to read files.
+        self.enterContext(mock.patch.object(populate_pre_commit, "SHEBANG_WORKERS", 1))
 
     def create_file(
         self, file_path: pathlib.Path | str, contents: str | bytes = ""
@@ -28,141 +55,480 @@ class TestShouldInclude(pyfakefs.fake_filesystem_unittest.TestCase):
             file_path, contents=contents
         )
 
-    def test_should_include_actionlint(self) -> None:
+    def test_actionlint(self) -> None:
+        self.assertFalse(included("actionlint.yaml"))
+        self.assertTrue(included("actionlint.yaml", ".github/workflows/ci.yaml"))
+
+    def test_actionlint_other_files(self) -> None:
+        """Tests that actionlint ignores non-workflow files."""
         self.assertFalse(
-            populate_pre_commit.should_include_actionlint(frozenset[str]())
-        )
-        self.assertTrue(
-            populate_pre_commit.should_include_actionlint(
-                frozenset[str]({".github/workflows/ci.yaml"})
-            )
+            included("actionlint.yaml", ".github/workflows/README.md", "ci.yaml")
         )
 
-    def test_should_include_actionlint_yml(self) -> None:
-        """Tests should_include_actionlint with .yml files."""
-        self.assertTrue(
-            populate_pre_commit.should_include_actionlint(
-                frozenset[str]({".github/workflows/ci.yml"})
-            )
-        )
+    def test_actionlint_yml(self) -> None:
+        """Tests actionlint with .yml files."""
+        self.assertTrue(included("actionlint.yaml", ".github/workflows/ci.yml"))
 
-    def test_has_extension(self) -> None:
-        """Tests the has_extension function."""
-        self.assertFalse(populate_pre_commit.has_extension(frozenset[str](), ".md"))
-        self.assertTrue(
-            populate_pre_commit.has_extension(frozenset[str]({"README.md"}), ".md")
-        )
-        self.assertFalse(
-            populate_pre_commit.has_extension(frozenset[str]({"README.txt"}), ".md")
-        )
-        self.assertTrue(
-            populate_pre_commit.has_extension(frozenset[str]({"main.py"}), ".py")
-        )
-        self.assertTrue(
-            populate_pre_commit.has_extension(frozenset[str]({"data.json"}), ".json")
-        )
-        self.assertTrue(
-            populate_pre_commit.has_extension(frozenset[str]({"config.toml"}), ".toml")
-        )
+    def test_extensions(self) -> None:
+        """Tests snippets that are included by extension."""
+        self.assertFalse(included("markdownlint.yaml"))
+        self.assertTrue(included("markdownlint.yaml", "README.md"))
+        self.assertFalse(included("markdownlint.yaml", "README.txt"))
+        self.assertTrue(included("python.yaml", "main.py"))
+        self.assertTrue(included("json.yaml", "data.json"))
+        self.assertTrue(included("toml.yaml", "config.toml"))
 
-    def test_should_include_shellcheck(self) -> None:
-        self.assertFalse(
-            populate_pre_commit.should_include_shellcheck(frozenset[str]())
-        )
-        self.assertTrue(
-            populate_pre_commit.should_include_shellcheck(frozenset[str]({"script.sh"}))
-        )
+    def test_always(self) -> None:
+        self.assertTrue(included("meta.yaml"))
+
+    def test_shellcheck(self) -> None:
+        self.assertFalse(included("shellcheck.yaml"))
+        self.assertTrue(included("shellcheck.yaml", "script.sh"))
 
-    def test_should_include_shellcheck_shebang(self) -> None:
-        """Tests should_include_shellcheck with extension-less shell scripts."""
+    def test_shellcheck_shebang(self) -> None:
+        """Tests shellcheck with extension-less shell scripts."""
         self.create_file("deploy", contents="#!/bin/bash\necho hello\n")
-        self.assertTrue(
-            populate_pre_commit.should_include_shellcheck(frozenset[str]({"deploy"}))
-        )
+        self.assertTrue(included("shellcheck.yaml", "deploy"))
 
-    def test_should_include_shellcheck_non_shell_shebang(self) -> None:
-        """Tests should_include_shellcheck with non-shell shebang."""
+    def test_shellcheck_non_shell_shebang(self) -> None:
+        """Tests shellcheck with non-shell shebang."""
         self.create_file("main", contents="#!/usr/bin/env python3\nprint('hi')\n")
-        self.assertFalse(
-            populate_pre_commit.should_include_shellcheck(frozenset[str]({"main"}))
-        )
-
-    def test_is_shell_script_not_file(self) -> None:
-        """Tests is_shell_script with a directory path."""
+        self.assertFalse(included("shellcheck.yaml", "main"))
+
+    def test_shellcheck_env_shebang(self) -> None:
+        """Tests shellcheck with a shell found through env."""
+        self.create_file("python-script", contents="#!/usr/bin/env python3\n")
+        self.create_file("shell-script", contents="#!/usr/bin/env bash\n")
+        self.assertTrue(included("shellcheck.yaml", "python-script", "shell-script"))
+
+    def test_shellcheck_skips_shebangs_when_matched(self) -> None:
+        """Tests that shebangs are not read if a .sh file already matched."""
+        with mock.patch.object(populate_pre_commit, "find_interpreters") as mock_find:
+            self.assertTrue(included("shellcheck.yaml", "script.sh", "deploy"))
+        mock_find.assert_not_called()
+
+    def test_sniff_interpreter_not_file(self) -> None:
+        """Tests sniff_interpreter with a directory path."""
         pathlib.Path("dir").mkdir()
-        self.assertFalse(populate_pre_commit.is_shell_script(pathlib.Path("dir")))
+        self.assertIsNone(populate_pre_commit.sniff_interpreter(pathlib.Path("dir")))
 
-    def test_is_shell_script_no_shebang(self) -> None:
-        """Tests is_shell_script with a file that has no shebang."""
+    def test_sniff_interpreter_no_shebang(self) -> None:
+        """Tests sniff_interpreter with a file that has no shebang."""
         self.create_file("plain", contents="no shebang here\n")
-        self.assertFalse(populate_pre_commit.is_shell_script(pathlib.Path("plain")))
+        self.assertIsNone(populate_pre_commit.sniff_interpreter(pathlib.Path("plain")))
 
-    def test_is_shell_script_unicode_error(self) -> None:
-        """Tests is_shell_script with a binary file that triggers UnicodeDecodeError."""
+    def test_sniff_interpreter_unicode_error(self) -> None:
+        """Tests sniff_interpreter with a binary file that is not UTF-8."""
         self.create_file("binary", contents=b"\xff\xfe\xfd")
-        self.assertFalse(populate_pre_commit.is_shell_script(pathlib.Path("binary")))
+        self.assertIsNone(populate_pre_commit.sniff_interpreter(pathlib.Path("binary")))
+
+    def test_parse_interpreter(self) -> None:
+        """Tests parse_interpreter with a variety of shebangs."""
+        for header, expected in [
+            (b"#!/bin/sh\necho\n", "sh"),
+            (b"#! /bin/bash -e\n", "bash"),
+            (b"#!/usr/bin/env python3\n", "python"),
+            (b"#!/usr/bin/env -S python3.12 -u\n", "python"),
+            (b"#!/usr/bin/env LC_ALL=C perl -w\n", "perl"),
+            (b"#!/usr/local/bin/zsh", "zsh"),
+            (b"#!/usr/bin/env\n", None),
+            (b"#!\n", None),
+            (b"#!/opt/1.2\n", None),
+            (b"no shebang\n", None),
+            (b"\xff\xfe\xfd", None),
+        ]:
+            with self.subTest(header=header):
+                self.assertEqual(
+                    populate_pre_commit.parse_interpreter(header), expected
+                )
+
+    def test_sniff_interpreter_reads_limited_bytes(self) -> None:
+        """Tests that sniff_interpreter only reads the start of the file."""
+        self.create_file("long", contents="#!/bin/" + "x" * 500 + "\n")
+        self.assertEqual(
+            populate_pre_commit.sniff_interpreter(pathlib.Path("long")),
+            "x" * (populate_pre_commit.SHEBANG_READ_SIZE - len("#!/bin/")),
+        )
+
+    def test_sniff_interpreter_missing_file(self) -> None:
+        self.assertIsNone(populate_pre_commit.sniff_interpreter(pathlib.Path("nope")))
+
+    def test_sniff_interpreter_unreadable_file(self) -> None:
+        self.create_file("unreadable", contents="#!/bin/sh\n")
+        with mock.patch.object(pathlib.Path, "open", side_effect=PermissionError()):
+            self.assertIsNone(
+                populate_pre_commit.sniff_interpreter(pathlib.Path("unreadable"))
+            )
+
+    def test_sniff_interpreter_cache(self) -> None:
+        """Tests that results are cached until the file is modified."""
+        path = pathlib.Path("script")
+        self.create_file(path, contents="#!/bin/sh\n")
+        self.assertEqual(populate_pre_commit.sniff_interpreter(path), "sh")
+        with mock.patch.object(pathlib.Path, "open") as mock_open:
+            self.assertEqual(populate_pre_commit.sniff_interpreter(path), "sh")
+            mock_open.assert_not_called()
+        _ = path.write_text("#!/usr/bin/perl\n")
+        os.utime(path, ns=(0, path.stat().st_mtime_ns + 1))
+        self.assertEqual(populate_pre_commit.sniff_interpreter(path), "perl")
+
+    def test_find_interpreters(self) -> None:
+        self.create_file("a", contents="#!/bin/sh\n")
+        self.create_file("b", contents="#!/usr/bin/env python3\n")
+        self.create_file("c", contents="plain text\n")
+        self.assertEqual(
+            populate_pre_commit.find_interpreters(
+                ["a", "b", "c", "missing"], root=pathlib.Path(".")
+            ),
+            {"a": "sh", "b": "python"},
+        )
+
+    def test_find_interpreters_stop_at(self) -> None:
+        """Tests that find_interpreters stops after the first match."""
+        files = [f"script{i}" for i in range(100)]
+        for f in files:
+            self.create_file(f, contents="#!/bin/bash\n")
+        interpreters = populate_pre_commit.find_interpreters(
+            files, root=pathlib.Path("."), stop_at=frozenset({"bash"})
+        )
+        self.assertIn("bash", interpreters.values())
+        self.assertLess(len(interpreters), len(files))
+
+    def test_find_interpreters_empty(self) -> None:
+        self.assertEqual(
+            populate_pre_commit.find_interpreters([], root=pathlib.Path(".")), {}
+        )
 
     def test_shebang_present_but_dot_in_filename(self) -> None:
-        """Tests should_include_shellcheck with non-shell shebang."""
+        """Tests that files with an extension are not checked for a shebang."""
         self.create_file("main.txt", contents="#!/bin/sh\necho foo\n")
-        self.assertFalse(
-            populate_pre_commit.should_include_shellcheck(frozenset[str]({"main.txt"}))
+        self.assertFalse(included("shellcheck.yaml", "main.txt"))
+
+    def test_golang_files(self) -> None:
+        self.assertFalse(included("golang.yaml"))
+        self.assertTrue(included("golang.yaml", "main.go"))
+
+    def test_golang_mod(self) -> None:
+        self.assertTrue(included("golang.yaml", "go.mod"))
+        self.assertFalse(included("golang.yaml", "subdir/go.mod"))
+
+    def test_json(self) -> None:
+        """Tests that .vscode/settings.json does not count as JSON."""
+        self.assertFalse(included("json.yaml"))
+        self.assertTrue(included("json.yaml", "data.json"))
+        self.assertFalse(included("json.yaml", ".vscode/settings.json"))
+        self.assertTrue(included("json.yaml", "data.json", ".vscode/settings.json"))
+
+    def test_readme_toc(self) -> None:
+        self.assertFalse(included("readme-toc.yaml"))
+        self.assertTrue(included("readme-toc.yaml", "README.md"))
+        self.assertFalse(included("readme-toc.yaml", "subdir/README.md"))
+
+    def test_rust_files(self) -> None:
+        self.assertFalse(included("rust.yaml"))
+        self.assertTrue(included("rust.yaml", "src/main.rs"))
+
+    def test_rust_toml(self) -> None:
+        self.assertTrue(included("rust.yaml", "Cargo.toml"))
+
+
+class TestRules(unittest.TestCase):
+    """Tests for loading and compiling rules."""
+
+    def test_every_snippet_has_a_rule(self) -> None:
+        self.assertEqual(
+            sorted(RULES.order),
+            sorted(p.name for p in populate_pre_commit.SNIPPETS_DIR.glob("*.yaml")),
         )
+        self.assertEqual(list(RULES.order), sorted(RULES.order))
 
-    def test_should_include_golang_files(self) -> None:
-        self.assertFalse(populate_pre_commit.should_include_golang(frozenset[str]()))
-        self.assertTrue(
-            populate_pre_commit.should_include_golang(frozenset[str]({"main.go"}))
+    def test_prefixes(self) -> None:
+        self.assertEqual(RULES.prefixes, frozenset[str]({".github/workflows/"}))
+
+    def test_from_table(self) -> None:
+        rule = populate_pre_commit.Rule.from_table(
+            "a.yaml",
+            {"extensions": [".a", ".b"], "root_files": ["A"], "always": True},
+        )
+        self.assertEqual(
+            rule,
+            populate_pre_commit.Rule(
+                snippet="a.yaml",
+                always=True,
+                extensions=frozenset[str]({".a", ".b"}),
+                root_files=frozenset[str]({"A"}),
+            ),
         )
 
-    def test_should_include_golang_mod(self) -> None:
-        self.assertFalse(populate_pre_commit.should_include_golang(frozenset[str]()))
-        self.assertTrue(
-            populate_pre_commit.should_include_golang(frozenset[str]({"go.mod"}))
+    def test_from_table_errors(self) -> None:
+        for table, message in [
+            ({"extension": [".a"]}, "a.yaml: unknown conditions: extension"),
+            ({"always": "yes"}, "a.yaml: always must be a boolean"),
+            ({"path_prefix": ["x/"]}, "a.yaml: path_prefix must be a string"),
+            ({"extensions": ".a"}, "a.yaml: extensions must be a list of strings"),
+            ({"root_files": [1]}, "a.yaml: root_files must be a list of strings"),
+            (
+                {"path_prefix": "x/", "exclude_files": ["x/a"]},
+                "a.yaml: exclude_files cannot be used with path_prefix",
+            ),
+        ]:
+            with self.subTest(table=table):
+                with self.assertRaisesRegex(ValueError, f"^{message}$"):
+                    _ = populate_pre_commit.Rule.from_table(
+                        "a.yaml", cast(dict[str, object], table)
+                    )
+
+    def test_load_rules_errors(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for contents, message in [
+                ('a = "b"\n', "a must be a table"),
+                ("[a]\nalways = 1\n", "a: always must be a boolean"),
+                ("[a\n", "Expected ']'"),
+            ]:
+                with self.subTest(contents=contents):
+                    path = pathlib.Path(tmpdir) / f"rules{len(contents)}.toml"
+                    _ = path.write_text(contents)
+                    with self.assertRaisesRegex(ValueError, message):
+                        _ = populate_pre_commit.load_rules(path)
+
+    def test_detect_order_and_empty_rule(self) -> None:
+        """Tests that output follows rule order and empty rules never match."""
+        rules = populate_pre_commit.SnippetRules.compile(
+            [
+                populate_pre_commit.Rule(snippet="z.yaml", always=True),
+                populate_pre_commit.Rule(snippet="never.yaml"),
+                populate_pre_commit.Rule(
+                    snippet="a.yaml", extensions=frozenset[str]({".a"})
+                ),
+            ]
+        )
+        self.assertEqual(
+            rules.detect(make_profile("x.a")),
+            [("z.yaml", True), ("never.yaml", False), ("a.yaml", True)],
         )
 
-    def test_should_include_json(self) -> None:
-        """Tests the should_include_json function."""
-        self.assertFalse(populate_pre_commit.should_include_json(frozenset[str]()))
-        self.assertTrue(
-            populate_pre_commit.should_include_json(frozenset[str]({"data.json"}))
+    def test_detect_several_interpreter_rules(self) -> None:
+        """Tests that shebangs are read once for several interpreter rules."""
+        rules = populate_pre_commit.SnippetRules.compile(
+            [
+                populate_pre_commit.Rule(
+                    snippet="perl.yaml", interpreters=frozenset[str]({"perl"})
+                ),
+                populate_pre_commit.Rule(
+                    snippet="python.yaml", interpreters=frozenset[str]({"python"})
+                ),
+                populate_pre_commit.Rule(
+                    snippet="ruby.yaml", interpreters=frozenset[str]({"ruby"})
+                ),
+            ]
         )
-        self.assertFalse(
-            populate_pre_commit.should_include_json(
-                frozenset[str]({".vscode/settings.json"})
+        with mock.patch.object(
+            populate_pre_commit,
+            "find_interpreters",
+            return_value={"a": "perl", "b": "python", "c": "perl"},
+        ) as mock_find:
+            self.assertEqual(
+                rules.detect(make_profile("a", "b", "c")),
+                [("perl.yaml", True), ("python.yaml", True), ("ruby.yaml", False)],
             )
+        mock_find.assert_called_once_with(
+            ("a", "b", "c"), root=pathlib.Path("."), stop_at=frozenset[str]()
         )
-        self.assertTrue(
-            populate_pre_commit.should_include_json(
-                frozenset[str]({"data.json", ".vscode/settings.json"})
-            )
+
+    def test_detect_single_interpreter_rule_stops_early(self) -> None:
+        rules = populate_pre_commit.SnippetRules.compile(
+            [
+                populate_pre_commit.Rule(
+                    snippet="sh.yaml", interpreters=frozenset[str]({"sh", "bash"})
+                ),
+            ]
+        )
+        with mock.patch.object(
+            populate_pre_commit, "find_interpreters", return_value={}
+        ) as mock_find:
+            self.assertEqual(rules.detect(make_profile("a")), [("sh.yaml", False)])
+        mock_find.assert_called_once_with(
+            ("a",), root=pathlib.Path("."), stop_at=frozenset[str]({"sh", "bash"})
         )
 
-    def test_should_include_readme_toc(self) -> None:
-        """Tests the should_include_readme_toc function."""
-        self.assertFalse(
-            populate_pre_commit.should_include_readme_toc(frozenset[str]())
+
+class TestFindInterpretersRealFilesystem(unittest.TestCase):
+    """Tests find_interpreters with multiple threads on the real filesystem."""
+
+    def test_many_files(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            root = pathlib.Path(tmpdir)
+            expected: dict[str, str] = {}
+            for i in range(200):
+                path = root / f"script{i}"
+                if i % 2:
+                    _ = path.write_text("#!/usr/bin/perl\n")
+                    expected[path.name] = "perl"
+                else:
+                    _ = path.write_bytes(b"\x7fELF")
+            with mock.patch.dict(populate_pre_commit.SHEBANG_CACHE, clear=True):
+                interpreters = populate_pre_commit.find_interpreters(
+                    sorted(p.name for p in root.iterdir()), root=root
+                )
+        self.assertEqual(interpreters, expected)
+
+
+class TestRepoProfile(unittest.TestCase):
+    """Tests for RepoProfile."""
+
+    def test_from_files(self) -> None:
+        profile = make_profile(
+            "README.md",
+            "setup.py",
+            "src/main.py",
+            "docs/guide.md",
+            "bin/deploy",
+            "Makefile",
+            ".github/workflows/ci.yml",
+            ".github/workflows/nested/extra.yaml",
+            ".github/dependabot.yml",
         )
-        self.assertTrue(
-            populate_pre_commit.should_include_readme_toc(frozenset[str]({"README.md"}))
+        self.assertEqual(
+            profile.extension_counts,
+            {".md": 2, ".py": 2, ".yml": 2, ".yaml": 1},
         )
-        self.assertFalse(
-            populate_pre_commit.should_include_readme_toc(
-                frozenset[str]({"subdir/README.md"})
-            )
+        self.assertEqual(
+            profile.root_files, frozenset[str]({"README.md", "setup.py", "Makefile"})
+        )
+        self.assertEqual(
+            profile.prefix_extensions,
+            {".github/workflows/": frozenset[str]({".yml", ".yaml"})},
+        )
+        self.assertEqual(profile.extensionless_files, ("Makefile", "bin/deploy"))
+
+    def test_dot_files(self) -> None:
+        """Tests that a leading dot is treated as an extension, like endswith."""
+        profile = make_profile(".gitignore", "dir/.py")
+        self.assertEqual(profile.extension_counts, {".gitignore": 1, ".py": 1})
+        self.assertEqual(profile.extensionless_files, ())
+
+    def test_empty(self) -> None:
+        profile = make_profile()
+        self.assertEqual(profile.extension_counts, {})
+        self.assertEqual(profile.root_files, frozenset[str]())
+        self.assertEqual(
+            profile.prefix_extensions, {".github/workflows/": frozenset[str]()}
+        )
+        self.assertEqual(profile.extensionless_files, ())
+
+
+class TestConfigModel(unittest.TestCase):
+    """Tests for parsing and updating the config model."""
+
+    CONFIG: str = textwrap.dedent("""\
+        #!/usr/bin/env -S "populate_pre_commit"
+        # A comment.
+        repos:
+          # managed-by-populate-pre-commit start: a.yaml
+          - repo: a
+          # managed-by-populate-pre-commit end: a.yaml
+          - repo: custom
+          # managed-by-populate-pre-commit start: c.yaml
+          - repo: c
+          # managed-by-populate-pre-commit end: c.yaml
+        """)
+
+    def managed_block(self, name: str) -> tuple[str, ...]:
+        """Builds the lines of a managed block."""
+        return (
+            f"  {populate_pre_commit.MARKER_START} {name}\n",
+            f"  - repo: new-{name}\n",
+            f"  {populate_pre_commit.MARKER_END} {name}\n",
         )
 
-    def test_should_include_rust_files(self) -> None:
-        self.assertFalse(populate_pre_commit.should_include_rust(frozenset[str]()))
-        self.assertTrue(
-            populate_pre_commit.should_include_rust(frozenset[str]({"src/main.rs"}))
+    def test_parse(self) -> None:
+        lines = self.CONFIG.splitlines(keepends=True)
+        model = populate_pre_commit.ConfigModel.parse(lines)
+        self.assertEqual(model.shebang, lines[0])
+        self.assertEqual(
+            [block.name for block in model.blocks],
+            [None, "a.yaml", None, "c.yaml"],
+        )
+        self.assertEqual(model.blocks[0].lines, tuple(lines[1:3]))
+        self.assertEqual(model.managed, {"a.yaml": 1, "c.yaml": 3})
+        self.assertEqual(model.repos_index, 0)
+        self.assertEqual(model.render(), self.CONFIG)
+
+    def test_parse_without_shebang_or_repos(self) -> None:
+        model = populate_pre_commit.ConfigModel.parse(["# comment\n"])
+        self.assertIsNone(model.shebang)
+        self.assertIsNone(model.repos_index)
+        self.assertEqual(model.render(), "# comment\n")
+
+    def test_parse_malformed_markers(self) -> None:
+        """Tests stray end markers, duplicate and unterminated managed blocks."""
+        model = populate_pre_commit.ConfigModel.parse(
+            [
+                "repos:\n",
+                f"  {populate_pre_commit.MARKER_END} a.yaml\n",
+                f"  {populate_pre_commit.MARKER_START} a.yaml\n",
+                f"  {populate_pre_commit.MARKER_END} a.yaml\n",
+                f"  {populate_pre_commit.MARKER_START} a.yaml\n",
+                "  - repo: unterminated\n",
+            ]
+        )
+        self.assertEqual(
+            [block.name for block in model.blocks], [None, "a.yaml", "a.yaml"]
+        )
+        self.assertEqual(model.managed, {"a.yaml": 1})
+        updated = model.update(
+            shebang="#!\n", managed_blocks={"a.yaml": self.managed_block("a.yaml")}
+        )
+        self.assertEqual(
+            updated.render(), "#!\nrepos:\n" + "".join(self.managed_block("a.yaml"))
         )
 
-    def test_should_include_rust_toml(self) -> None:
-        self.assertFalse(populate_pre_commit.should_include_rust(frozenset[str]()))
-        self.assertTrue(
-            populate_pre_commit.should_include_rust(frozenset[str]({"Cargo.toml"}))
+    def test_update_in_place(self) -> None:
+        """Tests that blocks are replaced, removed and inserted in place."""
+        model = populate_pre_commit.ConfigModel.parse(
+            self.CONFIG.splitlines(keepends=True)
+        )
+        updated = model.update(
+            shebang="#!new\n",
+            managed_blocks={
+                name: self.managed_block(name)
+                for name in ["0.yaml", "a.yaml", "b.yaml", "d.yaml"]
+            },
+        )
+        expected = textwrap.dedent("""\
+            #!new
+            # A comment.
+            repos:
+              # managed-by-populate-pre-commit start: 0.yaml
+              - repo: new-0.yaml
+              # managed-by-populate-pre-commit end: 0.yaml
+              # managed-by-populate-pre-commit start: a.yaml
+              - repo: new-a.yaml
+              # managed-by-populate-pre-commit end: a.yaml
+              # managed-by-populate-pre-commit start: b.yaml
+              - repo: new-b.yaml
+              # managed-by-populate-pre-commit end: b.yaml
+              # managed-by-populate-pre-commit start: d.yaml
+              - repo: new-d.yaml
+              # managed-by-populate-pre-commit end: d.yaml
+              - repo: custom
+            """)
+        self.assertEqual(updated.render(), expected)
+        self.assertEqual(
+            updated.managed, {"0.yaml": 1, "a.yaml": 2, "b.yaml": 3, "d.yaml": 4}
         )
+        self.assertEqual(updated.repos_index, 0)
+
+    def test_update_adds_repos(self) -> None:
+        model = populate_pre_commit.ConfigModel.parse(["# comment\n"])
+        updated = model.update(
+            shebang="#!\n", managed_blocks={"a.yaml": self.managed_block("a.yaml")}
+        )
+        self.assertEqual(
+            updated.render(),
+            "#!\n# comment\nrepos:\n" + "".join(self.managed_block("a.yaml")),
+        )
+        self.assertEqual(updated.repos_index, 1)
 
 
 class TestPopulatePreCommit(pyfakefs.fake_filesystem_unittest.TestCase):
@@ -173,10 +539,15 @@ class TestPopulatePreCommit(pyfakefs.fake_filesystem_unittest.TestCase):
     @override
     def setUp(self) -> None:
         self.setUpPyfakefs()
+        populate_pre_commit.load_snippets.cache_clear()
+        self.addCleanup(populate_pre_commit.load_snippets.cache_clear)
         # Add the real snippets directory to the fake filesystem
         self.fs.add_real_directory(  # pyright: ignore[reportUnknownMemberType]
             populate_pre_commit.SNIPPETS_DIR
         )
+        self.fs.add_real_file(  # pyright: ignore[reportUnknownMemberType]
+            populate_pre_commit.RULES_FILE
+        )
 
         # Patch the module-level constants and functions
         self.enterContext(
@@ -193,12 +564,6 @@ class TestPopulatePreCommit(pyfakefs.fake_filesystem_unittest.TestCase):
                 return_value=".",
             )
         )
-        self.enterContext(
-            mock.patch.object(
-                os,
-                "chdir",
-            )
-        )
 
         self.mock_snippets = [
             # keep-sorted start
@@ -216,6 +581,7 @@ class TestPopulatePreCommit(pyfakefs.fake_filesystem_unittest.TestCase):
     def test_creates_new_file(self) -> None:
         self.assertFalse(pathlib.Path(".pre-commit-config.yaml").exists())
         populate_pre_commit.populate_pre_commit(
+            root=pathlib.Path("."),
             extra_args={},
             script_file="populate_pre_commit_test.py",
             snippets=self.mock_snippets,
@@ -252,6 +618,7 @@ class TestPopulatePreCommit(pyfakefs.fake_filesystem_unittest.TestCase):
         self.create_file(".pre-commit-config.yaml", contents=initial_content)
 
         populate_pre_commit.populate_pre_commit(
+            root=pathlib.Path("."),
             extra_args={},
             script_file="populate_pre_commit_test.py",
             snippets=[("meta.yaml", True)],
@@ -285,6 +652,7 @@ class TestPopulatePreCommit(pyfakefs.fake_filesystem_unittest.TestCase):
         self.create_file(".pre-commit-config.yaml", contents=initial_content)
 
         populate_pre_commit.populate_pre_commit(
+            root=pathlib.Path("."),
             extra_args={},
             script_file="populate_pre_commit_test.py",
             snippets=[("meta.yaml", True)],
@@ -309,6 +677,7 @@ class TestPopulatePreCommit(pyfakefs.fake_filesystem_unittest.TestCase):
         self.create_file(".pre-commit-config.yaml", contents="# Just a comment\n")
 
         populate_pre_commit.populate_pre_commit(
+            root=pathlib.Path("."),
             extra_args={},
             script_file="populate_pre_commit_test.py",
             snippets=[("meta.yaml", True)],
@@ -339,6 +708,7 @@ class TestPopulatePreCommit(pyfakefs.fake_filesystem_unittest.TestCase):
             ValueError, f"config snippet {empty_path} is empty"
         ):
             populate_pre_commit.populate_pre_commit(
+                root=pathlib.Path("."),
                 extra_args={},
                 script_file="populate_pre_commit_test.py",
                 snippets=[("empty.yaml", True)],
@@ -350,6 +720,7 @@ class TestPopulatePreCommit(pyfakefs.fake_filesystem_unittest.TestCase):
 
         with self.assertRaisesRegex(OSError, "really_missing.yaml"):
             populate_pre_commit.populate_pre_commit(
+                root=pathlib.Path("."),
                 extra_args={},
                 script_file="populate_pre_commit_test.py",
                 snippets=[("really_missing.yaml", True)],
@@ -359,6 +730,7 @@ class TestPopulatePreCommit(pyfakefs.fake_filesystem_unittest.TestCase):
         """Tests that extra arguments are correctly injected into snippets."""
         extra_args = {"debug-statements": "--flag1 --flag2"}
         populate_pre_commit.populate_pre_commit(
+            root=pathlib.Path("."),
             extra_args=extra_args,
             script_file="populate_pre_commit_test.py",
             snippets=self.mock_snippets,
@@ -376,6 +748,7 @@ class TestPopulatePreCommit(pyfakefs.fake_filesystem_unittest.TestCase):
         """Tests that the shebang line is correctly generated."""
         extra_args = {"hook1": "val1"}
         populate_pre_commit.populate_pre_commit(
+            root=pathlib.Path("."),
             extra_args=extra_args,
             script_file="populate_pre_commit.py",
             snippets=self.mock_snippets,
@@ -391,6 +764,7 @@ class TestPopulatePreCommit(pyfakefs.fake_filesystem_unittest.TestCase):
         """Tests that spaces in extra arguments are correctly escaped in the shebang."""
         extra_args = {"hook 1": "val 1"}
         populate_pre_commit.populate_pre_commit(
+            root=pathlib.Path("."),
             extra_args=extra_args,
             script_file="populate_pre_commit.py",
             snippets=self.mock_snippets,
@@ -402,6 +776,7 @@ class TestPopulatePreCommit(pyfakefs.fake_filesystem_unittest.TestCase):
     def test_executable_bit(self) -> None:
         """Tests that the generated file is marked as executable."""
         populate_pre_commit.populate_pre_commit(
+            root=pathlib.Path("."),
             extra_args={},
             script_file="populate_pre_commit.py",
             snippets=self.mock_snippets,
@@ -417,11 +792,151 @@ class TestPopulatePreCommit(pyfakefs.fake_filesystem_unittest.TestCase):
             with mock.patch("populate_pre_commit.populate_pre_commit") as mock_populate:
                 populate_pre_commit.main()
                 mock_populate.assert_called_once_with(
+                    root=pathlib.Path("."),
                     extra_args={"hook1": "args"},
                     script_file=mock.ANY,
                     snippets=mock.ANY,
                 )
 
+    def test_returns_whether_changed(self) -> None:
+        """Tests that populate_pre_commit reports whether the config changed."""
+        for expected in [True, False]:
+            with self.subTest(expected=expected):
+                self.assertEqual(
+                    populate_pre_commit.populate_pre_commit(
+                        root=pathlib.Path("."),
+                        extra_args={},
+                        script_file="populate_pre_commit_test.py",
+                        snippets=self.mock_snippets,
+                    ),
+                    expected,
+                )
+
+    def test_unchanged_config_is_not_rewritten(self) -> None:
+        """Tests that an up to date config is left untouched."""
+        populate_pre_commit.populate_pre_commit(
+            root=pathlib.Path("."),
+            extra_args={},
+            script_file="populate_pre_commit_test.py",
+            snippets=self.mock_snippets,
+        )
+        config_path = pathlib.Path(".pre-commit-config.yaml")
+        os.utime(config_path, ns=(1, 1))
+        with mock.patch.object(script_utils, "write_atomically") as mock_write:
+            changed = populate_pre_commit.populate_pre_commit(
+                root=pathlib.Path("."),
+                extra_args={},
+                script_file="populate_pre_commit_test.py",
+                snippets=self.mock_snippets,
+            )
+        self.assertFalse(changed)
+        mock_write.assert_not_called()
+        self.assertEqual(config_path.stat().st_mtime_ns, 1)
+
+    def test_unchanged_config_is_made_executable(self) -> None:
+        """Tests that an up to date config that is not executable is fixed."""
+        populate_pre_commit.populate_pre_commit(
+            root=pathlib.Path("."),
+            extra_args={},
+            script_file="populate_pre_commit_test.py",
+            snippets=self.mock_snippets,
+        )
+        config_path = pathlib.Path(".pre-commit-config.yaml")
+        config_path.chmod(0o644)
+        changed = populate_pre_commit.populate_pre_commit(
+            root=pathlib.Path("."),
+            extra_args={},
+            script_file="populate_pre_commit_test.py",
+            snippets=self.mock_snippets,
+        )
+        self.assertFalse(changed)
+        self.assertEqual(config_path.stat().st_mode & 0o777, 0o755)
+
+    def test_main_reports_unchanged(self) -> None:
+        """Tests that main reports whether the config changed."""
+        for changed, expected in [
+            (True, "Updated .pre-commit-config.yaml with 5 snippets.\n"),
+            (False, ".pre-commit-config.yaml is unchanged with 5 snippets.\n"),
+        ]:
+            with self.subTest(changed=changed):
+                result = populate_pre_commit.RepoResult(
+                    root=pathlib.Path("."), num_snippets=5, changed=changed
+                )
+                with (
+                    mock.patch("sys.argv", ["populate_pre_commit.py"]),
+                    mock.patch.object(
+                        populate_pre_commit, "update_repo", return_value=result
+                    ),
+                    mock.patch.object(
+                        sys, "stdout", new_callable=io.StringIO
+                    ) as stdout,
+                ):
+                    self.assertEqual(populate_pre_commit.main(), 0)
+                self.assertEqual(stdout.getvalue(), expected)
+
+    def test_main_repos(self) -> None:
+        """Tests the main function in batch mode."""
+        with (
+            mock.patch(
+                "sys.argv",
+                [
+                    "populate_pre_commit.py",
+                    "--extra-arg",
+                    "hook1=args",
+                    "--jobs",
+                    "3",
+                    "--no-cache",
+                    "--repos",
+                    "repo1",
+                    "repo2",
+                ],
+            ),
+            mock.patch.object(
+                populate_pre_commit, "update_repos", return_value=1
+            ) as mock_update_repos,
+        ):
+            self.assertEqual(populate_pre_commit.main(), 1)
+        mock_update_repos.assert_called_once_with(
+            roots=[pathlib.Path("repo1"), pathlib.Path("repo2")],
+            extra_args={"hook1": "args"},
+            script_file=mock.ANY,
+            jobs=3,
+            use_cache=False,
+        )
+
+    def test_main_invalid_jobs(self) -> None:
+        """Tests that --jobs must be positive."""
+        with (
+            mock.patch("sys.argv", ["populate_pre_commit.py", "--jobs", "0"]),
+            mock.patch("sys.stderr", new_callable=io.StringIO) as stderr,
+            self.assertRaises(SystemExit),
+        ):
+            populate_pre_commit.main()
+        self.assertIn("invalid positive_int value: '0'", stderr.getvalue())
+
+    def test_main_check(self) -> None:
+        """Tests that --check reports missing modules without updating."""
+        for found, expected_status, expected_stderr in [
+            (True, 0, ""),
+            (False, 1, "Missing Python modules: pathspec, yaml\n"),
+        ]:
+            with self.subTest(found=found):
+                spec = importlib.machinery.ModuleSpec("yaml", None) if found else None
+                with (
+                    mock.patch("sys.argv", ["populate_pre_commit.py", "--check"]),
+                    mock.patch.object(importlib.util, "find_spec", return_value=spec),
+                    mock.patch.object(
+                        populate_pre_commit, "update_repo"
+                    ) as mock_update,
+                    mock.patch("sys.stderr", new_callable=io.StringIO) as stderr,
+                ):
+                    self.assertEqual(populate_pre_commit.main(), expected_status)
+                mock_update.assert_not_called()
+                self.assertEqual(stderr.getvalue(), expected_stderr)
+
+    def test_find_missing_modules(self) -> None:
+        self.assertEqual(populate_pre_commit.find_missing_modules(), [])
+
     def test_main_invalid_extra_arg(self) -> None:
         """Tests the main function with invalid --extra-arg format."""
         with mock.patch(
@@ -430,19 +945,16 @@ class TestPopulatePreCommit(pyfakefs.fake_filesystem_unittest.TestCase):
             with self.assertRaises(ValueError):
                 populate_pre_commit.main()
 
-    def test_escape_for_env_s(self) -> None:
-        """Tests the escape_for_env_s function."""
-        self.assertEqual(populate_pre_commit.escape_for_env_s("\\"), "\\\\")
-        self.assertEqual(populate_pre_commit.escape_for_env_s('"'), '\\"')
-        self.assertEqual(populate_pre_commit.escape_for_env_s(" "), r"\_")
-
     def test_populate_pre_commit_no_config_with_script(self) -> None:
         """Tests populate_pre_commit when no config exists but script_file is provided."""
         config_path = pathlib.Path(".pre-commit-config.yaml")
         if config_path.exists():
             config_path.unlink()
         populate_pre_commit.populate_pre_commit(
-            extra_args={}, script_file="script.py", snippets=self.mock_snippets
+            root=pathlib.Path("."),
+            extra_args={},
+            script_file="script.py",
+            snippets=self.mock_snippets,
         )
         self.assertTrue(config_path.exists())
         with config_path.open("r", encoding="utf-8") as f:
@@ -453,20 +965,16 @@ class TestPopulatePreCommit(pyfakefs.fake_filesystem_unittest.TestCase):
         initial_content = "#!/old/shebang\nrepos:\n"
         self.create_file(".pre-commit-config.yaml", contents=initial_content)
         populate_pre_commit.populate_pre_commit(
-            extra_args={}, script_file="new_script.py", snippets=self.mock_snippets
+            root=pathlib.Path("."),
+            extra_args={},
+            script_file="new_script.py",
+            snippets=self.mock_snippets,
         )
         with open(".pre-commit-config.yaml", "r") as f:
             first_line = f.readline()
         self.assertIn("new_script.py", first_line)
         self.assertNotIn("old/shebang", first_line)
 
-    def test_build_shebang_args_multiple(self) -> None:
-        """Tests build_shebang_args with multiple arguments."""
-        extra_args = {"b": "2", "a": "1"}
-        result = populate_pre_commit.build_shebang_args(extra_args)
-        # Should be sorted by key
-        self.assertEqual(result, '\\_--extra-arg\\_"a=1"\\_--extra-arg\\_"b=2"')
-
     def test_apply_extra_args_hook_not_found(self) -> None:
         """Tests apply_extra_args when the hook ID is not found in the content."""
         content = "- repo: local\n  hooks:\n  - id: hook1\n"
@@ -517,6 +1025,56 @@ class TestPopulatePreCommit(pyfakefs.fake_filesystem_unittest.TestCase):
             expected,
         )
 
+    def test_load_snippets(self) -> None:
+        """Tests that every snippet is loaded, once."""
+        snippets = populate_pre_commit.load_snippets(populate_pre_commit.SNIPPETS_DIR)
+        self.assertIn("meta.yaml", snippets)
+        self.assertEqual(
+            snippets["meta.yaml"].path,
+            populate_pre_commit.SNIPPETS_DIR / "meta.yaml",
+        )
+        self.assertIs(
+            populate_pre_commit.load_snippets(populate_pre_commit.SNIPPETS_DIR),
+            snippets,
+        )
+
+    def test_snippet_render_is_memoized(self) -> None:
+        """Tests that rendering only depends on extra args for the snippet."""
+        snippet = populate_pre_commit.Snippet(
+            path=pathlib.Path("snippet.yaml"),
+            text="- repo: local\n  hooks:\n  # A comment.\n  - id: hook1\n",
+        )
+        with mock.patch.object(
+            populate_pre_commit,
+            "apply_extra_args",
+            wraps=populate_pre_commit.apply_extra_args,
+        ) as mock_apply:
+            plain = snippet.render({})
+            self.assertEqual(snippet.render({"other-hook": "--flag"}), plain)
+            with_args = snippet.render({"hook1": "--flag", "other-hook": "--x"})
+            self.assertEqual(snippet.render({"hook1": "--flag"}), with_args)
+        self.assertEqual(plain, "- repo: local\n  hooks:\n  - id: hook1\n")
+        self.assertIn("- --flag", with_args)
+        self.assertEqual(
+            mock_apply.call_args_list,
+            [
+                mock.call(snippet.text, {}),
+                mock.call(snippet.text, {"hook1": "--flag"}),
+            ],
+        )
+
+    def test_c_yaml_matches_python_yaml(self) -> None:
+        """Tests that the C YAML implementation renders snippets identically."""
+        for path in populate_pre_commit.SNIPPETS_DIR.glob("*.yaml"):
+            with self.subTest(snippet=path.name):
+                text = path.read_text(encoding="utf-8")
+                expected = yaml.dump(
+                    yaml.safe_load(text), sort_keys=False, default_flow_style=False
+                )
+                self.assertEqual(
+                    populate_pre_commit.apply_extra_args(text, {}), expected
+                )
+
     def test_multiple_snippets_with_extra_args(self) -> None:
         """Tests multiple snippets with extra arguments."""
         mock_snippets = [
@@ -525,6 +1083,7 @@ class TestPopulatePreCommit(pyfakefs.fake_filesystem_unittest.TestCase):
         ]
         extra_args = {"debug-statements": "--flag1", "check-hooks-apply": "--flag2"}
         populate_pre_commit.populate_pre_commit(
+            root=pathlib.Path("."),
             extra_args=extra_args,
             script_file="populate_pre_commit_test.py",
             snippets=mock_snippets,
@@ -546,13 +1105,12 @@ class TestPopulatePreCommit(pyfakefs.fake_filesystem_unittest.TestCase):
             with mock.patch("populate_pre_commit.populate_pre_commit") as mock_populate:
                 populate_pre_commit.main()
                 mock_populate.assert_called_once_with(
-                    extra_args={}, script_file=mock.ANY, snippets=mock.ANY
+                    root=pathlib.Path("."),
+                    extra_args={},
+                    script_file=mock.ANY,
+                    snippets=mock.ANY,
                 )
 
-    def test_build_shebang_args_empty_dict(self) -> None:
-        """Tests build_shebang_args with an empty dictionary."""
-        self.assertEqual(populate_pre_commit.build_shebang_args({}), "")
-
     def test_custom_content_preservation(self) -> None:
         """Tests that custom content before and after managed blocks is preserved."""
         initial_content = textwrap.dedent("""\
@@ -565,6 +1123,7 @@ class TestPopulatePreCommit(pyfakefs.fake_filesystem_unittest.TestCase):
             """)
         self.create_file(".pre-commit-config.yaml", contents=initial_content)
         populate_pre_commit.populate_pre_commit(
+            root=pathlib.Path("."),
             extra_args={},
             script_file="populate_pre_commit_test.py",
             snippets=[("meta.yaml", True)],
@@ -575,79 +1134,384 @@ class TestPopulatePreCommit(pyfakefs.fake_filesystem_unittest.TestCase):
         self.assertIn("# Bottom comment", content)
 
 
-class TestGetNonIgnoredFiles(pyfakefs.fake_filesystem_unittest.TestCase):
-    """Tests for get_non_ignored_files."""
+class TestBatchMode(pyfakefs.fake_filesystem_unittest.TestCase):
+    """Tests for updating many repositories at once."""
+
+    @override
+    def setUp(self) -> None:
+        self.setUpPyfakefs()
+        populate_pre_commit.load_snippets.cache_clear()
+        self.addCleanup(populate_pre_commit.load_snippets.cache_clear)
+        self.fs.add_real_directory(  # pyright: ignore[reportUnknownMemberType]
+            populate_pre_commit.SNIPPETS_DIR
+        )
+        self.fs.add_real_file(  # pyright: ignore[reportUnknownMemberType]
+            populate_pre_commit.RULES_FILE
+        )
+        # pyfakefs is not thread-safe, so only use one thread at a time.
+        self.enterContext(mock.patch.object(populate_pre_commit, "SHEBANG_WORKERS", 1))
+        self.enterContext(
+            mock.patch.object(
+                script_utils, "get_git_files", side_effect=FileNotFoundError()
+            )
+        )
+        self.enterContext(
+            mock.patch.object(subprocess, "run", side_effect=FileNotFoundError())
+        )
+
+    def create_file(self, file_path: pathlib.Path | str, contents: str = "") -> None:
+        self.fs.create_file(  # pyright: ignore[reportUnknownMemberType]
+            file_path, contents=contents
+        )
+
+    def test_update_repo(self) -> None:
+        """Tests that update_repo works on a repository other than the cwd."""
+        self.create_file("/repo/main.py")
+        self.create_file("/repo/deploy", contents="#!/bin/sh\n")
+        result = populate_pre_commit.update_repo(
+            root=pathlib.Path("/repo"), extra_args={}, script_file="populate"
+        )
+        self.assertEqual(
+            result,
+            populate_pre_commit.RepoResult(
+                root=pathlib.Path("/repo"), num_snippets=13, changed=True
+            ),
+        )
+        content = pathlib.Path("/repo/.pre-commit-config.yaml").read_text()
+        self.assertIn("start: python.yaml", content)
+        self.assertIn("start: shellcheck.yaml", content)
+        self.assertFalse(pathlib.Path(".pre-commit-config.yaml").exists())
+
+    def test_update_repos(self) -> None:
+        """Tests updating several repositories and printing a summary."""
+        self.create_file("/src/changed/README.md")
+        self.create_file("/src/unchanged/README.md")
+        self.create_file("/src/failed/README.md")
+        self.create_file(
+            "/src/failed/.pre-commit-config.yaml",
+            contents='#!/usr/bin/env -S "x"\\_--extra-arg\\_"invalid"\n',
+        )
+        shebang_args = script_utils.build_shebang_args({"mypy": "--strict"})
+        self.create_file(
+            "/src/changed/.pre-commit-config.yaml",
+            contents=f'#!/usr/bin/env -S "populate"{shebang_args}\nrepos:\n',
+        )
+        _ = populate_pre_commit.update_repo(
+            root=pathlib.Path("/src/unchanged"),
+            extra_args={"black": "-q"},
+            script_file="populate",
+        )
+
+        with mock.patch.object(sys, "stdout", new_callable=io.StringIO) as stdout:
+            status = populate_pre_commit.update_repos(
+                roots=[
+                    pathlib.Path("/src/changed"),
+                    pathlib.Path("/src/unchanged"),
+                    pathlib.Path("/src/failed"),
+                ],
+                extra_args={"black": "-q"},
+                script_file="populate",
+                jobs=1,
+            )
+
+        self.assertEqual(status, 1)
+        self.assertEqual(
+            stdout.getvalue(),
+            textwrap.dedent("""\
+                /src/changed: updated with 7 snippets
+                /src/unchanged: unchanged
+                /src/failed: failed: Invalid --extra-arg format: 'invalid'. Expected 'hook_id=args'.
+                3 repositories: 1 updated, 1 unchanged, 1 failed.
+                """),
+        )
+        shebang = pathlib.Path("/src/changed/.pre-commit-config.yaml").read_text()
+        self.assertIn('--extra-arg\\_"black=-q"', shebang)
+        self.assertIn('--extra-arg\\_"mypy=--strict"', shebang)
+
+    def test_update_repos_success(self) -> None:
+        self.create_file("/src/repo/README.md")
+        with mock.patch.object(sys, "stdout", new_callable=io.StringIO):
+            status = populate_pre_commit.update_repos(
+                roots=[pathlib.Path("/src/repo")],
+                extra_args={},
+                script_file="populate",
+                jobs=1,
+            )
+        self.assertEqual(status, 0)
+
+
+class TestDetectionCache(pyfakefs.fake_filesystem_unittest.TestCase):
+    """Tests for caching detection results."""
+
+    root: pathlib.Path = pathlib.Path("/repo")
+    # The untracked files that git reports for the fingerprint.
+    untracked: list[str] = []
 
     @override
     def setUp(self) -> None:
         self.setUpPyfakefs()
+        self.untracked = []
+        populate_pre_commit.load_snippets.cache_clear()
+        self.addCleanup(populate_pre_commit.load_snippets.cache_clear)
+        self.fs.add_real_directory(  # pyright: ignore[reportUnknownMemberType]
+            populate_pre_commit.SNIPPETS_DIR
+        )
+        self.fs.add_real_file(  # pyright: ignore[reportUnknownMemberType]
+            populate_pre_commit.RULES_FILE
+        )
+        self.fs.add_real_file(  # pyright: ignore[reportUnknownMemberType]
+            populate_pre_commit.__file__
+        )
+        self.enterContext(mock.patch.object(populate_pre_commit, "SHEBANG_WORKERS", 1))
+        self.enterContext(
+            mock.patch.object(
+                script_utils, "get_git_files", side_effect=self.get_git_files
+            )
+        )
+        self.enterContext(
+            mock.patch.object(subprocess, "run", side_effect=FileNotFoundError())
+        )
+        self.create_file("/repo/.git/index", contents="index")
+        self.create_file("/repo/main.py")
 
     def create_file(self, file_path: pathlib.Path | str, contents: str = "") -> None:
         self.fs.create_file(  # pyright: ignore[reportUnknownMemberType]
             file_path, contents=contents
         )
 
-    def test_basic_files(self) -> None:
-        self.create_file("file1.txt")
-        self.create_file("dir1/file2.txt")
-        with mock.patch.object(subprocess, "run") as mock_run:
-            mock_run.side_effect = subprocess.CalledProcessError(1, "git")
-            files = populate_pre_commit.get_non_ignored_files()
-        self.assertEqual(files, frozenset[str]({"file1.txt", "dir1/file2.txt"}))
-
-    def test_local_gitignore(self) -> None:
-        self.create_file(".gitignore", contents="ignored.txt\n")
-        self.create_file("file1.txt")
-        self.create_file("ignored.txt")
-        with mock.patch.object(subprocess, "run") as mock_run:
-            mock_run.side_effect = FileNotFoundError()
-            files = populate_pre_commit.get_non_ignored_files()
-        self.assertEqual(files, frozenset[str]({".gitignore", "file1.txt"}))
-
-    def test_git_info_exclude(self) -> None:
-        self.create_file(".git/info/exclude", contents="*.log\n")
-        self.create_file("test.log")
-        self.create_file("test.txt")
-        with mock.patch.object(subprocess, "run") as mock_run:
-            mock_run.side_effect = FileNotFoundError()
-            files = populate_pre_commit.get_non_ignored_files()
-        self.assertEqual(files, frozenset[str]({"test.txt"}))
-
-    def test_global_ignore(self) -> None:
-        home_ignore = pathlib.Path("~/.gitignore.global").expanduser()
-        self.create_file(home_ignore, contents="venv/\n")
-        self.create_file("venv/bin/python")
-        self.create_file("main.py")
-        mock_ret = cast(
-            mock.MagicMock,
-            mock.create_autospec(subprocess.CompletedProcess, instance=True),
-        )
-        mock_ret.stdout = "~/.gitignore.global\n"
-        with mock.patch.object(subprocess, "run") as mock_run:
-            mock_run.return_value = mock_ret
-            files = populate_pre_commit.get_non_ignored_files()
-        self.assertIn("main.py", files)
-
-    def test_global_ignore_fallback(self) -> None:
-        home_ignore = pathlib.Path("~/.config/git/ignore").expanduser()
-        self.create_file(home_ignore, contents="build/\n")
-        self.create_file("build/output.o")
-        self.create_file("src/main.c")
-        with mock.patch.object(subprocess, "run") as mock_run:
-            mock_run.side_effect = subprocess.CalledProcessError(1, "git")
-            files = populate_pre_commit.get_non_ignored_files()
-        self.assertIn("src/main.c", files)
-        self.assertNotIn("build/output.o", files)
-
-    def test_pruning_directories(self) -> None:
-        self.create_file(".gitignore", contents="node_modules/\n")
-        self.create_file("node_modules/pkg/index.js")
-        self.create_file("src/index.js")
-        with mock.patch.object(subprocess, "run") as mock_run:
-            mock_run.side_effect = FileNotFoundError()
-            files = populate_pre_commit.get_non_ignored_files()
-        self.assertIn("src/index.js", files)
-        self.assertNotIn("node_modules/pkg/index.js", files)
+    def get_git_files(self, root: pathlib.Path, *, cached: bool = True) -> list[str]:
+        """Lists untracked files; detection walks the fake filesystem instead."""
+        self.assertEqual(root, self.root)
+        if cached:
+            raise FileNotFoundError()
+        return self.untracked
+
+    def test_fingerprint_without_git_dir(self) -> None:
+        self.assertIsNone(
+            populate_pre_commit.detection_fingerprint(pathlib.Path("/elsewhere"))
+        )
+
+    def test_fingerprint_is_stable(self) -> None:
+        self.assertEqual(
+            populate_pre_commit.detection_fingerprint(self.root),
+            populate_pre_commit.detection_fingerprint(self.root),
+        )
+
+    def test_fingerprint_changes(self) -> None:
+        """Tests that each input to the fingerprint changes it."""
+        fingerprints = {populate_pre_commit.detection_fingerprint(self.root)}
+        os.utime("/repo/.git/index", ns=(1, 1))
+        fingerprints.add(populate_pre_commit.detection_fingerprint(self.root))
+        pathlib.Path("/repo/.git/index").unlink()
+        fingerprints.add(populate_pre_commit.detection_fingerprint(self.root))
+        self.untracked = ["go.mod"]
+        fingerprints.add(populate_pre_commit.detection_fingerprint(self.root))
+        self.untracked = ["go.mod", "sub/script"]
+        fingerprints.add(populate_pre_commit.detection_fingerprint(self.root))
+        self.create_file(populate_pre_commit.SNIPPETS_DIR / "new.yaml")
+        fingerprints.add(populate_pre_commit.detection_fingerprint(self.root))
+        self.assertEqual(len(fingerprints), 6)
+
+    def test_fingerprint_without_git(self) -> None:
+        """Tests that nothing is cached when git cannot list untracked files."""
+        for error in [
+            FileNotFoundError(),
+            subprocess.CalledProcessError(128, "git"),
+        ]:
+            with (
+                self.subTest(error=error),
+                mock.patch.object(script_utils, "get_git_files", side_effect=error),
+            ):
+                self.assertIsNone(populate_pre_commit.detection_fingerprint(self.root))
+
+    def test_update_repo_notices_untracked_files(self) -> None:
+        """Tests that adding an untracked file invalidates the cache."""
+        first = populate_pre_commit.update_repo(
+            root=self.root, extra_args={}, script_file="populate"
+        )
+        self.create_file("/repo/README.md")
+        self.untracked = ["README.md"]
+        second = populate_pre_commit.update_repo(
+            root=self.root, extra_args={}, script_file="populate"
+        )
+        self.assertTrue(second.changed)
+        self.assertGreater(second.num_snippets, first.num_snippets)
+
+    def test_cache_round_trip(self) -> None:
+        snippets = [("meta.yaml", True), ("python.yaml", False)]
+        populate_pre_commit.write_detection_cache(self.root, "abc", snippets)
+        self.assertEqual(
+            populate_pre_commit.read_detection_cache(self.root, "abc"), snippets
+        )
+        self.assertIsNone(populate_pre_commit.read_detection_cache(self.root, "xyz"))
+
+    def test_read_bad_cache(self) -> None:
+        """Tests that missing or corrupt caches are ignored."""
+        cache_file = self.root / populate_pre_commit.DETECTION_CACHE_FILE
+        self.assertIsNone(populate_pre_commit.read_detection_cache(self.root, "abc"))
+        for contents in ["not json", "[]", '{"fingerprint": "abc"}']:
+            with self.subTest(contents=contents):
+                _ = cache_file.write_text(contents)
+                self.assertIsNone(
+                    populate_pre_commit.read_detection_cache(self.root, "abc")
+                )
+
+    def test_write_cache_failure_is_ignored(self) -> None:
+        with mock.patch.object(
+            script_utils, "write_atomically", side_effect=PermissionError()
+        ):
+            populate_pre_commit.write_detection_cache(self.root, "abc", [])
+        self.assertFalse(
+            (self.root / populate_pre_commit.DETECTION_CACHE_FILE).exists()
+        )
+
+    def test_update_repo_uses_cache(self) -> None:
+        """Tests that a second run with an unchanged fingerprint does not detect."""
+        with mock.patch.object(
+            populate_pre_commit,
+            "get_non_ignored_files",
+            wraps=populate_pre_commit.get_non_ignored_files,
+        ) as mock_get_files:
+            first = populate_pre_commit.update_repo(
+                root=self.root, extra_args={}, script_file="populate"
+            )
+            second = populate_pre_commit.update_repo(
+                root=self.root, extra_args={}, script_file="populate"
+            )
+        mock_get_files.assert_called_once_with(self.root)
+        self.assertTrue(first.changed)
+        self.assertFalse(second.changed)
+        self.assertEqual(first.num_snippets, second.num_snippets)
+
+    def test_update_repo_failure_is_not_cached(self) -> None:
+        """Tests that detection results are only cached once the config is written."""
+        with (
+            mock.patch.object(
+                populate_pre_commit, "populate_pre_commit", side_effect=OSError()
+            ),
+            self.assertRaises(OSError),
+        ):
+            _ = populate_pre_commit.update_repo(
+                root=self.root, extra_args={}, script_file="populate"
+            )
+        self.assertFalse(
+            (self.root / populate_pre_commit.DETECTION_CACHE_FILE).exists()
+        )
+
+    def test_update_repo_without_cache(self) -> None:
+        """Tests that use_cache=False detects again and refreshes the cache."""
+        _ = populate_pre_commit.update_repo(
+            root=self.root, extra_args={}, script_file="populate"
+        )
+        # The fake git does not report the new file, so the fingerprint is the
+        # same, as it is after changing the shebang of a tracked file.
+        self.create_file("/repo/README.md")
+        cached = populate_pre_commit.update_repo(
+            root=self.root, extra_args={}, script_file="populate"
+        )
+        self.assertFalse(cached.changed)
+        refreshed = populate_pre_commit.update_repo(
+            root=self.root, extra_args={}, script_file="populate", use_cache=False
+        )
+        self.assertTrue(refreshed.changed)
+        self.assertGreater(refreshed.num_snippets, cached.num_snippets)
+        fingerprint = populate_pre_commit.detection_fingerprint(self.root)
+        assert fingerprint is not None
+        cache = populate_pre_commit.read_detection_cache(self.root, fingerprint)
+        self.assertIn(("readme-toc.yaml", True), cache or [])
+
+
+class TestGetNonIgnoredFiles(unittest.TestCase):
+    """Tests for get_non_ignored_files."""
+
+    def test_uses_git_when_available(self) -> None:
+        with (
+            mock.patch.object(script_utils, "get_git_files", return_value=["main.py"]),
+            mock.patch.object(script_utils, "walk_non_ignored_files") as mock_walk,
+        ):
+            files = populate_pre_commit.get_non_ignored_files(pathlib.Path("."))
+        self.assertEqual(files, frozenset[str]({"main.py"}))
+        mock_walk.assert_not_called()
+
+    def test_falls_back_to_walk_outside_git(self) -> None:
+        for error in [subprocess.CalledProcessError(128, "git"), FileNotFoundError()]:
+            with self.subTest(error=error):
+                with (
+                    mock.patch.object(script_utils, "get_git_files", side_effect=error),
+                    mock.patch.object(
+                        script_utils,
+                        "walk_non_ignored_files",
+                        return_value=["walked.py"],
+                    ),
+                ):
+                    files = populate_pre_commit.get_non_ignored_files(pathlib.Path("."))
+                self.assertEqual(files, frozenset[str]({"walked.py"}))
+
+
+class TestStartupTime(unittest.TestCase):
+    """Tests that the script starts quickly, measured with python -X importtime."""
+
+    # Importing populate_pre_commit, including the modules it imports, must take
+    # less than this many microseconds.
+    STARTUP_BUDGET_US: int = 100_000
+    # Modules that are slow to import and must only be imported when needed.
+    LAZY_MODULES: frozenset[str] = frozenset[str](
+        {
+            "concurrent.futures",
+            "hashlib",
+            "json",
+            "pathspec",
+            "subprocess",
+            "tempfile",
+            "tomllib",
+            "yaml",
+        }
+    )
+
+    def import_times(self) -> tuple[int, frozenset[str]]:
+        """Imports populate_pre_commit in a new interpreter.
+
+        Returns:
+            The cumulative import time in microseconds, and the names of the
+            modules imported by populate_pre_commit.
+        """
+        ret = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import populate_pre_commit"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=pathlib.Path(populate_pre_commit.__file__).parent,
+        )
+        # Lines look like "import time:  self | cumulative |   name", where the
+        # indentation of name shows nesting, and modules are listed after the
+        # modules they import.
+        entries: list[tuple[str, int, int]] = []
+        for line in ret.stderr.splitlines():
+            _, cumulative_us, name = line.split("|")
+            if not cumulative_us.strip().isdigit():
+                continue
+            stripped = name.lstrip(" ")
+            entries.append((stripped, len(name) - len(stripped), int(cumulative_us)))
+        names = [name for name, _, _ in entries]
+        self.assertIn("populate_pre_commit", names)
+        index = len(names) - 1 - names[::-1].index("populate_pre_commit")
+        _, depth, cumulative = entries[index]
+        imported: set[str] = set()
+        for child_name, child_depth, _ in reversed(entries[:index]):
+            if child_depth <= depth:
+                break
+            imported.add(child_name)
+        return cumulative, frozenset(imported)
+
+    def test_startup_budget(self) -> None:
+        # Take the fastest of several runs to reduce noise from other processes.
+        fastest = min(self.import_times()[0] for _ in range(3))
+        self.assertLess(fastest, self.STARTUP_BUDGET_US)
+
+    def test_lazy_imports(self) -> None:
+        _, imported = self.import_times()
+        self.assertIn("argparse", imported)
+        self.assertEqual(imported & self.LAZY_MODULES, frozenset[str]())
 
 
 if __name__ == "__main__":
@@ -5,21 +5,85 @@ Executes a command on multiple hosts as different users.
 
 It uses an external `retry` command to handle transient SSH connection issues.
 
+Hosts can be updated concurrently with `--parallel`, in which case output is
+captured and each line is prefixed with `user@host`; `--log-dir` also captures
+output, and writes each host's output to a log file. Captured commands can't
+prompt before retrying, so instead ssh connection failures are retried
+automatically. Each host runs the users one at a time, in the order given by
+`--users` or otherwise listed in the inventory, unless its concurrency is more
+than 1 or `--parallel-users` is used. A table of exit codes, retries, and
+durations is printed at the end, and the exit code is non-zero if any command
+failed.
+
+With `--multiplex`, one SSH connection is opened to each target and shared by
+every user and command, and closed at the end.
+
+Hosts, the users on each host, and how to reach them are read from a TOML
+inventory file, e.g.:
+
+    [defaults]
+    users = ["johntobin", "root"]
+    ssh_targets = { root = "johntobin@{host}" }
+    sudo = { root = ["sudo", "--login"] }
+
+    [groups]
+    servers = ["hosting"]
+
+    [hosts.laptop]
+    users = ["johntobin", "root", "arianetobin"]
+
+    [hosts.hosting]
+    concurrency = 2
+
+Hosts inherit the defaults and override them; ssh targets may use `{host}` and
+`{user}`. `concurrency` is how many users run on the host at once; with 1 the
+users run in order. `--hosts` accepts groups like `@servers`, and `@all` is
+every host in the inventory unless a group named `all` is defined. Without an
+inventory file, laptop, imac, and hosting are used. `--users` skips users
+that aren't listed for a host in the inventory, but hosts that aren't in the
+inventory run as every user given.
+
 The script also includes a mechanism to wrap its execution with `caffeinate -i`
 on macOS to prevent the system from sleeping during its operation. This is
 controlled by the `CAFFEINATED` environment variable.
 """
 
 import argparse
+import concurrent.futures
+import contextlib
 import dataclasses
 import logging
 import os as os
 import shutil as shutil
 import subprocess as subprocess
 import sys
+import tempfile as tempfile
+import threading
+import time as time
+import tomllib
+from typing import cast, TextIO, TypedDict
 
 logger = logging.getLogger("run_everywhere")
 
+# Serialises output from commands running concurrently, so lines aren't mixed.
+output_lock = threading.Lock()
+
+# How long a shared SSH connection stays open when idle, in case this script
+# dies without closing it.
+CONTROL_PERSIST = "10m"
+
+# The exit code from ssh when it fails to connect.
+SSH_CONNECTION_FAILED = 255
+# The exit code when a command can't be started, like the shell uses for a
+# command that isn't found.
+COMMAND_NOT_STARTED = 127
+
+# The inventory file used if --inventory isn't given, if it exists.
+DEFAULT_INVENTORY = "~/.config/run_everywhere/inventory.toml"
+
+# The hosts used without an inventory file.
+DEFAULT_HOSTS = ["laptop", "imac", "hosting"]
+
 
 class UsageError(Exception):
     """Exception raised for invalid usage."""
@@ -28,18 +92,136 @@ class UsageError(Exception):
 class Args(argparse.Namespace):
     """Command-line arguments."""
 
-    hosts: str = "laptop,imac,hosting"
-    users: str = "johntobin,root,arianetobin"
+    hosts: str = "@all"
+    users: str | None = None
+    inventory: str | None = None
+    parallel: int = 1
+    parallel_users: bool = False
+    multiplex: bool = False
+    log_dir: str | None = None
+    retries: int = 2
     command: list[str] = []
 
 
+class HostSettings(TypedDict, total=False):
+    """Represents the settings for a host, or the defaults, in the inventory."""
+
+    users: list[str]
+    ssh_targets: dict[str, str]
+    sudo: dict[str, list[str]]
+    concurrency: int
+
+
+class InventoryFile(TypedDict, total=False):
+    """Represents the inventory file, parsed from TOML."""
+
+    defaults: HostSettings
+    groups: dict[str, list[str]]
+    hosts: dict[str, HostSettings]
+
+
 @dataclasses.dataclass
 class Config:
     """Configuration for running the command."""
 
     command: list[str]
     hosts: list[str]
+    users: list[str] | None = None
+    inventory: str | None = None
+    parallel: int = 1
+    parallel_users: bool = False
+    multiplex: bool = False
+    log_dir: str | None = None
+    retries: int = 2
+
+
+@dataclasses.dataclass
+class Result:
+    """The result of running the command as one user on one host.
+
+    retries is None when the retry command handled retries interactively, or
+    when running on the host failed before the command ran.
+    """
+
+    user: str
+    host: str
+    returncode: int
+    duration: float
+    retries: int | None = None
+
+
+@dataclasses.dataclass(frozen=True)
+class HostConfig:
+    """How to run commands on a host.
+
+    ssh_targets and sudo_commands are keyed by user; ssh targets may contain
+    {host} and {user}, which are replaced.
+    """
+
     users: list[str]
+    ssh_targets: dict[str, str] = dataclasses.field(default_factory=dict)
+    sudo_commands: dict[str, list[str]] = dataclasses.field(default_factory=dict)
+    concurrency: int = 1
+
+    def ssh_target(self, host: str, user: str) -> str:
+        """
+        Returns the ssh target used to run commands on a host as a user.
+
+        Args:
+            host: The hostname to connect to.
+            user: The user to run as.
+        """
+        return self.ssh_targets.get(user, "{user}@{host}").format(host=host, user=user)
+
+
+# The settings for every host without an inventory file.
+DEFAULT_HOST_CONFIG = HostConfig(
+    users=["johntobin", "root", "arianetobin"],
+    ssh_targets={"root": "johntobin@{host}"},
+    sudo_commands={"root": ["sudo", "--login"]},
+)
+
+
+@dataclasses.dataclass
+class Inventory:
+    """Hosts, groups of hosts, and how to run commands on each host."""
+
+    defaults: HostConfig
+    hosts: dict[str, HostConfig]
+    groups: dict[str, list[str]]
+
+    def host_config(self, host: str) -> HostConfig:
+        """
+        Returns the settings for a host, which are the defaults if the host
+        isn't in the inventory.
+
+        Args:
+            host: The hostname.
+        """
+        return self.hosts.get(host, self.defaults)
+
+    def select(self, selectors: list[str]) -> list[str]:
+        """
+        Expands hosts and groups of hosts.
+
+        Args:
+            selectors: Hostnames, and group names prefixed with @.
+
+        Returns:
+            The hosts, without duplicates.
+
+        Raises:
+            UsageError: If a group doesn't exist.
+        """
+        hosts: list[str] = []
+        for selector in selectors:
+            if not selector.startswith("@"):
+                hosts.append(selector)
+            elif selector[1:] in self.groups:
+                hosts.extend(self.groups[selector[1:]])
+            else:
+                raise UsageError(f"Unknown group of hosts: {selector}")
+        return list(dict.fromkeys(hosts))
 
 
 def parse_args(argv: list[str]) -> Config:
@@ -52,25 +234,67 @@ def parse_args(argv: list[str]) -> Config:
         The parsed configuration.
 
     Raises:
-        UsageError: If the command is missing.
+        UsageError: If the command is missing, --parallel is less than 1, or
+            --retries is negative.
     """
     parser = argparse.ArgumentParser(
         description="Executes a command on multiple hosts.",
         epilog=(
             "Use '--' to separate run_everywhere.py options from the command "
-            "to be executed, especially if the command has options that might "
-            "conflict."
+            + "to be executed, especially if the command has options that might "
+            + "conflict."
         ),
     )
     parser.add_argument(
         "--hosts",
-        default="laptop,imac,hosting",
-        help="A comma-separated list of hosts to run the command on. Defaults to %(default)s.",
+        default="@all",
+        help="A comma-separated list of hosts and @groups to run the command on. Defaults to %(default)s.",
     )
     parser.add_argument(
         "--users",
-        default="johntobin,root,arianetobin",
-        help="A comma-separated list of users to run the command as. Defaults to %(default)s.",
+        help="A comma-separated list of users to run the command as; hosts in the "
+        + "inventory only run as the users listed for them. Defaults to all the "
+        + "users on each host.",
+    )
+    parser.add_argument(
+        "--inventory",
+        metavar="FILE",
+        help=f"The TOML inventory of hosts. Defaults to {DEFAULT_INVENTORY} if it "
+        + "exists.",
+    )
+    parser.add_argument(
+        "--parallel",
+        type=int,
+        default=1,
+        metavar="N",
+        help="The number of hosts to run the command on at once; output is "
+        + "prefixed with user@host when N is greater than 1. Defaults to %(default)s.",
+    )
+    parser.add_argument(
+        "--parallel-users",
+        action="store_true",
+        help="Run the command as all users on a host at once, instead of one "
+        + "at a time.",
+    )
+    parser.add_argument(
+        "--multiplex",
+        action="store_true",
+        help="Open one SSH connection to each target and share it between all "
+        + "users, rather than connecting for every user.",
+    )
+    parser.add_argument(
+        "--log-dir",
+        metavar="DIR",
+        help="Write the output from each host to DIR/HOST.log; output is "
+        + "prefixed with user@host.",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=2,
+        metavar="N",
+        help="When output is prefixed, retry up to N times if ssh fails to "
+        + "connect. Defaults to %(default)s.",
     )
     parser.add_argument("command", nargs=argparse.REMAINDER, help="The command to run.")
 
@@ -78,61 +302,504 @@ def parse_args(argv: list[str]) -> Config:
     config = Config(
         command=args.command,
         hosts=[h.strip() for h in args.hosts.split(",")],
-        users=[u.strip() for u in args.users.split(",")],
+        users=(
+            [u.strip() for u in args.users.split(",")]
+            if args.users is not None
+            else None
+        ),
+        inventory=args.inventory,
+        parallel=args.parallel,
+        parallel_users=args.parallel_users,
+        multiplex=args.multiplex,
+        log_dir=args.log_dir,
+        retries=args.retries,
     )
     if config.command and config.command[0] == "--":
         config.command = config.command[1:]
     if not config.command:
         parser.print_help(file=sys.stderr)
         raise UsageError("No command specified.")
+    if config.parallel < 1:
+        parser.print_help(file=sys.stderr)
+        raise UsageError("--parallel must be at least 1.")
+    if config.retries < 0:
+        parser.print_help(file=sys.stderr)
+        raise UsageError("--retries must not be negative.")
     return config
 
 
-def update_single_host(host: str, users: list[str], command: list[str]) -> None:
+def string_list(value: object, where: str) -> list[str]:
     """
-    Runs a command on a single host as multiple users.
+    Checks that an inventory setting is a list of strings.
 
     Args:
-        host: The hostname to connect to.
-        users: The users to run as.
-        command: The command to execute, as a list of strings.
+        value: The setting.
+        where: The name of the setting, for errors.
+
+    Returns:
+        The setting.
+
+    Raises:
+        UsageError: If the setting is not a list of strings.
+    """
+    if not isinstance(value, list) or not all(
+        isinstance(v, str) for v in cast(list[object], value)
+    ):
+        raise UsageError(f"Inventory: {where} must be a list of strings.")
+    return list(cast(list[str], value))
+
+
+def table(value: object, where: str) -> dict[str, object]:
+    """
+    Checks that an inventory setting is a table.
+
+    Args:
+        value: The setting.
+        where: The name of the setting, for errors.
+
+    Returns:
+        The setting.
+
+    Raises:
+        UsageError: If the setting is not a table.
+    """
+    if not isinstance(value, dict):
+        raise UsageError(f"Inventory: {where} must be a table.")
+    return {str(k): v for k, v in cast(dict[object, object], value).items()}
+
+
+def parse_host_config(
+    value: HostSettings, where: str, defaults: HostConfig
+) -> HostConfig:
+    """
+    Parses the settings for a host from the inventory.
+
+    Args:
+        value: The settings, which haven't been checked yet.
+        where: The name of the settings, for errors.
+        defaults: The settings that are overridden.
+
+    Returns:
+        The defaults, overridden by the settings.
+
+    Raises:
+        UsageError: If the settings are invalid.
+    """
+    settings = table(value, where)
+    unknown = sorted(set(settings) - {"users", "ssh_targets", "sudo", "concurrency"})
+    if unknown:
+        raise UsageError(f"Inventory: unknown settings in {where}: {unknown}")
+
+    ssh_targets = dict(defaults.ssh_targets)
+    for user, target in table(settings.get("ssh_targets", {}), where).items():
+        if not isinstance(target, str):
+            raise UsageError(f"Inventory: {where}.ssh_targets.{user} must be a string.")
+        ssh_targets[user] = target
+    sudo_commands = dict(defaults.sudo_commands)
+    for user, sudo in table(settings.get("sudo", {}), where).items():
+        sudo_commands[user] = string_list(sudo, f"{where}.sudo.{user}")
+    concurrency = settings.get("concurrency", defaults.concurrency)
+    if type(concurrency) is not int or concurrency < 1:
+        raise UsageError(f"Inventory: {where}.concurrency must be at least 1.")
+    return HostConfig(
+        users=(
+            string_list(settings["users"], f"{where}.users")
+            if "users" in settings
+            else defaults.users
+        ),
+        ssh_targets=ssh_targets,
+        sudo_commands=sudo_commands,
+        concurrency=concurrency,
+    )
+
+
+def parse_inventory(data: InventoryFile) -> Inventory:
+    """
+    Parses an inventory.
+
+    Args:
+        data: The inventory, parsed from TOML but not checked yet.
+
+    Returns:
+        The inventory.
+
+    Raises:
+        UsageError: If the inventory is invalid.
     """
-    ssh_targets = {
-        "root": f"johntobin@{host}",
+    unknown = sorted(set(data) - {"defaults", "groups", "hosts"})
+    if unknown:
+        raise UsageError(f"Inventory: unknown sections: {unknown}")
+    defaults = parse_host_config(
+        data.get("defaults", {}), "defaults", DEFAULT_HOST_CONFIG
+    )
+    hosts = {
+        host: parse_host_config(cast(HostSettings, value), f"hosts.{host}", defaults)
+        for host, value in table(data.get("hosts", {}), "hosts").items()
     }
-    sudo_commands = {
-        "root": ["sudo", "--login"],
+    groups = {
+        group: string_list(value, f"groups.{group}")
+        for group, value in table(data.get("groups", {}), "groups").items()
     }
+    if "all" not in groups:
+        members = [host for group in groups.values() for host in group]
+        groups["all"] = list(dict.fromkeys([*hosts, *members]))
+    return Inventory(defaults=defaults, hosts=hosts, groups=groups)
 
-    for user in users:
-        logger.info(f"{user}@{host}")
-
-        ssh_command = (
-            []
-            if host == "localhost"
-            else [
-                "ssh",
-                "-o",
-                "ControlMaster=no",
-                "-o",
-                "ForwardAgent=yes",
-                "-t",
-                "-t",
-                ssh_targets.get(user, f"{user}@{host}"),
-            ]
+
+def load_inventory(path: str | None) -> Inventory:
+    """
+    Loads the inventory file.
+
+    Args:
+        path: The inventory file, or None to use the default inventory file if
+            it exists.
+
+    Returns:
+        The inventory, or the default hosts if there is no inventory file.
+
+    Raises:
+        UsageError: If the inventory file can't be read or is invalid.
+    """
+    if path is None:
+        path = os.path.expanduser(DEFAULT_INVENTORY)
+        if not os.path.exists(path):
+            return Inventory(
+                defaults=DEFAULT_HOST_CONFIG, hosts={}, groups={"all": DEFAULT_HOSTS}
+            )
+    try:
+        with open(path, "rb") as f:
+            data = cast(InventoryFile, cast(object, tomllib.load(f)))
+    except (OSError, tomllib.TOMLDecodeError) as e:
+        raise UsageError(f"Failed to read inventory {path}: {e}") from e
+    return parse_inventory(data)
+
+
+class ConnectionPool:
+    """
+    Shares one SSH connection to each target between all users and commands.
+
+    The first use of a target starts a master connection in the background;
+    every ssh command using the pool's options then reuses it, falling back to
+    a new connection if the master couldn't be started.
+    """
+
+    def __init__(self) -> None:
+        """Creates the directory for the control sockets."""
+        # Sockets have a short maximum path length, and $TMPDIR on macOS is
+        # long, so use /tmp.
+        self.control_dir: str = tempfile.mkdtemp(prefix="run_everywhere.", dir="/tmp")
+        self.control_path: str = os.path.join(self.control_dir, "%C")
+        self.lock: threading.Lock = threading.Lock()
+        self.target_locks: dict[str, threading.Lock] = {}
+        self.masters: list[str] = []
+
+    def ssh_options(self) -> list[str]:
+        """
+        Returns the ssh options that reuse the master connections.
+        """
+        return ["-o", "ControlMaster=no", "-o", f"ControlPath={self.control_path}"]
+
+    def connect(self, target: str) -> None:
+        """
+        Starts the master connection to a target, unless it is already started.
+
+        Args:
+            target: The ssh target, e.g. johntobin@host.
+        """
+        with self.lock:
+            target_lock = self.target_locks.setdefault(target, threading.Lock())
+        with target_lock:
+            if target in self.masters:
+                return
+            logger.info(f"Connecting to {target}")
+            subprocess.run(
+                [
+                    "ssh",
+                    "-o",
+                    "ControlMaster=yes",
+                    "-o",
+                    f"ControlPath={self.control_path}",
+                    "-o",
+                    f"ControlPersist={CONTROL_PERSIST}",
+                    "-o",
+                    "ForwardAgent=yes",
+                    "-N",
+                    "-f",
+                    target,
+                ],
+                check=False,
+            )
+            # Don't try again for other users if connecting failed.
+            self.masters.append(target)
+
+    def close(self) -> None:
+        """
+        Closes all the master connections and removes the control sockets.
+        """
+        for target in self.masters:
+            subprocess.run(
+                ["ssh", "-o", f"ControlPath={self.control_path}", "-O", "exit", target],
+                check=False,
+                capture_output=True,
+            )
+        shutil.rmtree(self.control_dir, ignore_errors=True)
+
+
+def build_command(
+    host: str,
+    user: str,
+    command: list[str],
+    pool: ConnectionPool | None = None,
+    interactive: bool = True,
+    host_config: HostConfig = DEFAULT_HOST_CONFIG,
+) -> list[str]:
+    """
+    Builds the command that runs a command on a host as a user.
+
+    Args:
+        host: The hostname to connect to.
+        user: The user to run as.
+        command: The command to execute, as a list of strings.
+        pool: If set, reuse the pool's connection to the host.
+        interactive: If True, use the retry command, which prompts before
+            retrying.
+        host_config: How to run commands on the host.
+
+    Returns:
+        The full command, including retry, ssh, and sudo as needed.
+    """
+    control_options = pool.ssh_options() if pool else ["-o", "ControlMaster=no"]
+
+    ssh_command = (
+        []
+        if host == "localhost"
+        else [
+            "ssh",
+            *control_options,
+            "-o",
+            "ForwardAgent=yes",
+            "-t",
+            "-t",
+            host_config.ssh_target(host, user),
+        ]
+    )
+    retry_command = ["retry", f"{user}@{host}"] if interactive else []
+    return (
+        retry_command + ssh_command + host_config.sudo_commands.get(user, []) + command
+    )
+
+
+def write_output(prefix: str, line: str, log_file: TextIO | None) -> None:
+    """
+    Prints a line of output, and writes it to a log file.
+
+    Args:
+        prefix: The prefix for the line, e.g. user@host.
+        line: The line, without a line ending.
+        log_file: If set, the log file to write the line to.
+    """
+    with output_lock:
+        print(f"{prefix}: {line}", flush=True)
+        if log_file:
+            log_file.write(f"{prefix}: {line}\n")
+            log_file.flush()
+
+
+def run_prefixed(
+    full_command: list[str], prefix: str, log_file: TextIO | None = None
+) -> int:
+    """
+    Runs a command, prefixing each line of its output.
+
+    Standard input is not connected, because concurrent commands can't share
+    the terminal.
+
+    Args:
+        full_command: The command to run.
+        prefix: The prefix for each line of output, e.g. user@host.
+        log_file: If set, the log file to write the output to.
+
+    Returns:
+        The exit code of the command, or COMMAND_NOT_STARTED if it couldn't be
+        started.
+    """
+    try:
+        process = subprocess.Popen(
+            full_command,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            errors="replace",
         )
-        full_command = (
-            [
-                "retry",
-                f"{user}@{host}",
-            ]
-            + ssh_command
-            + sudo_commands.get(user, [])
-            + command
+    except OSError as e:
+        write_output(prefix, f"failed to run {full_command[0]}: {e}", log_file)
+        return COMMAND_NOT_STARTED
+    with process:
+        # Popen types stdout as IO[Any] even for text.
+        stdout = cast(TextIO, process.stdout)
+        for line in stdout:
+            # ssh -t -t produces \r\n line endings.
+            write_output(prefix, line.rstrip(), log_file)
+    return process.returncode
+
+
+def run_as_user(
+    host: str,
+    user: str,
+    command: list[str],
+    capture_output: bool,
+    pool: ConnectionPool | None = None,
+    retries: int = 0,
+    log_file: TextIO | None = None,
+    host_config: HostConfig = DEFAULT_HOST_CONFIG,
+) -> Result:
+    """
+    Runs a command on a host as a user.
+
+    Args:
+        host: The hostname to connect to.
+        user: The user to run as.
+        command: The command to execute, as a list of strings.
+        capture_output: If True, prefix each line of output with user@host and
+            retry automatically, otherwise the command uses the terminal
+            directly and retries interactively.
+        pool: If set, reuse the pool's connection to the host.
+        retries: The number of times to retry if ssh fails to connect, when
+            capturing output.
+        log_file: If set, the log file to write the output to.
+        host_config: How to run commands on the host.
+
+    Returns:
+        The exit code, number of retries, and duration of the command; the exit
+        code is COMMAND_NOT_STARTED if the command couldn't be started.
+    """
+    logger.info(f"{user}@{host}")
+    start = time.monotonic()
+    if pool and host != "localhost":
+        pool.connect(host_config.ssh_target(host, user))
+    full_command = build_command(
+        host,
+        user,
+        command,
+        pool,
+        interactive=not capture_output,
+        host_config=host_config,
+    )
+    logger.info(f"Will run: {full_command}")
+    prefix = f"{user}@{host}"
+    if not capture_output:
+        try:
+            returncode = subprocess.run(full_command, check=False).returncode
+        except OSError as e:
+            write_output(prefix, f"failed to run {full_command[0]}: {e}", log_file)
+            returncode = COMMAND_NOT_STARTED
+        return Result(user, host, returncode, time.monotonic() - start)
+
+    attempts = 0
+    while True:
+        returncode = run_prefixed(full_command, prefix, log_file)
+        if (
+            returncode != SSH_CONNECTION_FAILED
+            or host == "localhost"
+            or attempts >= retries
+        ):
+            break
+        attempts += 1
+        write_output(prefix, f"ssh failed to connect, retry {attempts}", log_file)
+    return Result(user, host, returncode, time.monotonic() - start, attempts)
+
+
+def update_single_host(
+    host: str,
+    users: list[str],
+    command: list[str],
+    capture_output: bool = False,
+    parallel_users: bool = False,
+    pool: ConnectionPool | None = None,
+    retries: int = 0,
+    log_dir: str | None = None,
+    host_config: HostConfig = DEFAULT_HOST_CONFIG,
+) -> list[Result]:
+    """
+    Runs a command on a single host as multiple users.
+
+    Args:
+        host: The hostname to connect to.
+        users: The users to run as, in order.
+        command: The command to execute, as a list of strings.
+        capture_output: If True, prefix each line of output with user@host.
+        parallel_users: If True, run as all users at once rather than in order.
+        pool: If set, reuse the pool's connections to the host.
+        retries: The number of times to retry if ssh fails to connect, when
+            capturing output.
+        log_dir: If set, write the output to HOST.log in this directory.
+        host_config: How to run commands on the host, including how many users
+            to run at once.
+
+    Returns:
+        The results for each user, in the same order as users.
+    """
+    with contextlib.ExitStack() as stack:
+        log_file = (
+            stack.enter_context(
+                open(os.path.join(log_dir, f"{host}.log"), "w", encoding="utf-8")
+            )
+            if log_dir
+            else None
         )
+        concurrency = len(users) if parallel_users else host_config.concurrency
+        if concurrency <= 1:
+            return [
+                run_as_user(
+                    host,
+                    user,
+                    command,
+                    capture_output,
+                    pool,
+                    retries,
+                    log_file,
+                    host_config,
+                )
+                for user in users
+            ]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [
+                executor.submit(
+                    run_as_user,
+                    host,
+                    user,
+                    command,
+                    capture_output,
+                    pool,
+                    retries,
+                    log_file,
+                    host_config,
+                )
+                for user in users
+            ]
+        return [future.result() for future in futures]
 
-        logger.info(f"Will run: {full_command}")
-        subprocess.run(full_command, check=False)
+
+def print_results(results: list[Result]) -> None:
+    """
+    Prints a table of the exit code, retries, and duration for each user and
+    host, and how many failed.
+
+    Args:
+        results: The results to print.
+    """
+    targets = [f"{result.user}@{result.host}" for result in results]
+    width = max(len(target) for target in ["USER@HOST", *targets])
+    print(f"{'USER@HOST':<{width}}  EXIT  RETRIES  DURATION")
+    for target, result in zip(targets, results):
+        retries = "-" if result.retries is None else str(result.retries)
+        print(
+            f"{target:<{width}}  {result.returncode:>4}  {retries:>7}  "
+            + f"{result.duration:>7.1f}s"
+        )
+    failed = sum(1 for result in results if result.returncode != 0)
+    print(f"{failed} of {len(results)} failed.")
 
 
 def main(argv: list[str]) -> int:
@@ -143,17 +810,75 @@ def main(argv: list[str]) -> int:
         argv: Command-line arguments.
 
     Returns:
-        An exit code, 0 for success.
+        An exit code, 0 for success, 1 if any command failed or no host has any
+        of the users.
     """
     try:
         config = parse_args(argv)
-    except UsageError:
+        inventory = load_inventory(config.inventory)
+        hosts = inventory.select(config.hosts)
+        users: dict[str, list[str]] = {}
+        for host in hosts:
+            host_users = inventory.host_config(host).users
+            if config.users is not None and host in inventory.hosts:
+                host_users = [user for user in config.users if user in host_users]
+            elif config.users is not None:
+                # The inventory doesn't list the users on other hosts.
+                host_users = config.users
+            if host_users:
+                users[host] = host_users
+            else:
+                logger.warning(f"Skipping {host}: none of the users are on it")
+        if not users:
+            raise UsageError("None of the hosts have any of the users.")
+    except UsageError as e:
+        print(f"Error: {e}", file=sys.stderr)
         return 1
 
-    for host in config.hosts:
-        update_single_host(host, config.users, config.command)
-
-    return 0
+    capture_output = (
+        config.parallel > 1
+        or config.parallel_users
+        or config.log_dir is not None
+        or any(inventory.host_config(host).concurrency > 1 for host in users)
+    )
+    if config.log_dir:
+        os.makedirs(config.log_dir, exist_ok=True)
+    pool = ConnectionPool() if config.multiplex else None
+    try:
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=config.parallel
+        ) as executor:
+            futures = [
+                executor.submit(
+                    update_single_host,
+                    host,
+                    host_users,
+                    config.command,
+                    capture_output=capture_output,
+                    parallel_users=config.parallel_users,
+                    pool=pool,
+                    retries=config.retries,
+                    log_dir=config.log_dir,
+                    host_config=inventory.host_config(host),
+                )
+                for host, host_users in users.items()
+            ]
+    finally:
+        if pool:
+            pool.close()
+    results: list[Result] = []
+    for (host, host_users), future in zip(users.items(), futures):
+        try:
+            results.extend(future.result())
+        except OSError as e:
+            # Don't lose the results from the other hosts.
+            print(f"Error: {host}: {e}", file=sys.stderr)
+            results.extend(
+                Result(user, host, COMMAND_NOT_STARTED, 0.0) for user in host_users
+            )
+    print_results(results)
+
+    return 1 if any(result.returncode != 0 for result in results) else 0
 
 
 def run_caffeinated(argv: list[str]) -> None:
@@ -1,3 +1,10 @@
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+import typing
 import unittest
 from unittest import mock
 
@@ -7,6 +14,15 @@ import run_everywhere
 class RunEverywhereTest(unittest.TestCase):
     """Tests for the run_everywhere script."""
 
+    @typing.override
+    def setUp(self) -> None:
+        """Don't use the real default inventory file."""
+        patcher = mock.patch.object(
+            run_everywhere, "DEFAULT_INVENTORY", "/nonexistent/inventory.toml"
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     @mock.patch.object(run_everywhere.subprocess, "run")
     def test_update_single_host(self, mock_subprocess_run: mock.Mock) -> None:
         """
@@ -78,6 +94,255 @@ class RunEverywhereTest(unittest.TestCase):
 
         mock_subprocess_run.assert_has_calls(expected_calls, any_order=False)
 
+    @mock.patch.object(run_everywhere.time, "monotonic", side_effect=[1.0, 3.5])
+    @mock.patch.object(sys, "stdout", new_callable=io.StringIO)
+    def test_update_single_host_prefixed(
+        self, mock_stdout: io.StringIO, _: mock.Mock
+    ) -> None:
+        """
+        Tests that output is prefixed with user@host when running concurrently.
+        """
+        process = typing.cast(
+            mock.MagicMock,
+            mock.create_autospec(run_everywhere.subprocess.Popen, instance=True),
+        )
+        process.stdout = io.StringIO("line 1\r\nline 2\n")
+        process.returncode = 3
+        with mock.patch.object(
+            run_everywhere.subprocess, "Popen", return_value=process
+        ) as mock_popen:
+            results = run_everywhere.update_single_host(
+                "testhost", ["root"], ["my-command"], capture_output=True
+            )
+
+        self.assertEqual(
+            results, [run_everywhere.Result("root", "testhost", 3, 2.5, retries=0)]
+        )
+        self.assertEqual(
+            mock_stdout.getvalue(),
+            "root@testhost: line 1\nroot@testhost: line 2\n",
+        )
+        mock_popen.assert_called_once_with(
+            run_everywhere.build_command(
+                "testhost", "root", ["my-command"], interactive=False
+            ),
+            stdin=run_everywhere.subprocess.DEVNULL,
+            stdout=run_everywhere.subprocess.PIPE,
+            stderr=run_everywhere.subprocess.STDOUT,
+            text=True,
+            errors="replace",
+        )
+
+    @mock.patch.object(sys, "stdout", new_callable=io.StringIO)
+    def test_update_single_host_popen_fails(self, mock_stdout: io.StringIO) -> None:
+        """
+        Tests that a command that can't be started fails without a traceback.
+        """
+        with tempfile.TemporaryDirectory() as log_dir:
+            results = run_everywhere.update_single_host(
+                "localhost",
+                ["johntobin"],
+                ["/nonexistent/command"],
+                capture_output=True,
+                log_dir=log_dir,
+            )
+            with open(os.path.join(log_dir, "localhost.log"), encoding="utf-8") as f:
+                log = f.read()
+        self.assertEqual(
+            results,
+            [run_everywhere.Result("johntobin", "localhost", 127, mock.ANY, 0)],
+        )
+        self.assertTrue(
+            log.startswith(
+                "johntobin@localhost: failed to run /nonexistent/command: [Errno 2]"
+            ),
+            log,
+        )
+        self.assertEqual(mock_stdout.getvalue(), log)
+
+    @mock.patch.object(sys, "stdout", new_callable=io.StringIO)
+    @mock.patch.object(
+        run_everywhere.subprocess,
+        "run",
+        side_effect=FileNotFoundError(2, "No such file or directory"),
+    )
+    def test_update_single_host_interactive_fails(
+        self, _: mock.Mock, mock_stdout: io.StringIO
+    ) -> None:
+        """
+        Tests that a missing retry command fails without a traceback.
+        """
+        results = run_everywhere.update_single_host(
+            "testhost", ["johntobin"], ["my-command"]
+        )
+        self.assertEqual(
+            results,
+            [run_everywhere.Result("johntobin", "testhost", 127, mock.ANY)],
+        )
+        self.assertEqual(
+            mock_stdout.getvalue(),
+            "johntobin@testhost: failed to run retry: "
+            + "[Errno 2] No such file or directory\n",
+        )
+
+    @mock.patch.object(sys, "stdout", new_callable=io.StringIO)
+    @mock.patch.object(run_everywhere, "run_prefixed")
+    def test_update_single_host_retries(
+        self, mock_run_prefixed: mock.Mock, mock_stdout: io.StringIO
+    ) -> None:
+        """
+        Tests that only ssh connection failures are retried, and are counted.
+        """
+        with tempfile.TemporaryDirectory() as log_dir:
+            mock_run_prefixed.side_effect = [255, 255, 0, 255, 255, 255, 255]
+            results = run_everywhere.update_single_host(
+                "testhost",
+                ["johntobin", "root"],
+                ["my-command"],
+                capture_output=True,
+                retries=2,
+                log_dir=log_dir,
+            )
+            with open(os.path.join(log_dir, "testhost.log"), encoding="utf-8") as f:
+                log = f.read()
+        self.assertEqual(
+            [(result.returncode, result.retries) for result in results],
+            [(0, 2), (255, 2)],
+        )
+        expected = (
+            "johntobin@testhost: ssh failed to connect, retry 1\n"
+            + "johntobin@testhost: ssh failed to connect, retry 2\n"
+            + "root@testhost: ssh failed to connect, retry 1\n"
+            + "root@testhost: ssh failed to connect, retry 2\n"
+        )
+        self.assertEqual(mock_stdout.getvalue(), expected)
+        self.assertEqual(log, expected)
+
+        # Commands on localhost don't use ssh, so aren't retried.
+        mock_run_prefixed.reset_mock()
+        results = run_everywhere.update_single_host(
+            "localhost", ["johntobin"], ["my-command"], capture_output=True, retries=2
+        )
+        self.assertEqual(
+            results[0],
+            run_everywhere.Result("johntobin", "localhost", 255, mock.ANY, 0),
+        )
+        mock_run_prefixed.assert_called_once_with(
+            ["my-command"], "johntobin@localhost", None
+        )
+
+    @mock.patch.object(sys, "stdout", new_callable=io.StringIO)
+    def test_main_log_dir(self, mock_stdout: io.StringIO) -> None:
+        """
+        Tests that output is written to a log file for each host.
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            log_dir = os.path.join(tmpdir, "logs")
+            return_code = run_everywhere.main(
+                [
+                    "--hosts",
+                    "localhost",
+                    "--users",
+                    "johntobin",
+                    "--log-dir",
+                    log_dir,
+                    "echo",
+                    "hello",
+                ]
+            )
+            with open(os.path.join(log_dir, "localhost.log"), encoding="utf-8") as f:
+                log = f.read()
+        self.assertEqual(return_code, 0)
+        self.assertEqual(log, "johntobin@localhost: hello\n")
+        self.assertTrue(
+            mock_stdout.getvalue().startswith("johntobin@localhost: hello\n")
+        )
+        self.assertTrue(mock_stdout.getvalue().endswith("0 of 1 failed.\n"))
+
+    @mock.patch.object(run_everywhere.subprocess, "run")
+    def test_update_single_host_parallel_users(
+        self, mock_subprocess_run: mock.Mock
+    ) -> None:
+        """
+        Tests that results are in the order of the users when run concurrently.
+        """
+
+        def run(full_command: list[str], **_: object) -> mock.Mock:
+            return mock.Mock(returncode=len(full_command[1]))
+
+        mock_subprocess_run.side_effect = run
+        results = run_everywhere.update_single_host(
+            "host", ["root", "johntobin", "a"], ["my-command"], parallel_users=True
+        )
+        self.assertEqual(
+            [(result.user, result.returncode) for result in results],
+            [("root", 9), ("johntobin", 14), ("a", 6)],
+        )
+
+    @mock.patch.object(run_everywhere.subprocess, "run")
+    def test_update_single_host_multiplex(self, mock_subprocess_run: mock.Mock) -> None:
+        """
+        Tests that one connection to each ssh target is shared by all users.
+        """
+        pool = run_everywhere.ConnectionPool()
+        control_path = f"ControlPath={pool.control_dir}/%C"
+        run_everywhere.update_single_host(
+            "testhost", ["johntobin", "root"], ["my-command"], pool=pool
+        )
+        run_everywhere.update_single_host(
+            "localhost", ["johntobin", "root"], ["my-command"], pool=pool
+        )
+        self.assertEqual(pool.masters, ["johntobin@testhost"])
+
+        master = [
+            "ssh",
+            "-o",
+            "ControlMaster=yes",
+            "-o",
+            control_path,
+            "-o",
+            "ControlPersist=10m",
+            "-o",
+            "ForwardAgent=yes",
+            "-N",
+            "-f",
+            "johntobin@testhost",
+        ]
+        ssh = [
+            "ssh",
+            "-o",
+            "ControlMaster=no",
+            "-o",
+            control_path,
+            "-o",
+            "ForwardAgent=yes",
+            "-t",
+            "-t",
+            "johntobin@testhost",
+        ]
+        self.assertEqual(
+            mock_subprocess_run.call_args_list[:3],
+            [
+                mock.call(master, check=False),
+                mock.call(
+                    ["retry", "johntobin@testhost", *ssh, "my-command"], check=False
+                ),
+                mock.call(
+                    ["retry", "root@testhost", *ssh, "sudo", "--login", "my-command"],
+                    check=False,
+                ),
+            ],
+        )
+        self.assertEqual(mock_subprocess_run.call_count, 5)
+
+        pool.close()
+        mock_subprocess_run.assert_called_with(
+            ["ssh", "-o", control_path, "-O", "exit", "johntobin@testhost"],
+            check=False,
+            capture_output=True,
+        )
+        self.assertFalse(run_everywhere.os.path.exists(pool.control_dir))
+
     @mock.patch.object(run_everywhere.subprocess, "run")
     def test_update_single_host_localhost(self, mock_subprocess_run: mock.Mock) -> None:
         """
@@ -116,8 +381,9 @@ class RunEverywhereTest(unittest.TestCase):
 
         mock_subprocess_run.assert_has_calls(expected_calls, any_order=False)
 
-    @mock.patch.object(run_everywhere, "update_single_host")
-    def test_main(self, mock_update_single_host: mock.Mock) -> None:
+    @mock.patch.object(sys, "stdout", new_callable=io.StringIO)
+    @mock.patch.object(run_everywhere, "update_single_host", return_value=[])
+    def test_main(self, mock_update_single_host: mock.Mock, _: io.StringIO) -> None:
         argv = ["do-something", "arg"]
         return_code = run_everywhere.main(argv)
 
@@ -125,15 +391,50 @@ class RunEverywhereTest(unittest.TestCase):
         self.assertEqual(mock_update_single_host.call_count, 3)
 
         default_users = ["johntobin", "root", "arianetobin"]
+        options = {
+            "capture_output": False,
+            "parallel_users": False,
+            "pool": None,
+            "retries": 2,
+            "log_dir": None,
+            "host_config": run_everywhere.DEFAULT_HOST_CONFIG,
+        }
         expected_calls = [
-            mock.call("laptop", default_users, ["do-something", "arg"]),
-            mock.call("imac", default_users, ["do-something", "arg"]),
-            mock.call("hosting", default_users, ["do-something", "arg"]),
+            mock.call("laptop", default_users, ["do-something", "arg"], **options),
+            mock.call("imac", default_users, ["do-something", "arg"], **options),
+            mock.call("hosting", default_users, ["do-something", "arg"], **options),
         ]
         mock_update_single_host.assert_has_calls(expected_calls, any_order=True)
 
-    @mock.patch.object(run_everywhere, "update_single_host")
-    def test_main_minus_minus(self, mock_update_single_host: mock.Mock) -> None:
+    @mock.patch.object(sys, "stdout", new_callable=io.StringIO)
+    @mock.patch.object(run_everywhere, "update_single_host", return_value=[])
+    def test_main_users_without_inventory(
+        self, mock_update_single_host: mock.Mock, _: io.StringIO
+    ) -> None:
+        """
+        Tests that --users is used as given for hosts not in the inventory.
+        """
+        return_code = run_everywhere.main(
+            ["--hosts", "localhost", "--users", "alice", "--", "echo", "hi"]
+        )
+        self.assertEqual(return_code, 0)
+        mock_update_single_host.assert_called_once_with(
+            "localhost",
+            ["alice"],
+            ["echo", "hi"],
+            capture_output=False,
+            parallel_users=False,
+            pool=None,
+            retries=2,
+            log_dir=None,
+            host_config=run_everywhere.DEFAULT_HOST_CONFIG,
+        )
+
+    @mock.patch.object(sys, "stdout", new_callable=io.StringIO)
+    @mock.patch.object(run_everywhere, "update_single_host", return_value=[])
+    def test_main_minus_minus(
+        self, mock_update_single_host: mock.Mock, _: io.StringIO
+    ) -> None:
         # -- should be ignored.
         argv = ["--", "do-something", "arg"]
         return_code = run_everywhere.main(argv)
@@ -142,13 +443,347 @@ class RunEverywhereTest(unittest.TestCase):
         self.assertEqual(mock_update_single_host.call_count, 3)
 
         default_users = ["johntobin", "root", "arianetobin"]
+        options = {
+            "capture_output": False,
+            "parallel_users": False,
+            "pool": None,
+            "retries": 2,
+            "log_dir": None,
+            "host_config": run_everywhere.DEFAULT_HOST_CONFIG,
+        }
         expected_calls = [
-            mock.call("laptop", default_users, ["do-something", "arg"]),
-            mock.call("imac", default_users, ["do-something", "arg"]),
-            mock.call("hosting", default_users, ["do-something", "arg"]),
+            mock.call("laptop", default_users, ["do-something", "arg"], **options),
+            mock.call("imac", default_users, ["do-something", "arg"], **options),
+            mock.call("hosting", default_users, ["do-something", "arg"], **options),
         ]
         mock_update_single_host.assert_has_calls(expected_calls, any_order=True)
 
+    @mock.patch.object(sys, "stdout", new_callable=io.StringIO)
+    @mock.patch.object(run_everywhere, "update_single_host")
+    def test_main_parallel(
+        self, mock_update_single_host: mock.Mock, mock_stdout: io.StringIO
+    ) -> None:
+
+        def update_single_host(
+            host: str, *_args: object, **_kwargs: object
+        ) -> list[run_everywhere.Result]:
+            return [
+                run_everywhere.Result("root", host, 0, 1.25),
+                run_everywhere.Result("johntobin", host, 2, 10.0),
+            ]
+
+        mock_update_single_host.side_effect = update_single_host
+        argv = ["--hosts", "a,bb", "--users", "root,johntobin", "--parallel", "2"]
+        return_code = run_everywhere.main(argv + ["do-something"])
+
+        # Any command failing is a failure.
+        self.assertEqual(return_code, 1)
+        options = {
+            "capture_output": True,
+            "parallel_users": False,
+            "pool": None,
+            "retries": 2,
+            "log_dir": None,
+            "host_config": run_everywhere.DEFAULT_HOST_CONFIG,
+        }
+        mock_update_single_host.assert_has_calls(
+            [
+                # Users run in the order of --users.
+                mock.call("a", ["root", "johntobin"], ["do-something"], **options),
+                mock.call("bb", ["root", "johntobin"], ["do-something"], **options),
+            ],
+            any_order=True,
+        )
+        # Results are printed in the order of --hosts, whichever finished first.
+        self.assertEqual(
+            mock_stdout.getvalue(),
+            "USER@HOST     EXIT  RETRIES  DURATION\n"
+            + "root@a           0        -      1.2s\n"
+            + "johntobin@a      2        -     10.0s\n"
+            + "root@bb          0        -      1.2s\n"
+            + "johntobin@bb     2        -     10.0s\n"
+            + "2 of 4 failed.\n",
+        )
+
+    def test_parse_args_parallel(self) -> None:
+        config = run_everywhere.parse_args(
+            ["--parallel", "4", "--parallel-users", "do-something"]
+        )
+        self.assertEqual(config.parallel, 4)
+        self.assertTrue(config.parallel_users)
+        with (
+            mock.patch.object(sys, "stderr", new_callable=io.StringIO),
+            self.assertRaisesRegex(run_everywhere.UsageError, "at least 1"),
+        ):
+            run_everywhere.parse_args(["--parallel", "0", "do-something"])
+        with (
+            mock.patch.object(sys, "stderr", new_callable=io.StringIO),
+            self.assertRaisesRegex(run_everywhere.UsageError, "not be negative"),
+        ):
+            run_everywhere.parse_args(["--retries", "-1", "do-something"])
+
+    @mock.patch.object(sys, "stderr", new_callable=io.StringIO)
+    @mock.patch.object(sys, "stdout", new_callable=io.StringIO)
+    @mock.patch.object(
+        run_everywhere, "update_single_host", side_effect=OSError("log failed")
+    )
+    def test_main_multiplex(
+        self,
+        mock_update_single_host: mock.Mock,
+        mock_stdout: io.StringIO,
+        mock_stderr: io.StringIO,
+    ) -> None:
+        pool = typing.cast(
+            run_everywhere.ConnectionPool,
+            mock.create_autospec(run_everywhere.ConnectionPool, instance=True),
+        )
+        with mock.patch.object(run_everywhere, "ConnectionPool", return_value=pool):
+            return_code = run_everywhere.main(
+                ["--hosts", "a", "--multiplex", "do-something"]
+            )
+        self.assertEqual(return_code, 1)
+        # A host that fails is reported as failed rather than losing the summary.
+        self.assertEqual(mock_stderr.getvalue(), "Error: a: log failed\n")
+        self.assertEqual(
+            mock_stdout.getvalue(),
+            "USER@HOST      EXIT  RETRIES  DURATION\n"
+            + "johntobin@a     127        -      0.0s\n"
+            + "root@a          127        -      0.0s\n"
+            + "arianetobin@a   127        -      0.0s\n"
+            + "3 of 3 failed.\n",
+        )
+        mock_update_single_host.assert_called_once_with(
+            "a",
+            ["johntobin", "root", "arianetobin"],
+            ["do-something"],
+            capture_output=False,
+            parallel_users=False,
+            pool=pool,
+            retries=2,
+            log_dir=None,
+            host_config=run_everywhere.DEFAULT_HOST_CONFIG,
+        )
+        # Connections are closed even if running the command fails.
+        typing.cast(mock.Mock, pool.close).assert_called_once_with()
+
+    def test_parse_inventory(self) -> None:
+        inventory = run_everywhere.parse_inventory(
+            {
+                "defaults": {
+                    "users": ["johntobin", "root"],
+                    "ssh_targets": {"johntobin": "{user}@{host}.example.com"},
+                },
+                "groups": {"servers": ["hosting", "backup"], "macs": ["laptop"]},
+                "hosts": {
+                    "laptop": {"users": ["johntobin"], "concurrency": 2},
+                    "hosting": {
+                        "ssh_targets": {"root": "admin@hosting"},
+                        "sudo": {"root": ["doas"]},
+                    },
+                },
+            }
+        )
+        self.assertEqual(
+            inventory.defaults,
+            run_everywhere.HostConfig(
+                users=["johntobin", "root"],
+                ssh_targets={
+                    "root": "johntobin@{host}",
+                    "johntobin": "{user}@{host}.example.com",
+                },
+                sudo_commands={"root": ["sudo", "--login"]},
+            ),
+        )
+        laptop = inventory.host_config("laptop")
+        self.assertEqual(laptop.users, ["johntobin"])
+        self.assertEqual(laptop.concurrency, 2)
+        hosting = inventory.host_config("hosting")
+        self.assertEqual(hosting.users, ["johntobin", "root"])
+        self.assertEqual(hosting.ssh_target("hosting", "root"), "admin@hosting")
+        self.assertEqual(
+            hosting.ssh_target("hosting", "johntobin"),
+            "johntobin@hosting.example.com",
+        )
+        self.assertEqual(
+            run_everywhere.build_command(
+                "hosting", "root", ["true"], host_config=hosting
+            )[-3:],
+            ["admin@hosting", "doas", "true"],
+        )
+        # Hosts that are only in groups use the defaults.
+        self.assertIs(inventory.host_config("backup"), inventory.defaults)
+        self.assertEqual(inventory.select(["@all"]), ["laptop", "hosting", "backup"])
+        self.assertEqual(
+            inventory.select(["@servers", "other", "hosting", "@macs"]),
+            ["hosting", "backup", "other", "laptop"],
+        )
+        with self.assertRaisesRegex(run_everywhere.UsageError, "@missing"):
+            inventory.select(["@missing"])
+
+        # A group named all replaces the implicit group of all hosts.
+        inventory = run_everywhere.parse_inventory({"groups": {"all": ["a"]}})
+        self.assertEqual(inventory.select(["@all"]), ["a"])
+
+    def test_parse_inventory_errors(self) -> None:
+        tests: list[tuple[object, str]] = [
+            ({"host": {}}, r"unknown sections: \['host'\]"),
+            ({"hosts": []}, "hosts must be a table"),
+            (
+                {"hosts": {"a": {"user": []}}},
+                r"unknown settings in hosts.a: \['user'\]",
+            ),
+            ({"hosts": {"a": {"users": "root"}}}, "hosts.a.users must be a list"),
+            ({"groups": {"g": ["a", 1]}}, "groups.g must be a list of strings"),
+            ({"defaults": {"ssh_targets": {"root": 1}}}, "ssh_targets.root must be"),
+            ({"defaults": {"sudo": {"root": "sudo"}}}, "defaults.sudo.root must be"),
+            ({"defaults": {"concurrency": 0}}, "concurrency must be at least 1"),
+            ({"defaults": {"concurrency": True}}, "concurrency must be at least 1"),
+        ]
+        for data, message in tests:
+            with (
+                self.subTest(data=data),
+                self.assertRaisesRegex(run_everywhere.UsageError, message),
+            ):
+                run_everywhere.parse_inventory(
+                    typing.cast(run_everywhere.InventoryFile, data)
+                )
+
+    def test_load_inventory(self) -> None:
+        inventory = run_everywhere.load_inventory(None)
+        self.assertEqual(inventory.select(["@all"]), ["laptop", "imac", "hosting"])
+        self.assertIs(
+            inventory.host_config("laptop"), run_everywhere.DEFAULT_HOST_CONFIG
+        )
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "inventory.toml")
+            with self.assertRaisesRegex(run_everywhere.UsageError, "Failed to read"):
+                run_everywhere.load_inventory(path)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("[groups\n")
+            with self.assertRaisesRegex(run_everywhere.UsageError, "Failed to read"):
+                run_everywhere.load_inventory(path)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write('[hosts.a]\nusers = ["root"]\n')
+            with mock.patch.object(run_everywhere, "DEFAULT_INVENTORY", path):
+                inventory = run_everywhere.load_inventory(None)
+        self.assertEqual(inventory.select(["@all"]), ["a"])
+        self.assertEqual(inventory.host_config("a").users, ["root"])
+
+    @mock.patch.object(sys, "stdout", new_callable=io.StringIO)
+    @mock.patch.object(run_everywhere, "update_single_host", return_value=[])
+    def test_main_inventory(
+        self, mock_update_single_host: mock.Mock, _: io.StringIO
+    ) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "inventory.toml")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(
+                    "[groups]\n"
+                    + 'servers = ["hosting", "backup"]\n'
+                    + "[hosts.hosting]\n"
+                    + 'users = ["root", "johntobin"]\n'
+                    + "concurrency = 2\n"
+                    + "[hosts.backup]\n"
+                    + 'users = ["backup"]\n'
+                )
+            argv = ["--inventory", path, "--hosts", "@servers,other"]
+            argv += ["--users", "johntobin,alice"]
+            with self.assertLogs(run_everywhere.logger, "WARNING") as logs:
+                return_code = run_everywhere.main(argv + ["do-something"])
+
+        self.assertEqual(return_code, 0)
+        # backup has none of the users, so it is skipped.
+        self.assertEqual(
+            logs.output,
+            ["WARNING:run_everywhere:Skipping backup: none of the users are on it"],
+        )
+        self.assertEqual(
+            mock_update_single_host.call_args_list,
+            [
+                mock.call(
+                    "hosting",
+                    ["johntobin"],
+                    ["do-something"],
+                    # Running users concurrently on a host captures output.
+                    capture_output=True,
+                    parallel_users=False,
+                    pool=None,
+                    retries=2,
+                    log_dir=None,
+                    host_config=mock.ANY,
+                ),
+                # The inventory doesn't list the users on other hosts.
+                mock.call(
+                    "other",
+                    ["johntobin", "alice"],
+                    ["do-something"],
+                    capture_output=True,
+                    parallel_users=False,
+                    pool=None,
+                    retries=2,
+                    log_dir=None,
+                    host_config=mock.ANY,
+                ),
+            ],
+        )
+
+    @mock.patch.object(sys, "stderr", new_callable=io.StringIO)
+    @mock.patch.object(run_everywhere, "update_single_host")
+    def test_main_no_host_has_users(
+        self, mock_update_single_host: mock.Mock, mock_stderr: io.StringIO
+    ) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "inventory.toml")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write('[defaults]\nusers = ["root"]\n[hosts.a]\n[hosts.b]\n')
+            argv = ["--inventory", path, "--users", "nobody", "do-something"]
+            with self.assertLogs(run_everywhere.logger, "WARNING"):
+                return_code = run_everywhere.main(argv)
+        self.assertEqual(return_code, 1)
+        self.assertEqual(
+            mock_stderr.getvalue(),
+            "Error: None of the hosts have any of the users.\n",
+        )
+        mock_update_single_host.assert_not_called()
+
+    @mock.patch.object(sys, "stderr", new_callable=io.StringIO)
+    def test_main_unknown_group(self, mock_stderr: io.StringIO) -> None:
+        return_code = run_everywhere.main(["--hosts", "@missing", "do-something"])
+        self.assertEqual(return_code, 1)
+        self.assertEqual(
+            mock_stderr.getvalue(), "Error: Unknown group of hosts: @missing\n"
+        )
+
+    @mock.patch.object(run_everywhere.subprocess, "run")
+    def test_update_single_host_concurrency(
+        self, mock_subprocess_run: mock.Mock
+    ) -> None:
+        """
+        Tests that a host's concurrency limits how many users run at once.
+        """
+        running = 0
+        most_running = 0
+        lock = threading.Lock()
+
+        def run(*_args: object, **_kwargs: object) -> mock.Mock:
+            nonlocal running, most_running
+            with lock:
+                running += 1
+                most_running = max(most_running, running)
+            time.sleep(0.05)
+            with lock:
+                running -= 1
+            return mock.Mock(returncode=0)
+
+        mock_subprocess_run.side_effect = run
+        host_config = run_everywhere.HostConfig(users=[], concurrency=2)
+        results = run_everywhere.update_single_host(
+            "host", ["a", "b", "c", "d"], ["true"], host_config=host_config
+        )
+        self.assertEqual([result.user for result in results], ["a", "b", "c", "d"])
+        self.assertEqual(most_running, 2)
+
     def test_main_no_args(self) -> None:
         return_code = run_everywhere.main([])
         self.assertEqual(return_code, 1)
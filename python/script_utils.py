@@ -0,0 +1,320 @@
+"""Provides utilities shared by the scripts in this directory.
+
+populate_pre_commit.py and make_github_workflows.py write their extra arguments
+into the shebang of the files they generate and list the files in a repository;
+they and clean_venvs.py replace files atomically and parse --jobs, and
+clean_venvs.py parses --keep.
+
+populate_pre_commit.py runs from the shebang of every .pre-commit-config.yaml, so
+this module must be quick to import: subprocess, tempfile and pathspec are
+imported in the functions that use them.
+"""
+
+from collections import abc
+import os
+import pathlib
+
+
+def positive_int(text: str) -> int:
+    """Parses a positive integer, e.g. for --jobs.
+
+    Args:
+        text: The integer.
+
+    Returns:
+        The integer.
+
+    Raises:
+        ValueError: If text is not an integer greater than zero.
+    """
+    value = int(text)
+    if value < 1:
+        raise ValueError(f"{value} is not positive")
+    return value
+
+
+def non_negative_int(text: str) -> int:
+    """Parses a non-negative integer, e.g. for a number of things to keep.
+
+    Args:
+        text: The integer.
+
+    Returns:
+        The integer.
+
+    Raises:
+        ValueError: If text is not an integer greater than or equal to zero.
+    """
+    value = int(text)
+    if value < 0:
+        raise ValueError(f"{value} is negative")
+    return value
+
+
+def escape_for_env_s(text: str) -> str:
+    r"""Escapes a string for use within an env -S shebang.
+
+    Replace spaces with \_ for env -S compatibility in shebangs.
+    env -S will treat \_ as a space when inside quotes.
+    We also need to escape double quotes and backslashes.
+
+    Args:
+        text: The string to escape.
+
+    Returns:
+        The escaped string.
+    """
+    return text.replace("\\", "\\\\").replace(" ", r"\_").replace('"', r"\"")
+
+
+def build_shebang_args(extra_args: abc.Mapping[str, str] | None) -> str:
+    """Builds the argument string for the shebang.
+
+    Args:
+        extra_args: The dictionary of extra arguments.
+
+    Returns:
+        The string of extra arguments formatted for the shebang.
+    """
+    if not extra_args:
+        return ""
+
+    args_str = ""
+    for cmd, args in sorted(extra_args.items()):
+        escaped_cmd = escape_for_env_s(cmd)
+        escaped_args = escape_for_env_s(args)
+        args_str += f'\\_--extra-arg\\_"{escaped_cmd}={escaped_args}"'
+    return args_str
+
+
+def parse_extra_args(items: list[str], key: str = "command") -> dict[str, str]:
+    """Parses --extra-arg values into a mapping from key to arguments.
+
+    Args:
+        items: Values in the format 'key=args'.
+        key: What the part before '=' names, e.g. 'hook_id'; used in errors.
+
+    Returns:
+        A dictionary mapping keys to extra argument strings.
+
+    Raises:
+        ValueError: If an item is not in the format 'key=args'.
+    """
+    key_to_extra_args: dict[str, str] = {}
+    for item in items:
+        if "=" not in item:
+            raise ValueError(
+                f"Invalid --extra-arg format: '{item}'. Expected '{key}=args'."
+            )
+        name, extra = item.split("=", 1)
+        key_to_extra_args[name.strip()] = extra.strip()
+    return key_to_extra_args
+
+
+def split_env_s(text: str) -> list[str]:
+    r"""Splits an env -S argument string into words.
+
+    This reverses escape_for_env_s and build_shebang_args: \_ is a space inside
+    quotes and a word separator outside quotes, and backslash escapes the next
+    character.
+
+    Args:
+        text: The text following 'env -S ' in a shebang.
+
+    Returns:
+        The words in the text.
+    """
+    words: list[str] = []
+    word: list[str] = []
+    in_word = False
+    in_quotes = False
+    chars = iter(text)
+    for c in chars:
+        escaped = c == "\\"
+        if escaped:
+            c = next(chars, "")
+            c = " " if c == "_" else c
+        if c == '"' and not escaped:
+            in_quotes = not in_quotes
+        elif c.isspace() and not in_quotes:
+            if in_word:
+                words.append("".join(word))
+            word, in_word = [], False
+            continue
+        else:
+            word.append(c)
+        in_word = True
+    if in_word:
+        words.append("".join(word))
+    return words
+
+
+def read_shebang_extra_args(path: pathlib.Path, key: str = "command") -> dict[str, str]:
+    """Reads the extra arguments from the shebang of a generated file.
+
+    Args:
+        path: The path to the generated file, e.g. .pre-commit-config.yaml.
+        key: What the part before '=' names, e.g. 'hook_id'; used in errors.
+
+    Returns:
+        A dictionary mapping keys to extra argument strings, empty if the file
+        does not exist or does not have a shebang with env -S.
+
+    Raises:
+        ValueError: If the shebang contains a malformed --extra-arg.
+    """
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            first_line = f.readline().rstrip("\n")
+    except FileNotFoundError:
+        return {}
+    if not first_line.startswith("#!"):
+        return {}
+    _, separator, env_args = first_line.partition(" -S ")
+    if not separator:
+        return {}
+    words = split_env_s(env_args)
+    return parse_extra_args(
+        [value for flag, value in zip(words, words[1:]) if flag == "--extra-arg"],
+        key,
+    )
+
+
+def get_git_files(root: pathlib.Path, *, cached: bool = True) -> list[str]:
+    """Returns all non-ignored files according to git.
+
+    Asks git for tracked files plus untracked files that are not ignored, so
+    that nested .gitignore files and every other exclude source are honoured
+    exactly as git honours them.
+
+    Args:
+        root: The root of the repository.
+        cached: Whether to include tracked files; if False only untracked files
+            that are not ignored are returned.
+
+    Returns:
+        File paths relative to root.
+
+    Raises:
+        subprocess.CalledProcessError: If root is not in a git repository.
+        FileNotFoundError: If the git command is not found.
+    """
+    import subprocess
+
+    ret = subprocess.run(
+        [
+            "git",
+            "ls-files",
+            "-z",
+            *(["--cached"] if cached else []),
+            "--others",
+            "--exclude-standard",
+        ],
+        capture_output=True,
+        check=True,
+        cwd=root,
+    )
+    stdout: bytes = ret.stdout
+    return [os.fsdecode(path) for path in stdout.split(b"\0") if path]
+
+
+def walk_non_ignored_files(root: pathlib.Path) -> list[str]:
+    """Returns all non-ignored files by walking the filesystem.
+
+    Reads from local and global .gitignore files and prunes ignored
+    directories efficiently. Nested .gitignore files are not supported, so this
+    is only used when git cannot list the files.
+
+    Args:
+        root: The root of the repository.
+
+    Returns:
+        File paths relative to root.
+    """
+    import pathspec
+    import subprocess
+
+    patterns: list[str] = []
+
+    # Local ignores
+    gitignore = root / ".gitignore"
+    if gitignore.exists():
+        with gitignore.open("r", encoding="utf-8") as f:
+            patterns.extend(f.readlines())
+    exclude = root / ".git/info/exclude"
+    if exclude.exists():
+        with exclude.open("r", encoding="utf-8") as f:
+            patterns.extend(f.readlines())
+
+    # Global ignores
+    try:
+        ret = subprocess.run(
+            ["git", "config", "--get", "core.excludesfile"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=root,
+        )
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        global_ignore_path = pathlib.Path("~/.config/git/ignore").expanduser()
+    else:
+        assert ret.stdout is not None
+        global_ignore_path = pathlib.Path(ret.stdout.strip()).expanduser()
+
+    if global_ignore_path.exists():
+        with global_ignore_path.open("r", encoding="utf-8") as f:
+            patterns.extend(f.readlines())
+
+    spec = pathspec.PathSpec.from_lines("gitignore", patterns)
+    all_files: list[str] = []
+
+    for dirpath, dirs, files in root.walk():
+        rel_root = dirpath.relative_to(root)
+        # Prune ignored directories in-place
+        dirs_to_keep: list[str] = []
+        for d in dirs:
+            if d == ".git":
+                continue
+            rel_dir = (rel_root / d).as_posix()
+            # Check directory against pathspec (trailing slash required for some
+            # director patterns)
+            if not spec.match_file(rel_dir) and not spec.match_file(rel_dir + "/"):
+                dirs_to_keep.append(d)
+        dirs[:] = dirs_to_keep
+
+        # Add non-ignored files
+        for filename in files:
+            rel_file = (rel_root / filename).as_posix()
+            if not spec.match_file(rel_file):
+                all_files.append(rel_file)
+
+    return all_files
+
+
+def write_atomically(path: pathlib.Path, content: str, mode: int) -> None:
+    """Writes a file so that readers see either the old or the new contents.
+
+    The contents are written to a temporary file in the same directory, which
+    then replaces the original. Symlinks are followed so the file they point to
+    is replaced rather than the symlink.
+
+    Args:
+        path: The file to write.
+        content: The new contents of the file.
+        mode: The permissions for the file.
+    """
+    import tempfile
+
+    target = path.resolve()
+    fd, temp_name = tempfile.mkstemp(
+        dir=target.parent, prefix=f".{target.name}.", suffix=".tmp"
+    )
+    temp_path = pathlib.Path(temp_name)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+        temp_path.chmod(mode)
+        os.replace(temp_path, target)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
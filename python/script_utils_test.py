@@ -0,0 +1,300 @@
+"""Tests for script_utils.py."""
+
+import os
+import pathlib
+import subprocess
+from typing import cast, override
+import unittest
+from unittest import mock
+
+from pyfakefs import fake_filesystem_unittest
+
+import script_utils
+
+
+class TestPositiveInt(unittest.TestCase):
+    """Tests for the positive_int function."""
+
+    def test_positive_int(self) -> None:
+        self.assertEqual(script_utils.positive_int("1"), 1)
+        self.assertEqual(script_utils.positive_int(" 8 "), 8)
+        for text in ["0", "-2", "two"]:
+            with self.subTest(text=text), self.assertRaises(ValueError):
+                _ = script_utils.positive_int(text)
+
+
+class TestNonNegativeInt(unittest.TestCase):
+    """Tests for the non_negative_int function."""
+
+    def test_non_negative_int(self) -> None:
+        self.assertEqual(script_utils.non_negative_int("0"), 0)
+        self.assertEqual(script_utils.non_negative_int(" 3 "), 3)
+        for text in ["-1", "zero"]:
+            with self.subTest(text=text), self.assertRaises(ValueError):
+                _ = script_utils.non_negative_int(text)
+
+
+class TestShebangArgs(fake_filesystem_unittest.TestCase):
+    """Tests for writing extra arguments into shebangs and reading them back."""
+
+    @override
+    def setUp(self) -> None:
+        self.setUpPyfakefs()
+
+    def test_escape_for_env_s(self) -> None:
+        self.assertEqual(script_utils.escape_for_env_s("\\"), "\\\\")
+        self.assertEqual(script_utils.escape_for_env_s('"'), '\\"')
+        self.assertEqual(script_utils.escape_for_env_s(" "), r"\_")
+
+    def test_build_shebang_args(self) -> None:
+        """Tests that arguments are sorted by key."""
+        self.assertEqual(
+            script_utils.build_shebang_args({"b": "2", "a": "1"}),
+            '\\_--extra-arg\\_"a=1"\\_--extra-arg\\_"b=2"',
+        )
+        self.assertEqual(script_utils.build_shebang_args({}), "")
+        self.assertEqual(script_utils.build_shebang_args(None), "")
+
+    def test_parse_extra_args(self) -> None:
+        self.assertEqual(
+            script_utils.parse_extra_args(["a b=c d", " e = f "]),
+            {"a b": "c d", "e": "f"},
+        )
+        with self.assertRaisesRegex(ValueError, "Expected 'command=args'"):
+            _ = script_utils.parse_extra_args(["invalid"])
+        with self.assertRaisesRegex(ValueError, "Expected 'hook_id=args'"):
+            _ = script_utils.parse_extra_args(["invalid"], "hook_id")
+
+    def test_split_env_s(self) -> None:
+        """Tests that split_env_s reverses build_shebang_args."""
+        extra_args = {"hook 1": 'val "1"', "hook2": "a\\b"}
+        words = script_utils.split_env_s(
+            '"script name"' + script_utils.build_shebang_args(extra_args)
+        )
+        self.assertEqual(
+            words,
+            [
+                "script name",
+                "--extra-arg",
+                'hook 1=val "1"',
+                "--extra-arg",
+                "hook2=a\\b",
+            ],
+        )
+
+    def test_split_env_s_whitespace(self) -> None:
+        self.assertEqual(
+            script_utils.split_env_s('  a  "b c"\t"" \\_\\_d'),
+            ["a", "b c", "", "d"],
+        )
+        self.assertEqual(script_utils.split_env_s("a\\_"), ["a"])
+
+    def test_read_shebang_extra_args(self) -> None:
+        path = pathlib.Path("/repo/.pre-commit-config.yaml")
+        self.assertEqual(script_utils.read_shebang_extra_args(path), {})
+        extra_args = {"mypy": "--strict", "black": "--line-length 100"}
+        for first_line, expected in [
+            ("repos:", {}),
+            ("#!/usr/bin/env populate_pre_commit", {}),
+            ('#!/usr/bin/env -S "populate_pre_commit"', {}),
+            (
+                '#!/usr/bin/env -S "populate_pre_commit"'
+                + script_utils.build_shebang_args(extra_args),
+                extra_args,
+            ),
+        ]:
+            with self.subTest(first_line=first_line):
+                self.fs.create_file(  # pyright: ignore[reportUnknownMemberType]
+                    path, contents=first_line + "\nrepos:\n"
+                )
+                self.assertEqual(script_utils.read_shebang_extra_args(path), expected)
+                path.unlink()
+
+    def test_read_shebang_extra_args_malformed(self) -> None:
+        path = pathlib.Path("/repo/.pre-commit-config.yaml")
+        self.fs.create_file(  # pyright: ignore[reportUnknownMemberType]
+            path, contents='#!/usr/bin/env -S "populate_pre_commit"\\_--extra-arg\\_x\n'
+        )
+        with self.assertRaisesRegex(ValueError, "Expected 'hook_id=args'"):
+            _ = script_utils.read_shebang_extra_args(path, "hook_id")
+
+
+class TestGetGitFiles(unittest.TestCase):
+    """Tests for the get_git_files function."""
+
+    def test_get_git_files(self) -> None:
+        mock_ret = cast(
+            mock.MagicMock,
+            mock.create_autospec(subprocess.CompletedProcess, instance=True),
+        )
+        mock_ret.stdout = b"main.py\0sub dir/README.md\0untracked.txt\0"
+        with mock.patch.object(subprocess, "run", return_value=mock_ret) as mock_run:
+            files = script_utils.get_git_files(pathlib.Path("/repo"))
+        self.assertEqual(files, ["main.py", "sub dir/README.md", "untracked.txt"])
+        mock_run.assert_called_once_with(
+            ["git", "ls-files", "-z", "--cached", "--others", "--exclude-standard"],
+            capture_output=True,
+            check=True,
+            cwd=pathlib.Path("/repo"),
+        )
+
+    def test_get_git_files_untracked(self) -> None:
+        mock_ret = cast(
+            mock.MagicMock,
+            mock.create_autospec(subprocess.CompletedProcess, instance=True),
+        )
+        mock_ret.stdout = b"untracked.txt\0"
+        with mock.patch.object(subprocess, "run", return_value=mock_ret) as mock_run:
+            files = script_utils.get_git_files(pathlib.Path("/repo"), cached=False)
+        self.assertEqual(files, ["untracked.txt"])
+        mock_run.assert_called_once_with(
+            ["git", "ls-files", "-z", "--others", "--exclude-standard"],
+            capture_output=True,
+            check=True,
+            cwd=pathlib.Path("/repo"),
+        )
+
+    def test_get_git_files_empty_repo(self) -> None:
+        mock_ret = cast(
+            mock.MagicMock,
+            mock.create_autospec(subprocess.CompletedProcess, instance=True),
+        )
+        mock_ret.stdout = b""
+        with mock.patch.object(subprocess, "run", return_value=mock_ret):
+            self.assertEqual(script_utils.get_git_files(pathlib.Path(".")), [])
+
+    def test_get_git_files_failure(self) -> None:
+        with mock.patch.object(
+            subprocess, "run", side_effect=subprocess.CalledProcessError(128, "git")
+        ):
+            with self.assertRaises(subprocess.CalledProcessError):
+                script_utils.get_git_files(pathlib.Path("/repo"))
+
+
+class TestWalkNonIgnoredFiles(fake_filesystem_unittest.TestCase):
+    """Tests for walk_non_ignored_files."""
+
+    @override
+    def setUp(self) -> None:
+        self.setUpPyfakefs()
+
+    def create_file(self, file_path: pathlib.Path | str, contents: str = "") -> None:
+        self.fs.create_file(  # pyright: ignore[reportUnknownMemberType]
+            file_path, contents=contents
+        )
+
+    def test_basic_files(self) -> None:
+        self.create_file("file1.txt")
+        self.create_file("dir1/file2.txt")
+        with mock.patch.object(subprocess, "run") as mock_run:
+            mock_run.side_effect = subprocess.CalledProcessError(1, "git")
+            files = script_utils.walk_non_ignored_files(pathlib.Path("."))
+        self.assertEqual(sorted(files), ["dir1/file2.txt", "file1.txt"])
+
+    def test_local_gitignore(self) -> None:
+        self.create_file(".gitignore", contents="ignored.txt\n")
+        self.create_file("file1.txt")
+        self.create_file("ignored.txt")
+        with mock.patch.object(subprocess, "run") as mock_run:
+            mock_run.side_effect = FileNotFoundError()
+            files = script_utils.walk_non_ignored_files(pathlib.Path("."))
+        self.assertEqual(sorted(files), [".gitignore", "file1.txt"])
+
+    def test_git_info_exclude(self) -> None:
+        self.create_file(".git/info/exclude", contents="*.log\n")
+        self.create_file("test.log")
+        self.create_file("test.txt")
+        with mock.patch.object(subprocess, "run") as mock_run:
+            mock_run.side_effect = FileNotFoundError()
+            files = script_utils.walk_non_ignored_files(pathlib.Path("."))
+        self.assertEqual(sorted(files), ["test.txt"])
+
+    def test_global_ignore(self) -> None:
+        home_ignore = pathlib.Path("~/.gitignore.global").expanduser()
+        self.create_file(home_ignore, contents="venv/\n")
+        self.create_file("venv/bin/python")
+        self.create_file("main.py")
+        mock_ret = cast(
+            mock.MagicMock,
+            mock.create_autospec(subprocess.CompletedProcess, instance=True),
+        )
+        mock_ret.stdout = "~/.gitignore.global\n"
+        with mock.patch.object(subprocess, "run") as mock_run:
+            mock_run.return_value = mock_ret
+            files = script_utils.walk_non_ignored_files(pathlib.Path("."))
+        self.assertIn("main.py", files)
+
+    def test_global_ignore_fallback(self) -> None:
+        home_ignore = pathlib.Path("~/.config/git/ignore").expanduser()
+        self.create_file(home_ignore, contents="build/\n")
+        self.create_file("build/output.o")
+        self.create_file("src/main.c")
+        with mock.patch.object(subprocess, "run") as mock_run:
+            mock_run.side_effect = subprocess.CalledProcessError(1, "git")
+            files = script_utils.walk_non_ignored_files(pathlib.Path("."))
+        self.assertIn("src/main.c", files)
+        self.assertNotIn("build/output.o", files)
+
+    def test_other_root(self) -> None:
+        """Tests walking a repository that is not the current directory."""
+        self.create_file("/repo/.gitignore", contents="*.log\n")
+        self.create_file("/repo/src/main.py")
+        self.create_file("/repo/debug.log")
+        self.create_file("/elsewhere.py")
+        with mock.patch.object(subprocess, "run") as mock_run:
+            mock_run.side_effect = FileNotFoundError()
+            files = script_utils.walk_non_ignored_files(pathlib.Path("/repo"))
+        self.assertEqual(sorted(files), [".gitignore", "src/main.py"])
+
+    def test_pruning_directories(self) -> None:
+        self.create_file(".gitignore", contents="node_modules/\n")
+        self.create_file("node_modules/pkg/index.js")
+        self.create_file("src/index.js")
+        with mock.patch.object(subprocess, "run") as mock_run:
+            mock_run.side_effect = FileNotFoundError()
+            files = script_utils.walk_non_ignored_files(pathlib.Path("."))
+        self.assertIn("src/index.js", files)
+        self.assertNotIn("node_modules/pkg/index.js", files)
+
+
+class TestWriteAtomically(fake_filesystem_unittest.TestCase):
+    """Tests for the write_atomically function."""
+
+    @override
+    def setUp(self) -> None:
+        self.setUpPyfakefs()
+
+    def create_file(self, file_path: str, contents: str = "") -> None:
+        self.fs.create_file(  # pyright: ignore[reportUnknownMemberType]
+            file_path, contents=contents
+        )
+
+    def test_write_atomically(self) -> None:
+        self.create_file("/repo/config", contents="old\n")
+        script_utils.write_atomically(pathlib.Path("/repo/config"), "new\n", 0o750)
+        self.assertEqual(pathlib.Path("/repo/config").read_text(), "new\n")
+        self.assertEqual(pathlib.Path("/repo/config").stat().st_mode & 0o777, 0o750)
+        self.assertEqual(os.listdir("/repo"), ["config"])
+
+    def test_write_atomically_follows_symlinks(self) -> None:
+        self.create_file("/shared/config", contents="old\n")
+        pathlib.Path("/repo").mkdir()
+        pathlib.Path("/repo/config").symlink_to("/shared/config")
+        script_utils.write_atomically(pathlib.Path("/repo/config"), "new\n", 0o755)
+        self.assertTrue(pathlib.Path("/repo/config").is_symlink())
+        self.assertEqual(pathlib.Path("/shared/config").read_text(), "new\n")
+        self.assertEqual(os.listdir("/shared"), ["config"])
+
+    def test_write_atomically_failure_removes_temp_file(self) -> None:
+        self.create_file("/repo/config", contents="old\n")
+        with mock.patch.object(os, "replace", side_effect=OSError("disk full")):
+            with self.assertRaisesRegex(OSError, "disk full"):
+                script_utils.write_atomically(
+                    pathlib.Path("/repo/config"), "new\n", 0o755
+                )
+        self.assertEqual(pathlib.Path("/repo/config").read_text(), "old\n")
+        self.assertEqual(os.listdir("/repo"), ["config"])
+
+
+if __name__ == "__main__":
+    unittest.main()